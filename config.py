@@ -52,14 +52,65 @@ class Config:
     Параметры:
         bot_token (str): токен бота Telegram
         bot_username (str): юзернейм бота Telegram
+        bot_api_url (str | None): адрес сервера Bot API (None - api.telegram.org), например локальный tools/fake_bot_api.py
+        update_record_path (str | None): файл записи входящих обновлений, .jsonl.gz (None - запись выключена)
         owner_id (int): Telegram ID владельца бота
         default_captcha_timeout (int): время на капчу в секундах
         welcome_message (str): приветственное сообщение при добавлении бота
         captcha_timeout_options (list[int]): опции таймаута для настроек
+        admin_sync_interval (int): период синхронизации админов чатов в секундах
+        admin_cache_ttl (int): время жизни кэша админов чата в секундах
+        update_max_concurrency (int): максимум одновременно обрабатываемых обновлений
+        update_chat_queue_limit (int): максимум обновлений в очереди одного чата
+        update_priority_queue_limit (int): максимум обновлений в приоритетной очереди (ответы на капчу)
+        db_readers (int): количество соединений SQLite только для чтения
+        db_busy_timeout (int): ожидание блокировки SQLite в миллисекундах
+        db_mmap_size (int): размер memory-mapped области SQLite в байтах
+        db_cache_size (int): размер кэша страниц SQLite (отрицательное значение - в КиБ)
+        db_checkpoint_interval (int): период WAL checkpoint в секундах
+        db_write_batch_size (int): максимум операций записи в одном COMMIT
+        db_write_max_latency (float): сколько секунд писатель ждёт новые операции перед COMMIT
+        db_shards (int): количество файлов-шардов для капч и событий чатов (0 - всё в data.db)
+        user_retention_days (int): через сколько дней без активности неверифицированный пользователь уходит в архив
+        user_retention_interval (int): период архивации пользователей в секундах
+        user_retention_chunk (int): пользователей в одной пачке архивации
+        user_last_seen_flush_interval (int): период записи user_last_seen_at в секундах
+        event_retention_days (int): сколько дней хранятся журнал событий и почасовая свёртка (подневная
+            свёртка по пользователям - не меньше trust_history_days и blocklist_window_days)
+        event_retention_interval (int): период удаления старых событий в секундах
+        event_retention_chunk (int): событий в одной пачке удаления
+        db_maintenance_hour (int): час (локальное время), с которого начинается окно обслуживания БД
+        db_maintenance_window (int): длительность окна обслуживания БД в секундах
+        db_maintenance_busy_queue (int): длина очереди записи, при которой обслуживание ждёт затишья
+        db_maintenance_vacuum_pages (int): страниц, освобождаемых одним шагом incremental_vacuum
+        db_maintenance_vacuum_max_size (int): максимальный размер файла в байтах для разового VACUUM
+        leader_lease_ttl (int): через сколько секунд без продления аренду лидера может забрать другой процесс
+        leader_heartbeat_interval (int): период продления аренды лидера в секундах
+        cleanup_interval (int): период поиска истёкших капч в секундах
+        task_backoff_max (int): максимальная пауза перед перезапуском упавшей фоновой задачи в секундах
+        task_shutdown_timeout (int): сколько секунд при остановке ждать завершения текущих запусков фоновых задач
+        loop_watchdog_interval (float): период замера задержки event loop в секундах
+        loop_stall_threshold (float): через сколько секунд без ответа loop в лог пишется стек блокирующего кода
+        loop_degraded_lag (float): задержка loop в секундах, выше которой бот считается перегруженным
+        loop_degraded_enter_after (int): сколько секунд задержка должна держаться, чтобы включить режим деградации
+        loop_degraded_exit_after (int): сколько секунд задержка должна быть в норме, чтобы выключить режим деградации
+        slow_update_threshold (float): обработка обновления дольше этого числа секунд пишется в лог
+        trust_score_interval (int): период пересчёта оценок доверия пользователей в секундах
+        trust_score_chunk (int): пользователей в одной пачке пересчёта оценок доверия
+        trust_history_days (int): за сколько дней история капч учитывается в оценке доверия
+        trust_score_options (list[int]): опции порогов доверия для настроек чата (0 - выключено)
+        blocklist_refresh_interval (int): период пересборки (лидером) и перезагрузки блок-листа в секундах
+        blocklist_window_days (int): за сколько дней непройденные капчи учитываются в блок-листе
+        blocklist_half_life_days (float): через сколько дней вес непройденной капчи уменьшается вдвое
+        blocklist_threshold (float): оценка непройденных капч (с затуханием), с которой пользователь попадает в блок-лист
+        blocklist_min_chats (int): в скольких разных чатах пользователь должен не пройти капчу для блок-листа
+        blocklist_restrict_seconds (int): на сколько секунд ограничивается пользователь из блок-листа (после - обычная капча)
     """
     bot_token: str
     bot_username: str
     owner_id: int
+    bot_api_url: str | None = None
+    update_record_path: str | None = None
     default_captcha_timeout: int = 10
     welcome_message: str = (
         "Привет! 👋 Я бот защиты от спама.\n"
@@ -81,6 +132,52 @@ class Config:
     captcha_timeout_options: list[int] = field(default_factory=lambda: [10, 30, 60, 120])
     default_max_attempts: int = 2
     max_attempts_options: list[int] = field(default_factory=lambda: [1, 2, 3, 5])
+    admin_sync_interval: int = 3600
+    admin_cache_ttl: int = 7200
+    update_max_concurrency: int = 32
+    update_chat_queue_limit: int = 100
+    update_priority_queue_limit: int = 1000
+    db_readers: int = 4
+    db_busy_timeout: int = 5000
+    db_mmap_size: int = 256 * 1024 * 1024
+    db_cache_size: int = -16000
+    db_checkpoint_interval: int = 300
+    db_write_batch_size: int = 256
+    db_write_max_latency: float = 0.005
+    db_shards: int = 0
+    user_retention_days: int = 30
+    user_retention_interval: int = 21600
+    user_retention_chunk: int = 500
+    user_last_seen_flush_interval: int = 60
+    event_retention_days: int = 30
+    event_retention_interval: int = 21600
+    event_retention_chunk: int = 5000
+    db_maintenance_hour: int = 4
+    db_maintenance_window: int = 3600
+    db_maintenance_busy_queue: int = 16
+    db_maintenance_vacuum_pages: int = 256
+    db_maintenance_vacuum_max_size: int = 64 * 1024 * 1024
+    leader_lease_ttl: int = 30
+    leader_heartbeat_interval: int = 10
+    cleanup_interval: int = 10
+    task_backoff_max: int = 300
+    task_shutdown_timeout: int = 10
+    loop_watchdog_interval: float = 0.1
+    loop_stall_threshold: float = 0.5
+    loop_degraded_lag: float = 0.1
+    loop_degraded_enter_after: int = 10
+    loop_degraded_exit_after: int = 30
+    slow_update_threshold: float = 5.0
+    trust_score_interval: int = 3600
+    trust_score_chunk: int = 5000
+    trust_history_days: int = 30
+    trust_score_options: list[int] = field(default_factory=lambda: [0, 30, 50, 70, 90])
+    blocklist_refresh_interval: int = 300
+    blocklist_window_days: int = 30
+    blocklist_half_life_days: float = 7.0
+    blocklist_threshold: float = 3.0
+    blocklist_min_chats: int = 2
+    blocklist_restrict_seconds: int = 86400
 
 
 # ~~~~ SETTINGS ~~~~
@@ -88,4 +185,6 @@ settings = Config(
     bot_token=_validated_token,
     bot_username=_validated_username,
     owner_id=_validated_owner_id,
+    bot_api_url=os.getenv("BOT_API_URL", "").strip() or None,
+    update_record_path=os.getenv("UPDATE_RECORD_PATH", "").strip() or None,
 )
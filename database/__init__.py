@@ -1,9 +1,9 @@
-from database.user_table import UserModel, get_user, add_user, update_user, get_users_count, get_verified_count, create_db as create_user_db
+from database.user_table import UserModel, get_user, add_user, upsert_user, upsert_users, update_user, get_users_count, get_verified_count, create_db as create_user_db
 from database.chat_table import ChatModel, get_chat, add_chat, update_chat, get_chats_count, create_db as create_chat_db
 from database.captcha_table import CaptchaModel, get_captcha, add_captcha, delete_captcha, get_captchas_count, create_db as create_captcha_db
 
 __all__ = [
-    "UserModel", "get_user", "add_user", "update_user", "get_users_count", "get_verified_count", "create_user_db",
+    "UserModel", "get_user", "add_user", "upsert_user", "upsert_users", "update_user", "get_users_count", "get_verified_count", "create_user_db",
     "ChatModel", "get_chat", "add_chat", "update_chat", "get_chats_count", "create_chat_db",
     "CaptchaModel", "get_captcha", "add_captcha", "delete_captcha", "get_captchas_count", "create_captcha_db",
 ]
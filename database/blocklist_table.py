@@ -0,0 +1,55 @@
+from aiosqlite import Connection, OperationalError
+from database.storage import storage
+from logs.logger import logger
+
+
+# ~~~~ BASE CREATING ~~~~
+async def create_db() -> None:
+    try:
+        await storage.execute("""
+            CREATE TABLE IF NOT EXISTS blocklist_table (
+                user_id INTEGER PRIMARY KEY,
+                blocklist_score REAL,
+                blocklist_chat_count INTEGER,
+                blocklist_updated_at TEXT
+            )
+        """)
+    except OperationalError as e:
+        logger.warning(f"[BlocklistTable] Create warning: {e}")
+
+
+# ~~~~ DATA GETTING ~~~~
+async def get_blocklist_ids() -> list[int]:
+    """ID пользователей блок-листа по возрастанию"""
+    async with storage.read() as db:
+        cursor = await db.execute("SELECT user_id FROM blocklist_table ORDER BY user_id")
+        rows = await cursor.fetchall()
+        return [row[0] for row in rows]
+
+
+# ~~~~ DATA REPLACING ~~~~
+async def replace_blocklist(rows: list[tuple[int, float, int, str]]) -> int:
+    """
+    Заменить блок-лист целиком одной транзакцией. Верифицированные пользователи
+    в него не попадают (капчу они уже прошли, админы верифицируются синхронизацией).
+
+    Параметры:
+        rows (list[tuple]): кортежи (user_id, blocklist_score, blocklist_chat_count, blocklist_updated_at)
+
+    Возвращает:
+        int: размер блок-листа
+    """
+    async def _replace(db: Connection) -> int:
+        await db.execute("DELETE FROM blocklist_table")
+        await db.executemany(
+            "INSERT INTO blocklist_table (user_id, blocklist_score, blocklist_chat_count, blocklist_updated_at) "
+            "VALUES (?, ?, ?, ?)",
+            rows
+        )
+        await db.execute(
+            "DELETE FROM blocklist_table WHERE user_id IN (SELECT user_id FROM user_table WHERE user_status = 1)"
+        )
+        async with db.execute("SELECT COUNT(*) FROM blocklist_table") as cursor:
+            return (await cursor.fetchone())[0]
+
+    return await storage.write(_replace)
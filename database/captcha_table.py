@@ -1,11 +1,16 @@
-from dataclasses import dataclass
-from aiosqlite import connect, OperationalError, IntegrityError
-from config import BASE_PATH
+from dataclasses import dataclass, field, replace
+from enum import Enum
+from aiosqlite import Connection, OperationalError, IntegrityError
+from config import settings
+from database.rows import row_constructor
+from database.storage import Storage, storage
+from database.shards import chat_storage, captcha_storage, shard_id_base, hot_storages
 from logs.logger import logger
+from utils.time_helpers import get_timestamp, is_expired
 
 
 # ~~~~ TABLE MODEL ~~~~
-@dataclass
+@dataclass(slots=True, frozen=True)
 class CaptchaModel:
     """
     Параметры:
@@ -18,6 +23,8 @@ class CaptchaModel:
         captcha_correct_emoji (str): правильный эмодзи для отображения в тексте
         captcha_user_message_id (int): ID сообщения пользователя, вызвавшего капчу
         captcha_attempts (int): количество сделанных попыток
+        captcha_restricted (int): 1 - пользователь ограничен в правах до прохождения капчи
+        captcha_created_at (str | None): timestamp выдачи капчи (NULL у капч до миграции v5)
     """
     captcha_id: int
     captcha_user_id: int
@@ -28,71 +35,132 @@ class CaptchaModel:
     captcha_correct_emoji: str
     captcha_user_message_id: int
     captcha_attempts: int
+    captcha_restricted: int
+    captcha_created_at: str | None
+
+
+CaptchaModel.from_row = staticmethod(row_constructor(CaptchaModel))
+
+
+CAPTCHA_COLUMNS = (
+    "captcha_id, captcha_user_id, captcha_chat_id, captcha_expires_at, captcha_payload, "
+    "captcha_message_id, captcha_correct_emoji, captcha_user_message_id, captcha_attempts, captcha_restricted, "
+    "captcha_created_at"
+)
+
+
+# ~~~~ RESOLUTION MODEL ~~~~
+class CaptchaOutcome(str, Enum):
+    """Результат ответа пользователя на капчу"""
+    NOT_FOUND = "not_found"
+    EXPIRED = "expired"
+    SOLVED = "solved"
+    WRONG = "wrong"
+    MAX_ATTEMPTS = "max_attempts"
+
+
+@dataclass
+class CaptchaResolution:
+    """
+    Параметры:
+        outcome (CaptchaOutcome): результат ответа
+        captcha (CaptchaModel | None): капча на момент ответа (с учётом новой попытки)
+        attempts_remaining (int): сколько попыток осталось (для WRONG)
+        removed (list[CaptchaModel]): капчи пользователя во всех чатах, удалённые при SOLVED
+    """
+    outcome: CaptchaOutcome
+    captcha: CaptchaModel | None
+    attempts_remaining: int = 0
+    removed: list[CaptchaModel] = field(default_factory=list)
 
 
 # ~~~~ BASE CREATING ~~~~
 async def create_db() -> None:
-    async with connect(BASE_PATH) as db:
-        try:
-            await db.execute("""
-                CREATE TABLE captcha_table (
-                    captcha_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    captcha_user_id INTEGER,
-                    captcha_chat_id INTEGER,
-                    captcha_expires_at TEXT,
-                    captcha_payload TEXT,
-                    captcha_message_id INTEGER,
-                    captcha_correct_emoji TEXT,
-                    captcha_user_message_id INTEGER,
-                    captcha_attempts INTEGER DEFAULT 0
-                )
-            """)
-            await db.execute(
-                "CREATE INDEX idx_captcha_user_chat ON captcha_table(captcha_user_id, captcha_chat_id)"
+    for target in hot_storages():
+        await _create_in(target)
+
+
+async def _create_in(target: Storage) -> None:
+    id_base = shard_id_base(target)
+
+    async def _create(db: Connection) -> None:
+        await db.execute("""
+            CREATE TABLE captcha_table (
+                captcha_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                captcha_user_id INTEGER,
+                captcha_chat_id INTEGER,
+                captcha_expires_at TEXT,
+                captcha_payload TEXT,
+                captcha_message_id INTEGER,
+                captcha_correct_emoji TEXT,
+                captcha_user_message_id INTEGER,
+                captcha_attempts INTEGER DEFAULT 0,
+                captcha_restricted INTEGER DEFAULT 0,
+                captcha_created_at TEXT
             )
-            await db.commit()
-        except OperationalError:
-            pass
+        """)
+        await db.execute(
+            "CREATE INDEX idx_captcha_user ON captcha_table(captcha_user_id)"
+        )
+
+    async def _seed_ids(db: Connection) -> None:
+        # ID капч шарда начинаются с его базы, чтобы по ID находить файл
+        await db.execute(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT 'captcha_table', ? "
+            "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'captcha_table')",
+            (id_base,)
+        )
+        await db.execute(
+            "UPDATE sqlite_sequence SET seq = ? WHERE name = 'captcha_table' AND seq < ?",
+            (id_base, id_base)
+        )
+
+    try:
+        await target.write(_create)
+    except OperationalError:
+        pass
+    if id_base:
+        await target.write(_seed_ids)
 
 
 # ~~~~ DATA GETTING ~~~~
 async def get_captcha(captcha_id: int) -> CaptchaModel | None:
     """Получить капчу по ID"""
-    async with connect(BASE_PATH) as db:
+    async with captcha_storage(captcha_id).read() as db:
         cursor = await db.execute(
-            "SELECT captcha_id, captcha_user_id, captcha_chat_id, captcha_expires_at, captcha_payload, "
-            "captcha_message_id, captcha_correct_emoji, captcha_user_message_id, captcha_attempts "
+            f"SELECT {CAPTCHA_COLUMNS} "
             "FROM captcha_table WHERE captcha_id = ?",
             (captcha_id,)
         )
         row = await cursor.fetchone()
-        return CaptchaModel(*row) if row else None
+        return CaptchaModel.from_row(row) if row else None
 
 
 async def get_captchas_for_user(captcha_user_id: int, captcha_chat_id: int) -> list[CaptchaModel]:
     """Получить все активные капчи для пользователя в чате"""
-    async with connect(BASE_PATH) as db:
+    async with chat_storage(captcha_chat_id).read() as db:
         cursor = await db.execute(
-            "SELECT captcha_id, captcha_user_id, captcha_chat_id, captcha_expires_at, captcha_payload, "
-            "captcha_message_id, captcha_correct_emoji, captcha_user_message_id, captcha_attempts "
+            f"SELECT {CAPTCHA_COLUMNS} "
             "FROM captcha_table WHERE captcha_user_id = ? AND captcha_chat_id = ?",
             (captcha_user_id, captcha_chat_id)
         )
         rows = await cursor.fetchall()
-        return [CaptchaModel(*row) for row in rows]
+        return [CaptchaModel.from_row(row) for row in rows]
 
 
 async def get_captcha_by_payload(captcha_payload: str) -> CaptchaModel | None:
-    """Получить капчу по токену payload"""
-    async with connect(BASE_PATH) as db:
-        cursor = await db.execute(
-            "SELECT captcha_id, captcha_user_id, captcha_chat_id, captcha_expires_at, captcha_payload, "
-            "captcha_message_id, captcha_correct_emoji, captcha_user_message_id, captcha_attempts "
-            "FROM captcha_table WHERE captcha_payload = ?",
-            (captcha_payload,)
-        )
-        row = await cursor.fetchone()
-        return CaptchaModel(*row) if row else None
+    """Получить капчу по токену payload (чат неизвестен - ищет во всех хранилищах)"""
+    for target in hot_storages():
+        async with target.read() as db:
+            cursor = await db.execute(
+                f"SELECT {CAPTCHA_COLUMNS} "
+                "FROM captcha_table WHERE captcha_payload = ?",
+                (captcha_payload,)
+            )
+            row = await cursor.fetchone()
+        if row:
+            return CaptchaModel.from_row(row)
+    return None
 
 
 # ~~~~ DATA ADDING ~~~~
@@ -104,158 +172,339 @@ async def add_captcha(
     captcha_message_id: int,
     captcha_correct_emoji: str,
     captcha_user_message_id: int,
-    captcha_attempts: int = 0
+    captcha_attempts: int = 0,
+    captcha_restricted: int = 0,
+    captcha_created_at: str | None = None
 ) -> CaptchaModel:
     """Добавить новую капчу. Возвращает созданную капчу или выбрасывает RuntimeError."""
-    async with connect(BASE_PATH) as db:
-        try:
-            cursor = await db.execute(
-                "INSERT INTO captcha_table (captcha_user_id, captcha_chat_id, captcha_expires_at, "
-                "captcha_payload, captcha_message_id, captcha_correct_emoji, captcha_user_message_id, captcha_attempts) "
-                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                (captcha_user_id, captcha_chat_id, captcha_expires_at, captcha_payload, 
-                 captcha_message_id, captcha_correct_emoji, captcha_user_message_id, captcha_attempts)
-            )
-            await db.commit()
-            captcha_id = cursor.lastrowid
-            
-            result = await get_captcha(captcha_id=captcha_id)
-            if result is None:
-                logger.error(
-                    f"[CaptchaTable] Failed to retrieve captcha after insert: "
-                    f"captcha_id={captcha_id}, user_id={captcha_user_id}, chat_id={captcha_chat_id}"
-                )
-                raise RuntimeError(
-                    f"Database inconsistency: captcha_id={captcha_id} was inserted but not found"
-                )
-            
-            pass
-            return result
-            
-        except IntegrityError as e:
+    if captcha_created_at is None:
+        captcha_created_at = get_timestamp()
+
+    try:
+        cursor = await chat_storage(captcha_chat_id).execute(
+            "INSERT INTO captcha_table (captcha_user_id, captcha_chat_id, captcha_expires_at, "
+            "captcha_payload, captcha_message_id, captcha_correct_emoji, captcha_user_message_id, captcha_attempts, "
+            "captcha_restricted, captcha_created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (captcha_user_id, captcha_chat_id, captcha_expires_at, captcha_payload,
+             captcha_message_id, captcha_correct_emoji, captcha_user_message_id, captcha_attempts,
+             captcha_restricted, captcha_created_at)
+        )
+        captcha_id = cursor.lastrowid
+
+        result = await get_captcha(captcha_id=captcha_id)
+        if result is None:
             logger.error(
-                f"[CaptchaTable] IntegrityError while adding captcha: "
-                f"user_id={captcha_user_id}, chat_id={captcha_chat_id}, error={e}"
+                f"[CaptchaTable] Failed to retrieve captcha after insert: "
+                f"captcha_id={captcha_id}, user_id={captcha_user_id}, chat_id={captcha_chat_id}"
             )
-            raise RuntimeError(f"Failed to add captcha: integrity constraint violated") from e
-        except Exception as e:
-            logger.error(
-                f"[CaptchaTable] Unexpected error while adding captcha: "
-                f"user_id={captcha_user_id}, chat_id={captcha_chat_id}, error={e}"
+            raise RuntimeError(
+                f"Database inconsistency: captcha_id={captcha_id} was inserted but not found"
             )
-            raise RuntimeError(f"Failed to add captcha: {e}") from e
+
+        return result
+
+    except IntegrityError as e:
+        logger.error(
+            f"[CaptchaTable] IntegrityError while adding captcha: "
+            f"user_id={captcha_user_id}, chat_id={captcha_chat_id}, error={e}"
+        )
+        raise RuntimeError(f"Failed to add captcha: integrity constraint violated") from e
+    except Exception as e:
+        logger.error(
+            f"[CaptchaTable] Unexpected error while adding captcha: "
+            f"user_id={captcha_user_id}, chat_id={captcha_chat_id}, error={e}"
+        )
+        raise RuntimeError(f"Failed to add captcha: {e}") from e
 
 
 # ~~~~ DATA DELETING ~~~~
 async def delete_captcha(captcha_id: int) -> bool:
     """Удалить капчу по ID. Возвращает True если запись была удалена."""
-    async with connect(BASE_PATH) as db:
-        cursor = await db.execute(
-            "DELETE FROM captcha_table WHERE captcha_id = ?",
-            (captcha_id,)
-        )
-        await db.commit()
-        deleted = cursor.rowcount > 0
-        return deleted
+    cursor = await captcha_storage(captcha_id).execute(
+        "DELETE FROM captcha_table WHERE captcha_id = ?",
+        (captcha_id,)
+    )
+    return cursor.rowcount > 0
 
 
 async def delete_all_captchas_for_user(captcha_user_id: int, captcha_chat_id: int) -> int:
     """Удалить все капчи пользователя в чате. Возвращает количество удалённых записей."""
-    async with connect(BASE_PATH) as db:
+    cursor = await chat_storage(captcha_chat_id).execute(
+        "DELETE FROM captcha_table WHERE captcha_user_id = ? AND captcha_chat_id = ?",
+        (captcha_user_id, captcha_chat_id)
+    )
+    return cursor.rowcount
+
+
+# ~~~~ CAPTCHA RESOLUTION ~~~~
+async def resolve_captcha(captcha_user_id: int, captcha_chat_id: int, captcha_payload: str) -> CaptchaResolution:
+    """
+    Обработать ответ на капчу в одной транзакции.
+
+    Проверяет срок капчи и ответ, затем:
+    - верный ответ: удаляет капчи пользователя во всех чатах и верифицирует пользователя;
+    - неверный ответ: увеличивает счётчик попыток или удаляет капчу при превышении лимита.
+
+    Истёкшая капча не меняется (её удаляет очередь очистки).
+
+    При шардировании транзакция охватывает только хранилище чата: капчи в других
+    шардах и user_status в основной БД обновляются следом отдельными записями.
+    Писатель другого шарда задействуется, только если у пользователя там есть капчи.
+    """
+    target = chat_storage(captcha_chat_id)
+    max_attempts = await _get_max_attempts(captcha_chat_id)
+
+    async def _resolve(db: Connection) -> CaptchaResolution:
         cursor = await db.execute(
-            "DELETE FROM captcha_table WHERE captcha_user_id = ? AND captcha_chat_id = ?",
+            f"SELECT {CAPTCHA_COLUMNS} "
+            "FROM captcha_table "
+            "WHERE captcha_user_id = ? AND captcha_chat_id = ? "
+            "ORDER BY captcha_id LIMIT 1",
             (captcha_user_id, captcha_chat_id)
         )
-        await db.commit()
-        deleted_count = cursor.rowcount
-        return deleted_count
+        row = await cursor.fetchone()
+
+        if row is None:
+            return CaptchaResolution(outcome=CaptchaOutcome.NOT_FOUND, captcha=None)
+
+        captcha = CaptchaModel.from_row(row)
+
+        if is_expired(captcha.captcha_expires_at):
+            return CaptchaResolution(outcome=CaptchaOutcome.EXPIRED, captcha=captcha)
+
+        if captcha_payload == captcha.captcha_payload:
+            # Верификация глобальная: снимаем капчи пользователя во всех чатах
+            removed = await _delete_user_captchas(db, captcha_user_id)
+            if target is storage:
+                await db.execute(
+                    "UPDATE user_table SET user_status = 1 WHERE user_id = ?",
+                    (captcha_user_id,)
+                )
+            return CaptchaResolution(outcome=CaptchaOutcome.SOLVED, captcha=captcha, removed=removed)
+
+        captcha = replace(captcha, captcha_attempts=captcha.captcha_attempts + 1)
+        attempts_remaining = max_attempts - captcha.captcha_attempts
+
+        if attempts_remaining <= 0:
+            await db.execute("DELETE FROM captcha_table WHERE captcha_id = ?", (captcha.captcha_id,))
+            outcome = CaptchaOutcome.MAX_ATTEMPTS
+        else:
+            await db.execute(
+                "UPDATE captcha_table SET captcha_attempts = ? WHERE captcha_id = ?",
+                (captcha.captcha_attempts, captcha.captcha_id)
+            )
+            outcome = CaptchaOutcome.WRONG
+
+        return CaptchaResolution(outcome=outcome, captcha=captcha, attempts_remaining=max(attempts_remaining, 0))
+
+    # Записи выполняются по очереди в задаче-писателе: двойное нажатие ждёт первое
+    resolution = await target.write(_resolve)
+
+    if resolution.outcome == CaptchaOutcome.SOLVED:
+        for other in hot_storages():
+            # Проверка - чтение из пула: рейд верных ответов в одном чате не занимает писателей остальных шардов
+            if other is not target and await _has_user_captchas(other, captcha_user_id):
+                resolution.removed += await other.write(lambda db: _delete_user_captchas(db, captcha_user_id))
+        if target is not storage:
+            await storage.execute("UPDATE user_table SET user_status = 1 WHERE user_id = ?", (captcha_user_id,))
+
+    return resolution
+
+
+async def _get_max_attempts(chat_id: int) -> int:
+    async with storage.read() as db:
+        cursor = await db.execute("SELECT chat_max_attempts FROM chat_table WHERE chat_id = ?", (chat_id,))
+        row = await cursor.fetchone()
+    return row[0] if row and row[0] is not None else settings.default_max_attempts
+
+
+async def _has_user_captchas(target: Storage, captcha_user_id: int) -> bool:
+    async with target.read() as db:
+        cursor = await db.execute(
+            "SELECT 1 FROM captcha_table WHERE captcha_user_id = ? LIMIT 1",
+            (captcha_user_id,)
+        )
+        return await cursor.fetchone() is not None
+
+
+async def _delete_user_captchas(db: Connection, captcha_user_id: int) -> list[CaptchaModel]:
+    cursor = await db.execute(
+        f"DELETE FROM captcha_table WHERE captcha_user_id = ? RETURNING {CAPTCHA_COLUMNS}",
+        (captcha_user_id,)
+    )
+    return [CaptchaModel.from_row(row) for row in await cursor.fetchall()]
 
 
 # ~~~~ STATISTICS ~~~~
 async def get_captchas_count() -> int:
     """Получить количество активных капч"""
-    async with connect(BASE_PATH) as db:
-        cursor = await db.execute("SELECT COUNT(*) FROM captcha_table")
-        result = await cursor.fetchone()
-        return result[0] if result else 0
+    total = 0
+    for target in hot_storages():
+        async with target.read() as db:
+            cursor = await db.execute("SELECT COUNT(*) FROM captcha_table")
+            result = await cursor.fetchone()
+            total += result[0] if result else 0
+    return total
 
 
 # ~~~~ INCREMENT ATTEMPTS ~~~~
 async def increment_captcha_attempts(captcha_id: int) -> CaptchaModel | None:
     """Увеличить счётчик попыток на 1"""
-    async with connect(BASE_PATH) as db:
-        await db.execute(
-            "UPDATE captcha_table SET captcha_attempts = captcha_attempts + 1 "
-            "WHERE captcha_id = ?",
-            (captcha_id,)
-        )
-        await db.commit()
-        return await get_captcha(captcha_id=captcha_id)
+    await captcha_storage(captcha_id).execute(
+        "UPDATE captcha_table SET captcha_attempts = captcha_attempts + 1 "
+        "WHERE captcha_id = ?",
+        (captcha_id,)
+    )
+    return await get_captcha(captcha_id=captcha_id)
 
 
 # ~~~~ MIGRATION ~~~~
 async def migrate_captcha_table_v2() -> None:
     """Миграция: добавить captcha_id и убрать PRIMARY KEY с (user_id, chat_id)"""
-    async with connect(BASE_PATH) as db:
-        try:
-            # Проверяем, есть ли уже колонка captcha_id
-            cursor = await db.execute("PRAGMA table_info(captcha_table)")
-            columns = await cursor.fetchall()
-            column_names = [col[1] for col in columns]
-            
-            if "captcha_id" not in column_names:
-                # Создаём новую таблицу с правильной схемой
-                await db.execute("""
-                    CREATE TABLE captcha_table_new (
-                        captcha_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        captcha_user_id INTEGER,
-                        captcha_chat_id INTEGER,
-                        captcha_expires_at TEXT,
-                        captcha_payload TEXT,
-                        captcha_message_id INTEGER,
-                        captcha_correct_emoji TEXT,
-                        captcha_user_message_id INTEGER,
-                        captcha_attempts INTEGER DEFAULT 0
-                    )
-                """)
-                
-                # Копируем данные
-                await db.execute("""
-                    INSERT INTO captcha_table_new (
-                        captcha_user_id, captcha_chat_id, captcha_expires_at,
-                        captcha_payload, captcha_message_id, captcha_correct_emoji,
-                        captcha_user_message_id, captcha_attempts
-                    )
-                    SELECT captcha_user_id, captcha_chat_id, captcha_expires_at,
-                           captcha_payload, captcha_message_id, captcha_correct_emoji,
-                           captcha_user_message_id, captcha_attempts
-                    FROM captcha_table
-                """)
-                
-                # Удаляем старую таблицу
-                await db.execute("DROP TABLE captcha_table")
-                
-                # Переименовываем новую
-                await db.execute("ALTER TABLE captcha_table_new RENAME TO captcha_table")
-                
-                # Создаём индекс
-                await db.execute(
-                    "CREATE INDEX idx_captcha_user_chat ON captcha_table(captcha_user_id, captcha_chat_id)"
-                )
-                
-                await db.commit()
-                logger.info("[CaptchaTable] Migrated to v2: added captcha_id, removed composite PK")
-        except OperationalError as e:
-            logger.warning(f"[CaptchaTable] Migration v2 warning: {e}")
-            pass
+    async def _migrate(db: Connection) -> bool:
+        # Проверяем, есть ли уже колонка captcha_id
+        cursor = await db.execute("PRAGMA table_info(captcha_table)")
+        columns = await cursor.fetchall()
+        column_names = [col[1] for col in columns]
+
+        if "captcha_id" in column_names:
+            return False
+
+        # Создаём новую таблицу с правильной схемой
+        await db.execute("""
+            CREATE TABLE captcha_table_new (
+                captcha_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                captcha_user_id INTEGER,
+                captcha_chat_id INTEGER,
+                captcha_expires_at TEXT,
+                captcha_payload TEXT,
+                captcha_message_id INTEGER,
+                captcha_correct_emoji TEXT,
+                captcha_user_message_id INTEGER,
+                captcha_attempts INTEGER DEFAULT 0
+            )
+        """)
+
+        # Копируем данные
+        await db.execute("""
+            INSERT INTO captcha_table_new (
+                captcha_user_id, captcha_chat_id, captcha_expires_at,
+                captcha_payload, captcha_message_id, captcha_correct_emoji,
+                captcha_user_message_id, captcha_attempts
+            )
+            SELECT captcha_user_id, captcha_chat_id, captcha_expires_at,
+                   captcha_payload, captcha_message_id, captcha_correct_emoji,
+                   captcha_user_message_id, captcha_attempts
+            FROM captcha_table
+        """)
+
+        # Удаляем старую таблицу
+        await db.execute("DROP TABLE captcha_table")
+
+        # Переименовываем новую
+        await db.execute("ALTER TABLE captcha_table_new RENAME TO captcha_table")
+
+        # Создаём индекс
+        await db.execute(
+            "CREATE INDEX idx_captcha_user ON captcha_table(captcha_user_id)"
+        )
+        return True
+
+    try:
+        if await storage.write(_migrate):
+            logger.info("[CaptchaTable] Migrated to v2: added captcha_id, removed composite PK")
+    except OperationalError as e:
+        logger.warning(f"[CaptchaTable] Migration v2 warning: {e}")
 
 
 async def migrate_captcha_table() -> None:
     """Добавить captcha_attempts в существующие таблицы (старая миграция)"""
-    async with connect(BASE_PATH) as db:
-        try:
-            await db.execute("ALTER TABLE captcha_table ADD COLUMN captcha_attempts INTEGER DEFAULT 0")
-            await db.commit()
-            logger.info("[CaptchaTable] Migrated: added captcha_attempts")
-        except OperationalError:
-            pass
\ No newline at end of file
+    try:
+        await storage.execute("ALTER TABLE captcha_table ADD COLUMN captcha_attempts INTEGER DEFAULT 0")
+        logger.info("[CaptchaTable] Migrated: added captcha_attempts")
+    except OperationalError:
+        pass
+
+
+async def migrate_captcha_table_v3() -> None:
+    """Миграция: заменить индекс (user_id, chat_id) индексом только по captcha_user_id"""
+    async def _migrate(db: Connection) -> None:
+        await db.execute("DROP INDEX IF EXISTS idx_captcha_user_chat")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_captcha_user ON captcha_table(captcha_user_id)")
+
+    try:
+        await storage.write(_migrate)
+    except OperationalError as e:
+        logger.warning(f"[CaptchaTable] Migration v3 warning: {e}")
+
+
+async def migrate_captcha_table_v4() -> None:
+    """Добавить captcha_restricted (режим ограничения при входе)"""
+    try:
+        await storage.execute("ALTER TABLE captcha_table ADD COLUMN captcha_restricted INTEGER DEFAULT 0")
+        logger.info("[CaptchaTable] Migrated: added captcha_restricted")
+    except OperationalError:
+        pass
+
+
+async def migrate_captcha_table_v5() -> None:
+    """Добавить captcha_created_at (время до решения капчи для аналитики)"""
+    try:
+        await storage.execute("ALTER TABLE captcha_table ADD COLUMN captcha_created_at TEXT")
+        logger.info("[CaptchaTable] Migrated: added captcha_created_at")
+    except OperationalError:
+        pass
+
+
+# ~~~~ SHARD REBALANCING ~~~~
+async def rebalance_captchas() -> int:
+    """
+    Перенести открытые капчи в хранилище их чата.
+
+    Капчи, выданные до включения шардирования (или при другом количестве шардов),
+    лежат не там, где их ищут обработчики (chat_storage). Запускается при старте.
+    Перенесённая капча получает captcha_id своего хранилища: кнопки капчи ID
+    не содержат, поэтому уже отправленные капчи продолжают работать. Повторный
+    запуск (в том числе одновременно из нескольких процессов) не создаёт дублей:
+    капча с тем же captcha_payload второй раз не вставляется.
+
+    Возвращает:
+        int: количество перенесённых капч
+    """
+    moved = 0
+    for source in hot_storages():
+        async with source.read() as db:
+            cursor = await db.execute(f"SELECT {CAPTCHA_COLUMNS} FROM captcha_table")
+            rows = await cursor.fetchall()
+
+        by_target: dict[Storage, list[CaptchaModel]] = {}
+        for row in rows:
+            captcha = CaptchaModel.from_row(row)
+            target = chat_storage(captcha.captcha_chat_id)
+            if target is not source:
+                by_target.setdefault(target, []).append(captcha)
+
+        for target, captchas in by_target.items():
+            await target.write(lambda db, captchas=captchas: db.executemany(
+                "INSERT INTO captcha_table (captcha_user_id, captcha_chat_id, captcha_expires_at, "
+                "captcha_payload, captcha_message_id, captcha_correct_emoji, captcha_user_message_id, "
+                "captcha_attempts, captcha_restricted, captcha_created_at) "
+                "SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ? "
+                "WHERE NOT EXISTS (SELECT 1 FROM captcha_table WHERE captcha_payload = ?)",
+                [
+                    (captcha.captcha_user_id, captcha.captcha_chat_id, captcha.captcha_expires_at,
+                     captcha.captcha_payload, captcha.captcha_message_id, captcha.captcha_correct_emoji,
+                     captcha.captcha_user_message_id, captcha.captcha_attempts, captcha.captcha_restricted,
+                     captcha.captcha_created_at, captcha.captcha_payload)
+                    for captcha in captchas
+                ]
+            ))
+            await source.write(lambda db, captchas=captchas: db.executemany(
+                "DELETE FROM captcha_table WHERE captcha_id = ?",
+                [(captcha.captcha_id,) for captcha in captchas]
+            ))
+            moved += len(captchas)
+            logger.info(f"[CaptchaTable] Moved {len(captchas)} open captchas from {source.name} to {target.name}")
+
+    return moved
@@ -1,11 +1,15 @@
 from dataclasses import dataclass
-from aiosqlite import connect, OperationalError
-from config import BASE_PATH, settings
+from enum import Enum
+from aiosqlite import Connection, OperationalError
+from config import settings
+from database.rows import row_constructor
+from database.storage import storage
+from database.shards import chat_storage
 from logs.logger import logger
 
 
 # ~~~~ TABLE MODEL ~~~~
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ChatModel:
     """
     Параметры:
@@ -14,42 +18,87 @@ class ChatModel:
         chat_captcha_enabled (int): 0 - выключена, 1 - включена
         chat_captcha_timeout (int): время на капчу в секундах
         chat_max_attempts (int): максимальное количество неправильных попыток
+        chat_restrict_on_join (int): 1 - ограничивать новых участников до прохождения капчи
+        chat_state (str): состояние бота в чате (ChatState)
+        chat_trust_skip_score (int): оценка доверия, с которой пользователь верифицируется без капчи (0 - выключено)
+        chat_trust_light_score (int): оценка доверия, с которой выдаётся упрощённая капча (0 - выключено)
     """
     chat_id: int
     chat_title: str
     chat_captcha_enabled: int
     chat_captcha_timeout: int
     chat_max_attempts: int
+    chat_restrict_on_join: int
+    chat_state: str
+    chat_trust_skip_score: int
+    chat_trust_light_score: int
+
+
+ChatModel.from_row = staticmethod(row_constructor(ChatModel))
+
+
+# ~~~~ CHAT STATE ~~~~
+class ChatState(str, Enum):
+    """Состояние бота в чате"""
+    ACTIVE = "active"
+    KICKED = "kicked"
+    NO_RIGHTS = "no_rights"
+    MIGRATED = "migrated"
 
 
 # ~~~~ BASE CREATING ~~~~
 async def create_db() -> None:
-    async with connect(BASE_PATH) as db:
-        try:
-            await db.execute("""
-                CREATE TABLE chat_table (
-                    chat_id INTEGER PRIMARY KEY,
-                    chat_title TEXT,
-                    chat_captcha_enabled INTEGER DEFAULT 1,
-                    chat_captcha_timeout INTEGER DEFAULT 10,
-                    chat_max_attempts INTEGER DEFAULT 2
-                )
-            """)
-            await db.commit()
-        except OperationalError:
-            pass
+    try:
+        await storage.execute("""
+            CREATE TABLE chat_table (
+                chat_id INTEGER PRIMARY KEY,
+                chat_title TEXT,
+                chat_captcha_enabled INTEGER DEFAULT 1,
+                chat_captcha_timeout INTEGER DEFAULT 10,
+                chat_max_attempts INTEGER DEFAULT 2,
+                chat_restrict_on_join INTEGER DEFAULT 0,
+                chat_state TEXT DEFAULT 'active',
+                chat_trust_skip_score INTEGER DEFAULT 0,
+                chat_trust_light_score INTEGER DEFAULT 0
+            )
+        """)
+    except OperationalError:
+        pass
 
 
 # ~~~~ DATA GETTING ~~~~
 async def get_chat(chat_id: int) -> ChatModel | None:
-    async with connect(BASE_PATH) as db:
+    async with storage.read() as db:
         cursor = await db.execute(
-            "SELECT chat_id, chat_title, chat_captcha_enabled, chat_captcha_timeout, chat_max_attempts "
+            "SELECT chat_id, chat_title, chat_captcha_enabled, chat_captcha_timeout, chat_max_attempts, "
+            "chat_restrict_on_join, chat_state, chat_trust_skip_score, chat_trust_light_score "
             "FROM chat_table WHERE chat_id = ?",
             (chat_id,)
         )
         row = await cursor.fetchone()
-        return ChatModel(*row) if row else None
+        return ChatModel.from_row(row) if row else None
+
+
+async def get_chat_ids(chat_state: ChatState | None = ChatState.ACTIVE) -> list[int]:
+    """Получить ID чатов в состоянии chat_state (None - всех чатов)"""
+    async with storage.read() as db:
+        if chat_state is None:
+            cursor = await db.execute("SELECT chat_id FROM chat_table")
+        else:
+            cursor = await db.execute("SELECT chat_id FROM chat_table WHERE chat_state = ?", (chat_state.value,))
+        rows = await cursor.fetchall()
+        return [row[0] for row in rows]
+
+
+async def get_inactive_chat_states() -> dict[int, str]:
+    """Получить состояния всех неактивных чатов"""
+    async with storage.read() as db:
+        cursor = await db.execute(
+            "SELECT chat_id, chat_state FROM chat_table WHERE chat_state != ?",
+            (ChatState.ACTIVE.value,)
+        )
+        rows = await cursor.fetchall()
+        return {chat_id: chat_state for chat_id, chat_state in rows}
 
 
 # ~~~~ DATA ADDING ~~~~
@@ -64,39 +113,70 @@ async def add_chat(
     if existing_chat is not None:
         return existing_chat
 
-    async with connect(BASE_PATH) as db:
-        await db.execute(
-            "INSERT INTO chat_table (chat_id, chat_title, chat_captcha_enabled, chat_captcha_timeout, chat_max_attempts) "
-            "VALUES (?, ?, ?, ?, ?)",
-            (chat_id, chat_title, chat_captcha_enabled, chat_captcha_timeout, chat_max_attempts)
-        )
-        await db.commit()
-        result = await get_chat(chat_id=chat_id)
-        if result is None:
-            logger.error(f"Failed to retrieve chat {chat_id} after insert")
-            raise RuntimeError(f"Database inconsistency: chat {chat_id} was inserted but not found")
-        return result
+    await storage.execute(
+        "INSERT INTO chat_table (chat_id, chat_title, chat_captcha_enabled, chat_captcha_timeout, chat_max_attempts) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (chat_id, chat_title, chat_captcha_enabled, chat_captcha_timeout, chat_max_attempts)
+    )
+    result = await get_chat(chat_id=chat_id)
+    if result is None:
+        logger.error(f"Failed to retrieve chat {chat_id} after insert")
+        raise RuntimeError(f"Database inconsistency: chat {chat_id} was inserted but not found")
+    return result
 
 
 # ~~~~ DATA UPDATING ~~~~
-ALLOWED_CHAT_FIELDS = {"chat_title", "chat_captcha_enabled", "chat_captcha_timeout", "chat_max_attempts"}
+ALLOWED_CHAT_FIELDS = {
+    "chat_title", "chat_captcha_enabled", "chat_captcha_timeout", "chat_max_attempts", "chat_restrict_on_join",
+    "chat_state", "chat_trust_skip_score", "chat_trust_light_score"
+}
 
 async def update_chat(field: str, data: str | int, chat_id: int) -> None:
     if field not in ALLOWED_CHAT_FIELDS:
         return logger.error(f"Invalid field name: {field}")
 
-    async with connect(BASE_PATH) as db:
+    await storage.execute(
+        f"UPDATE chat_table SET {field} = ? WHERE chat_id = ?",
+        (data, chat_id)
+    )
+
+
+# ~~~~ CHAT MIGRATION ~~~~
+async def move_chat(old_chat_id: int, new_chat_id: int) -> None:
+    """
+    Перенос чата при переходе группы в супергруппу (MIGRATE_TO_CHAT_ID).
+
+    Настройки копируются в строку нового чата (если её ещё нет), старый чат
+    помечается MIGRATED, капчи старого чата удаляются - их сообщения остались
+    в старой группе. Всё в одной транзакции.
+    """
+    async def _move(db: Connection) -> None:
+        await db.execute(
+            "INSERT OR IGNORE INTO chat_table (chat_id, chat_title, chat_captcha_enabled, chat_captcha_timeout, "
+            "chat_max_attempts, chat_restrict_on_join, chat_state, chat_trust_skip_score, chat_trust_light_score) "
+            "SELECT ?, chat_title, chat_captcha_enabled, chat_captcha_timeout, chat_max_attempts, "
+            "chat_restrict_on_join, ?, chat_trust_skip_score, chat_trust_light_score "
+            "FROM chat_table WHERE chat_id = ?",
+            (new_chat_id, ChatState.ACTIVE.value, old_chat_id)
+        )
         await db.execute(
-            f"UPDATE chat_table SET {field} = ? WHERE chat_id = ?",
-            (data, chat_id)
+            "UPDATE chat_table SET chat_state = ? WHERE chat_id = ?",
+            (ChatState.MIGRATED.value, old_chat_id)
         )
-        await db.commit()
+        await db.execute("DELETE FROM captcha_table WHERE captcha_chat_id = ?", (old_chat_id,))
+
+    await storage.write(_move)
+
+    # При шардировании капчи старого чата лежат в его шарде
+    old_storage = chat_storage(old_chat_id)
+    if old_storage is not storage:
+        await old_storage.execute("DELETE FROM captcha_table WHERE captcha_chat_id = ?", (old_chat_id,))
 
 
 # ~~~~ STATISTICS ~~~~
 async def get_chats_count() -> int:
     """Получить общее количество чатов"""
-    async with connect(BASE_PATH) as db:
+    async with storage.read() as db:
         cursor = await db.execute("SELECT COUNT(*) FROM chat_table")
         result = await cursor.fetchone()
         return result[0] if result else 0
@@ -105,10 +185,36 @@ async def get_chats_count() -> int:
 # ~~~~ MIGRATION ~~~~
 async def migrate_chat_table() -> None:
     """Добавить chat_max_attempts в существующие таблицы"""
-    async with connect(BASE_PATH) as db:
+    try:
+        await storage.execute("ALTER TABLE chat_table ADD COLUMN chat_max_attempts INTEGER DEFAULT 2")
+        logger.info("chat_table migrated: added chat_max_attempts")
+    except OperationalError:
+        pass
+
+
+async def migrate_chat_table_v2() -> None:
+    """Добавить chat_restrict_on_join в существующие таблицы"""
+    try:
+        await storage.execute("ALTER TABLE chat_table ADD COLUMN chat_restrict_on_join INTEGER DEFAULT 0")
+        logger.info("chat_table migrated: added chat_restrict_on_join")
+    except OperationalError:
+        pass
+
+
+async def migrate_chat_table_v3() -> None:
+    """Добавить chat_state в существующие таблицы"""
+    try:
+        await storage.execute("ALTER TABLE chat_table ADD COLUMN chat_state TEXT DEFAULT 'active'")
+        logger.info("chat_table migrated: added chat_state")
+    except OperationalError:
+        pass
+
+
+async def migrate_chat_table_v4() -> None:
+    """Добавить пороги доверия chat_trust_skip_score и chat_trust_light_score"""
+    for column in ("chat_trust_skip_score", "chat_trust_light_score"):
         try:
-            await db.execute("ALTER TABLE chat_table ADD COLUMN chat_max_attempts INTEGER DEFAULT 2")
-            await db.commit()
-            logger.info("chat_table migrated: added chat_max_attempts")
+            await storage.execute(f"ALTER TABLE chat_table ADD COLUMN {column} INTEGER DEFAULT 0")
+            logger.info(f"chat_table migrated: added {column}")
         except OperationalError:
             pass
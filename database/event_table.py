@@ -0,0 +1,416 @@
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass
+from enum import Enum
+from aiosqlite import Connection, OperationalError
+from database.storage import Storage
+from database.shards import chat_storage, hot_storages
+from logs.logger import logger
+
+
+# ~~~~ EVENT TYPE ~~~~
+class EventType(str, Enum):
+    """Тип события капчи"""
+    ISSUED = "issued"
+    SOLVED = "solved"
+    WRONG = "wrong"
+    EXPIRED = "expired"
+    MAX_ATTEMPTS = "max_attempts"
+    TRUSTED = "trusted"  # капча не выдавалась: пользователь пропущен в чат по оценке доверия
+
+
+# Непройденная капча: лимит попыток или истечение
+FAILED_EVENT_TYPES = (EventType.MAX_ATTEMPTS.value, EventType.EXPIRED.value)
+
+
+# ~~~~ TABLE MODELS ~~~~
+@dataclass(slots=True, frozen=True)
+class EventModel:
+    """
+    Параметры:
+        event_type (str): тип события (EventType)
+        event_user_id (int | None): Telegram ID пользователя
+        event_chat_id (int): Telegram ID чата
+        event_created_at (str): timestamp события
+        event_duration (float | None): секунд от выдачи капчи до события (для solved и т.п.)
+    """
+    event_type: str
+    event_user_id: int | None
+    event_chat_id: int
+    event_created_at: str
+    event_duration: float | None = None
+
+
+@dataclass
+class EventRollup:
+    """
+    Параметры:
+        event_type (str): тип события (EventType)
+        event_count (int): количество событий
+        event_duration_sum (float): сумма event_duration
+        event_duration_count (int): количество событий с известной event_duration
+    """
+    event_type: str
+    event_count: int
+    event_duration_sum: float
+    event_duration_count: int
+
+    @property
+    def average_duration(self) -> float | None:
+        """Среднее event_duration или None, если длительностей нет"""
+        if not self.event_duration_count:
+            return None
+        return self.event_duration_sum / self.event_duration_count
+
+
+@dataclass(slots=True)
+class UserEventHistory:
+    """
+    Параметры:
+        chat_count (int): в скольких чатах у пользователя были события капчи
+        wrong_count (int): неверных ответов
+        failed_count (int): капч, не пройденных из-за лимита попыток или времени
+    """
+    chat_count: int = 0
+    wrong_count: int = 0
+    failed_count: int = 0
+
+
+# ~~~~ BASE CREATING ~~~~
+async def create_db() -> None:
+    # Журнал и свёртки живут в хранилище чата: запись пачки в одно хранилище не зависит от других
+    for target in hot_storages():
+        await _create_in(target)
+
+
+async def _create_in(target: Storage) -> None:
+    async def _create(db: Connection) -> None:
+        # Сырой журнал: только добавление, аналитика его не читает, старые события
+        # удаляет tasks/retention.py
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS event_table (
+                event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_type TEXT,
+                event_user_id INTEGER,
+                event_chat_id INTEGER,
+                event_created_at TEXT,
+                event_duration REAL
+            )
+        """)
+        # Свёртки обновляются в той же транзакции, что и запись в журнал
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS event_hourly_table (
+                event_hour TEXT,
+                event_type TEXT,
+                event_count INTEGER DEFAULT 0,
+                event_duration_sum REAL DEFAULT 0,
+                event_duration_count INTEGER DEFAULT 0,
+                PRIMARY KEY (event_hour, event_type)
+            )
+        """)
+        # Подневная свёртка по пользователям и чатам - для оценки доверия и блок-листа
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS event_user_daily_table (
+                event_user_id INTEGER,
+                event_chat_id INTEGER,
+                event_day TEXT,
+                event_count INTEGER DEFAULT 0,
+                event_wrong_count INTEGER DEFAULT 0,
+                event_failed_count INTEGER DEFAULT 0,
+                PRIMARY KEY (event_user_id, event_chat_id, event_day)
+            )
+        """)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_event_user_daily_day ON event_user_daily_table(event_day)"
+        )
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_event_user_daily_failed ON event_user_daily_table(event_day) "
+            "WHERE event_failed_count > 0"
+        )
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS event_chat_table (
+                event_chat_id INTEGER,
+                event_type TEXT,
+                event_count INTEGER DEFAULT 0,
+                event_duration_sum REAL DEFAULT 0,
+                event_duration_count INTEGER DEFAULT 0,
+                PRIMARY KEY (event_chat_id, event_type)
+            )
+        """)
+
+    try:
+        await target.write(_create)
+    except OperationalError as e:
+        logger.warning(f"[EventTable] Create warning: {e}")
+
+
+# ~~~~ DATA ADDING ~~~~
+def _rollup_rows(events: list[EventModel], key) -> list[tuple]:
+    totals: dict[tuple, list] = defaultdict(lambda: [0, 0.0, 0])
+    for event in events:
+        total = totals[(key(event), event.event_type)]
+        total[0] += 1
+        if event.event_duration is not None:
+            total[1] += event.event_duration
+            total[2] += 1
+    return [(group, event_type, *total) for (group, event_type), total in totals.items()]
+
+
+def _user_rollup_rows(events: list[EventModel]) -> list[tuple]:
+    totals: dict[tuple, list] = defaultdict(lambda: [0, 0, 0])
+    for event in events:
+        if event.event_user_id is None:
+            continue
+        # День - первые 10 символов timestamp: YYYY-MM-DD
+        total = totals[(event.event_user_id, event.event_chat_id, event.event_created_at[:10])]
+        total[0] += 1
+        total[1] += event.event_type == EventType.WRONG.value
+        total[2] += event.event_type in FAILED_EVENT_TYPES
+    return [(*key, *total) for key, total in totals.items()]
+
+
+async def add_events(events: list[EventModel]) -> list[EventModel]:
+    """
+    Записать пачку событий в журнал и обновить почасовую, початовую и подневную
+    по пользователям свёртки одной транзакцией (при шардировании - одной
+    транзакцией на хранилище).
+
+    Хранилища пишутся независимо: если запись в одно не удалась, события
+    остальных уже зафиксированы и повторно писаться не должны.
+
+    Возвращает:
+        list[EventModel]: события хранилищ, запись в которые не удалась
+    """
+    by_storage: dict[Storage, list[EventModel]] = {}
+    for event in events:
+        by_storage.setdefault(chat_storage(event.event_chat_id), []).append(event)
+
+    results = await asyncio.gather(
+        *(target.write(_add_op(chat_events)) for target, chat_events in by_storage.items()),
+        return_exceptions=True
+    )
+
+    failed = []
+    for (target, chat_events), result in zip(by_storage.items(), results):
+        if isinstance(result, BaseException):
+            logger.error(
+                f"[EventTable] Failed to write {len(chat_events)} events to {target.name}: "
+                f"error_type={type(result).__name__}, error={result}"
+            )
+            failed += chat_events
+    return failed
+
+
+def _add_op(events: list[EventModel]):
+    log_rows = [
+        (event.event_type, event.event_user_id, event.event_chat_id, event.event_created_at, event.event_duration)
+        for event in events
+    ]
+    # Час - первые 13 символов timestamp: YYYY-MM-DD HH
+    hourly_rows = _rollup_rows(events, key=lambda event: event.event_created_at[:13])
+    chat_rows = _rollup_rows(events, key=lambda event: event.event_chat_id)
+    user_rows = _user_rollup_rows(events)
+
+    async def _add(db: Connection) -> None:
+        await db.executemany(
+            "INSERT INTO event_table (event_type, event_user_id, event_chat_id, event_created_at, event_duration) "
+            "VALUES (?, ?, ?, ?, ?)",
+            log_rows
+        )
+        await db.executemany(
+            "INSERT INTO event_hourly_table (event_hour, event_type, event_count, event_duration_sum, "
+            "event_duration_count) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(event_hour, event_type) DO UPDATE SET "
+            "event_count = event_count + excluded.event_count, "
+            "event_duration_sum = event_duration_sum + excluded.event_duration_sum, "
+            "event_duration_count = event_duration_count + excluded.event_duration_count",
+            hourly_rows
+        )
+        await db.executemany(
+            "INSERT INTO event_chat_table (event_chat_id, event_type, event_count, event_duration_sum, "
+            "event_duration_count) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(event_chat_id, event_type) DO UPDATE SET "
+            "event_count = event_count + excluded.event_count, "
+            "event_duration_sum = event_duration_sum + excluded.event_duration_sum, "
+            "event_duration_count = event_duration_count + excluded.event_duration_count",
+            chat_rows
+        )
+        await db.executemany(
+            "INSERT INTO event_user_daily_table (event_user_id, event_chat_id, event_day, event_count, "
+            "event_wrong_count, event_failed_count) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(event_user_id, event_chat_id, event_day) DO UPDATE SET "
+            "event_count = event_count + excluded.event_count, "
+            "event_wrong_count = event_wrong_count + excluded.event_wrong_count, "
+            "event_failed_count = event_failed_count + excluded.event_failed_count",
+            user_rows
+        )
+
+    return _add
+
+
+# ~~~~ ROLLUPS GETTING ~~~~
+async def get_hourly_rollup(since_hour: str) -> dict[str, EventRollup]:
+    """
+    Суммы по типам событий за часы начиная с since_hour (формат YYYY-MM-DD HH).
+    Читает только почасовые свёртки (во всех хранилищах).
+    """
+    rollups: dict[str, EventRollup] = {}
+    for target in hot_storages():
+        async with target.read() as db:
+            cursor = await db.execute(
+                "SELECT event_type, SUM(event_count), SUM(event_duration_sum), SUM(event_duration_count) "
+                "FROM event_hourly_table WHERE event_hour >= ? GROUP BY event_type",
+                (since_hour,)
+            )
+            rows = await cursor.fetchall()
+
+        for event_type, *totals in rows:
+            if event_type in rollups:
+                rollup = rollups[event_type]
+                rollup.event_count += totals[0]
+                rollup.event_duration_sum += totals[1]
+                rollup.event_duration_count += totals[2]
+            else:
+                rollups[event_type] = EventRollup(event_type, *totals)
+    return rollups
+
+
+async def get_chat_rollups(limit: int) -> dict[int, dict[str, EventRollup]]:
+    """
+    Свёртки по чатам с наибольшим количеством выданных капч (за всё время).
+    Читает только початовые свёртки (во всех хранилищах).
+    """
+    rollups: dict[int, dict[str, EventRollup]] = {}
+    for target in hot_storages():
+        async with target.read() as db:
+            cursor = await db.execute(
+                "SELECT event_chat_id, event_type, event_count, event_duration_sum, event_duration_count "
+                "FROM event_chat_table WHERE event_chat_id IN ("
+                "    SELECT event_chat_id FROM event_chat_table WHERE event_type = ? "
+                "    ORDER BY event_count DESC LIMIT ?"
+                ")",
+                (EventType.ISSUED.value, limit)
+            )
+            rows = await cursor.fetchall()
+
+        for chat_id, event_type, *totals in rows:
+            chat_rollups = rollups.setdefault(chat_id, {})
+            if event_type in chat_rollups:
+                # Чат мог писать и в основную БД (до шардирования), и в шард
+                rollup = chat_rollups[event_type]
+                rollup.event_count += totals[0]
+                rollup.event_duration_sum += totals[1]
+                rollup.event_duration_count += totals[2]
+            else:
+                chat_rollups[event_type] = EventRollup(event_type, *totals)
+
+    def _issued(chat_id: int) -> int:
+        rollup = rollups[chat_id].get(EventType.ISSUED.value)
+        return rollup.event_count if rollup else 0
+
+    top = sorted(rollups, key=_issued, reverse=True)[:limit]
+    return {chat_id: rollups[chat_id] for chat_id in top}
+
+
+# ~~~~ USER HISTORY ~~~~
+async def get_user_event_history(since: str) -> dict[int, UserEventHistory]:
+    """
+    История капч пользователей с since (для оценки доверия).
+    Читает только подневную свёртку по пользователям (с точностью до дня).
+    """
+    history: dict[int, UserEventHistory] = {}
+    for target in hot_storages():
+        async with target.read() as db:
+            cursor = await db.execute(
+                "SELECT event_user_id, COUNT(DISTINCT event_chat_id), SUM(event_wrong_count), SUM(event_failed_count) "
+                "FROM event_user_daily_table WHERE event_day >= ? GROUP BY event_user_id",
+                (since[:10],)
+            )
+            rows = await cursor.fetchall()
+
+        # Чат, писавший и в основную БД (до шардирования), и в шард, посчитается дважды - для оценки допустимо
+        for user_id, chat_count, wrong_count, failed_count in rows:
+            user_history = history.setdefault(user_id, UserEventHistory())
+            user_history.chat_count += chat_count
+            user_history.wrong_count += wrong_count
+            user_history.failed_count += failed_count
+    return history
+
+
+async def get_user_failures(since: str) -> list[tuple[int, int, str, int]]:
+    """
+    Непройденные капчи (лимит попыток или истечение) с since во всех хранилищах
+    (для блок-листа). Читает подневную свёртку по частичному индексу непройденных.
+
+    Возвращает:
+        list[tuple]: кортежи (event_user_id, event_chat_id, event_day, event_failed_count)
+    """
+    failures = []
+    for target in hot_storages():
+        async with target.read() as db:
+            cursor = await db.execute(
+                "SELECT event_user_id, event_chat_id, event_day, event_failed_count FROM event_user_daily_table "
+                "WHERE event_failed_count > 0 AND event_day >= ?",
+                (since[:10],)
+            )
+            failures += await cursor.fetchall()
+    return failures
+
+
+# ~~~~ RETENTION ~~~~
+async def prune_event_log(target: Storage, before: str, limit: int) -> int:
+    """
+    Удалить из журнала хранилища пачку событий старше before.
+
+    Журнал пишется по порядку времени, поэтому пачка берётся с начала таблицы
+    по первичному ключу - без индекса по event_created_at.
+
+    Возвращает:
+        int: количество удалённых событий (меньше limit - старых событий не осталось)
+    """
+    cursor = await target.execute(
+        "DELETE FROM event_table WHERE event_id IN ("
+        "    SELECT event_id FROM event_table ORDER BY event_id LIMIT ?"
+        ") AND event_created_at < ?",
+        (limit, before)
+    )
+    return cursor.rowcount
+
+
+async def prune_event_rollups(target: Storage, before_hour: str, before_day: str) -> int:
+    """
+    Удалить почасовую свёртку старше before_hour и подневную свёртку по
+    пользователям старше before_day. Початовая свёртка (за всё время) не трогается.
+    """
+    async def _prune(db: Connection) -> int:
+        hourly = await db.execute("DELETE FROM event_hourly_table WHERE event_hour < ?", (before_hour,))
+        daily = await db.execute("DELETE FROM event_user_daily_table WHERE event_day < ?", (before_day,))
+        return hourly.rowcount + daily.rowcount
+
+    return await target.write(_prune)
+
+
+# ~~~~ MIGRATION ~~~~
+async def migrate_event_table() -> None:
+    """Заполнить подневную свёртку по пользователям из журнала (один раз, при пустой свёртке)"""
+    async def _migrate(db: Connection) -> int:
+        async with db.execute("SELECT 1 FROM event_user_daily_table LIMIT 1") as cursor:
+            if await cursor.fetchone() is not None:
+                return 0
+        cursor = await db.execute(
+            "INSERT INTO event_user_daily_table (event_user_id, event_chat_id, event_day, event_count, "
+            "event_wrong_count, event_failed_count) "
+            "SELECT event_user_id, event_chat_id, substr(event_created_at, 1, 10), COUNT(*), "
+            "SUM(event_type = ?), SUM(event_type IN (?, ?)) "
+            "FROM event_table WHERE event_user_id IS NOT NULL GROUP BY 1, 2, 3",
+            (EventType.WRONG.value, *FAILED_EVENT_TYPES)
+        )
+        return cursor.rowcount
+
+    for target in hot_storages():
+        try:
+            rows = await target.write(_migrate)
+            if rows:
+                logger.info(f"[EventTable] Migrated {target.name}: filled {rows} daily user rollup rows")
+        except OperationalError as e:
+            logger.warning(f"[EventTable] Migration warning: {e}")
@@ -0,0 +1,92 @@
+from dataclasses import dataclass
+from aiosqlite import Connection, OperationalError
+from database.rows import row_constructor
+from database.storage import storage
+from logs.logger import logger
+
+
+# ~~~~ TABLE MODEL ~~~~
+@dataclass(slots=True, frozen=True)
+class LeaseModel:
+    """
+    Параметры:
+        lease_name (str): имя аренды (одна аренда на группу фоновых задач)
+        lease_holder (str): идентификатор процесса-держателя
+        lease_expires_at (float): unix-время, после которого аренду может забрать другой процесс
+        lease_acquired_at (float): unix-время, когда текущий держатель получил аренду
+    """
+    lease_name: str
+    lease_holder: str
+    lease_expires_at: float
+    lease_acquired_at: float
+
+
+LeaseModel.from_row = staticmethod(row_constructor(LeaseModel))
+
+
+LEASE_COLUMNS = "lease_name, lease_holder, lease_expires_at, lease_acquired_at"
+
+
+# ~~~~ BASE CREATING ~~~~
+async def create_db() -> None:
+    try:
+        await storage.execute("""
+            CREATE TABLE IF NOT EXISTS lease_table (
+                lease_name TEXT PRIMARY KEY,
+                lease_holder TEXT,
+                lease_expires_at REAL,
+                lease_acquired_at REAL
+            )
+        """)
+    except OperationalError as e:
+        logger.warning(f"[LeaseTable] Create warning: {e}")
+
+
+# ~~~~ LEASE ACQUIRING ~~~~
+async def acquire_lease(lease_name: str, lease_holder: str, ttl: float, now: float) -> bool:
+    """
+    Получить или продлить аренду одним запросом.
+
+    Аренда достаётся lease_holder, если она свободна, уже принадлежит ему или
+    истекла (держатель не продлевал её ttl секунд).
+
+    Возвращает:
+        bool: True если lease_holder держит аренду до now + ttl
+    """
+    async def _acquire(db: Connection) -> bool:
+        cursor = await db.execute(
+            "INSERT INTO lease_table (lease_name, lease_holder, lease_expires_at, lease_acquired_at) "
+            "VALUES (:name, :holder, :expires_at, :now) "
+            "ON CONFLICT(lease_name) DO UPDATE SET "
+            "lease_acquired_at = CASE WHEN lease_holder = excluded.lease_holder "
+            "    THEN lease_acquired_at ELSE excluded.lease_acquired_at END, "
+            "lease_holder = excluded.lease_holder, "
+            "lease_expires_at = excluded.lease_expires_at "
+            "WHERE lease_holder = excluded.lease_holder OR lease_expires_at < :now "
+            "RETURNING lease_holder",
+            {"name": lease_name, "holder": lease_holder, "expires_at": now + ttl, "now": now}
+        )
+        return await cursor.fetchone() is not None
+
+    return await storage.write(_acquire)
+
+
+async def release_lease(lease_name: str, lease_holder: str) -> bool:
+    """Освободить аренду, если её держит lease_holder. Возвращает True если аренда освобождена."""
+    cursor = await storage.execute(
+        "DELETE FROM lease_table WHERE lease_name = ? AND lease_holder = ?",
+        (lease_name, lease_holder)
+    )
+    return cursor.rowcount > 0
+
+
+# ~~~~ DATA GETTING ~~~~
+async def get_lease(lease_name: str) -> LeaseModel | None:
+    """Получить текущую аренду (в том числе истёкшую)"""
+    async with storage.read() as db:
+        cursor = await db.execute(
+            f"SELECT {LEASE_COLUMNS} FROM lease_table WHERE lease_name = ?",
+            (lease_name,)
+        )
+        row = await cursor.fetchone()
+        return LeaseModel.from_row(row) if row else None
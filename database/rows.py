@@ -0,0 +1,33 @@
+from dataclasses import fields
+from typing import Callable, Sequence, TypeVar
+
+
+# ~~~~ TYPES ~~~~
+M = TypeVar("M")
+
+
+# ~~~~ ROW CONSTRUCTOR ~~~~
+def row_constructor(cls: type[M]) -> Callable[[Sequence], M]:
+    """
+    Быстрый конструктор модели из строки SELECT (колонки в порядке полей модели).
+
+    __init__ frozen-датакласса присваивает каждое поле через object.__setattr__
+    и разбирает аргументы - это в разы медленнее обычного датакласса. Здесь
+    поля заполняются напрямую дескрипторами слотов, код генерируется без цикла.
+
+    Параметры:
+        cls (type): датакласс с slots=True
+
+    Возвращает:
+        Callable: функция row -> модель
+    """
+    names = [model_field.name for model_field in fields(cls)]
+    namespace = {"_new": object.__new__, "_cls": cls}
+    body = []
+    for index, name in enumerate(names):
+        namespace[f"_set_{index}"] = getattr(cls, name).__set__
+        body.append(f"    _set_{index}(obj, row[{index}])\n")
+
+    source = "def from_row(row):\n    obj = _new(_cls)\n" + "".join(body) + "    return obj\n"
+    exec(source, namespace)
+    return namespace["from_row"]
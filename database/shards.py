@@ -0,0 +1,71 @@
+from os import path
+from config import BASE_DIR, settings
+from database.storage import Storage, storage
+
+
+# captcha_id шарда i начинается с (i + 1) << SHARD_ID_SHIFT, поэтому по ID капчи
+# видно, в каком файле она лежит; ID меньше 1 << SHARD_ID_SHIFT - в основной БД
+SHARD_ID_SHIFT = 40
+
+
+# ~~~~ SHARDS ~~~~
+# Горячие данные чатов (капчи, журнал и свёртки событий) при db_shards > 0
+# раскладываются по отдельным файлам по chat_id: у каждого файла свой писатель,
+# и рейд в одном чате не задерживает запись капч в остальных.
+# Глобальные данные (user_table, chat_table) остаются в storage.
+shards: list[Storage] = []
+
+
+def configure_shards(count: int, base_dir: str = BASE_DIR) -> None:
+    """
+    Создать инстансы шардов (соединения открываются лениво).
+
+    При смене количества шардов chat_id перераспределяются по другим файлам:
+    открытые капчи переносит rebalance_captchas() при старте, история событий
+    остаётся на месте (аналитика суммирует все хранилища).
+    """
+    shards[:] = [
+        Storage(
+            path=path.join(base_dir, f"data.shard{index}.db"),
+            readers=settings.db_readers,
+            checkpoint_interval=settings.db_checkpoint_interval,
+            write_batch_size=settings.db_write_batch_size,
+            write_max_latency=settings.db_write_max_latency,
+            name=f"shard{index}",
+        )
+        for index in range(count)
+    ]
+
+
+def chat_storage(chat_id: int) -> Storage:
+    """Хранилище горячих данных чата"""
+    if not shards:
+        return storage
+    return shards[chat_id % len(shards)]
+
+
+def captcha_storage(captcha_id: int) -> Storage:
+    """Хранилище, в котором лежит капча с этим ID"""
+    index = captcha_id >> SHARD_ID_SHIFT
+    if index == 0 or index > len(shards):
+        return storage
+    return shards[index - 1]
+
+
+def shard_id_base(target: Storage) -> int:
+    """Начальное значение captcha_id в хранилище (0 для основной БД)"""
+    if target is storage:
+        return 0
+    return (shards.index(target) + 1) << SHARD_ID_SHIFT
+
+
+def hot_storages() -> list[Storage]:
+    """
+    Все хранилища с таблицами капч и событий чатов.
+
+    Основная БД входит всегда: в ней остаются данные, записанные до включения шардов.
+    """
+    return [storage, *shards]
+
+
+configure_shards(settings.db_shards)
@@ -0,0 +1,434 @@
+import asyncio
+import functools
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Protocol, TypeVar
+from aiosqlite import connect, Connection, Cursor
+from config import BASE_PATH, settings
+from logs.logger import logger
+
+
+# ~~~~ TYPES ~~~~
+T = TypeVar("T")
+WriteOp = Callable[[Connection], Awaitable[T]]
+WriteRequest = tuple[WriteOp, asyncio.Future, bool]
+
+
+# ~~~~ STATEMENT SINK ~~~~
+class StatementSink(Protocol):
+    """Получатель SQL-выражений текущей задачи (стоимость обновления, utils.update_cost)"""
+    db_time: float
+
+    def add_statement(self, sql: str) -> None:
+        ...
+
+
+# Получатель SQL-выражений задачи, которая обращается к БД (None - не учитывать)
+statement_sink: ContextVar[StatementSink | None] = ContextVar("statement_sink", default=None)
+
+
+# ~~~~ STATS MODEL ~~~~
+@dataclass
+class StorageStats:
+    """
+    Параметры:
+        file_size (int): размер файла БД в байтах
+        wal_size (int): размер файла WAL в байтах
+        page_size (int): размер страницы в байтах
+        page_count (int): количество страниц в файле БД
+        freelist_count (int): количество свободных страниц
+        auto_vacuum (int): режим auto_vacuum (0 - NONE, 1 - FULL, 2 - INCREMENTAL)
+        cache_size (int): размер кэша страниц одного соединения (отрицательное значение - в КиБ)
+        mmap_size (int): размер memory-mapped области в байтах
+    """
+    file_size: int
+    wal_size: int
+    page_size: int
+    page_count: int
+    freelist_count: int
+    auto_vacuum: int
+    cache_size: int
+    mmap_size: int
+
+    @property
+    def free_bytes(self) -> int:
+        """Объём свободных страниц внутри файла"""
+        return self.freelist_count * self.page_size
+
+
+# ~~~~ STORAGE ~~~~
+class Storage:
+    """
+    Доступ к SQLite в режиме WAL.
+
+    - несколько соединений только для чтения обслуживают SELECT параллельно;
+    - одна задача-писатель владеет единственным соединением на запись и выполняет
+      все INSERT/UPDATE/DELETE по очереди;
+    - операции записи группируются (group commit): пачка до write_batch_size операций,
+      собранная не дольше write_max_latency секунд, фиксируется одним COMMIT
+      (одним fsync). Каждая операция выполняется в своём SAVEPOINT, поэтому ошибка
+      одной операции откатывает только её;
+    - WAL периодически сбрасывается в основной файл (checkpoint).
+
+    Запускается лениво при первом обращении.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        readers: int,
+        checkpoint_interval: int,
+        write_batch_size: int,
+        write_max_latency: float,
+        name: str = "main"
+    ) -> None:
+        self.path = path
+        self.name = name
+        self.readers = readers
+        self.checkpoint_interval = checkpoint_interval
+        self.write_batch_size = write_batch_size
+        self.write_max_latency = write_max_latency
+
+        self._writer: Connection | None = None
+        self._reader_pool: asyncio.Queue[Connection] | None = None
+        self._readers: list[Connection] = []
+        self._write_queue: asyncio.Queue[WriteRequest] | None = None
+        self._carry: WriteRequest | None = None
+        self._writer_task: asyncio.Task | None = None
+        self._checkpoint_task: asyncio.Task | None = None
+        self._start_lock = asyncio.Lock()
+
+        self._writes = 0
+        self._commits = 0
+        self._statements = 0
+        # Получатель SQL-выражений, которые сейчас выполняет соединение (по id соединения)
+        self._owners: dict[int, StatementSink] = {}
+
+    # ~~~~ CONNECTIONS ~~~~
+    async def _open(self, read_only: bool) -> Connection:
+        # isolation_level=None: транзакции открываем явно, драйвер их не начинает сам
+        db = await connect(self.path, isolation_level=None)
+        pragmas = [
+            f"PRAGMA busy_timeout = {settings.db_busy_timeout}",
+            "PRAGMA synchronous = NORMAL",
+            f"PRAGMA mmap_size = {settings.db_mmap_size}",
+            f"PRAGMA cache_size = {settings.db_cache_size}",
+        ]
+        if read_only:
+            pragmas.append("PRAGMA query_only = ON")
+        for pragma in pragmas:
+            # Курсор закрываем сразу: незавершённый PRAGMA держит блокировку
+            async with db.execute(pragma):
+                pass
+        # Счётчик выполненных SQL-выражений (вызывается в потоке соединения)
+        await db.set_trace_callback(functools.partial(self._on_statement, id(db)))
+        return db
+
+    def _on_statement(self, connection_id: int, sql: str) -> None:
+        self._statements += 1
+        # contextvars в поток соединения не передаются, владельца выставляют read() и write()
+        owner = self._owners.get(connection_id)
+        if owner is not None:
+            owner.add_statement(sql)
+
+    async def _ensure_started(self) -> None:
+        if self._writer_task is not None:
+            return
+        async with self._start_lock:
+            if self._writer_task is not None:
+                return
+
+            self._writer = await self._open(read_only=False)
+            # auto_vacuum действует только для нового файла (до первой таблицы);
+            # существующую БД переводит в INCREMENTAL задача обслуживания
+            async with self._writer.execute("PRAGMA auto_vacuum = INCREMENTAL"):
+                pass
+            # journal_mode хранится в файле БД, достаточно установить с соединения писателя
+            async with self._writer.execute("PRAGMA journal_mode = WAL"):
+                pass
+
+            self._reader_pool = asyncio.Queue()
+            for _ in range(self.readers):
+                reader = await self._open(read_only=True)
+                self._readers.append(reader)
+                self._reader_pool.put_nowait(reader)
+
+            self._write_queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._write_loop(), name="db-writer")
+            self._checkpoint_task = asyncio.create_task(self._checkpoint_loop(), name="db-checkpoint")
+            logger.info(f"[Storage] Started: name={self.name}, path={self.path}, readers={self.readers}")
+
+    # ~~~~ READ ~~~~
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[Connection]:
+        """Взять соединение только для чтения из пула"""
+        await self._ensure_started()
+        sink = statement_sink.get()
+        started_at = time.monotonic()
+        db = await self._reader_pool.get()
+        if sink is not None:
+            self._owners[id(db)] = sink
+        try:
+            yield db
+        finally:
+            if sink is not None:
+                self._owners.pop(id(db), None)
+                sink.db_time += time.monotonic() - started_at
+            self._reader_pool.put_nowait(db)
+
+    # ~~~~ WRITE ~~~~
+    async def write(self, op: WriteOp[T], transaction: bool = True) -> T:
+        """
+        Выполнить операцию записи в задаче-писателе.
+
+        Параметры:
+            op (WriteOp): корутина, получающая соединение писателя
+            transaction (bool): выполнить в транзакции пачки (False - отдельно, вне транзакции)
+
+        Возвращает:
+            T: результат op. Исключение из op откатывает транзакцию и пробрасывается.
+        """
+        await self._ensure_started()
+        sink = statement_sink.get()
+        if sink is not None:
+            op = self._owned(op, sink)
+        started_at = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        self._write_queue.put_nowait((op, future, transaction))
+        try:
+            return await future
+        finally:
+            if sink is not None:
+                sink.db_time += time.monotonic() - started_at
+
+    def _owned(self, op: WriteOp[T], sink: StatementSink) -> WriteOp[T]:
+        # Операции пачки выполняет задача-писатель, получатель передаётся через обёртку.
+        # BEGIN/SAVEPOINT/COMMIT пачки общие для нескольких обновлений и не учитываются
+        async def owned_op(db: Connection) -> T:
+            self._owners[id(db)] = sink
+            try:
+                return await op(db)
+            finally:
+                self._owners.pop(id(db), None)
+        return owned_op
+
+    async def execute(self, sql: str, parameters: tuple = ()) -> Cursor:
+        """Выполнить один изменяющий запрос в задаче-писателе"""
+        return await self.write(lambda db: db.execute(sql, parameters))
+
+    async def _write_loop(self) -> None:
+        while True:
+            batch = await self._collect_batch()
+            try:
+                if batch[0][2]:
+                    await self._commit_batch(batch)
+                else:
+                    await self._run_single(batch[0])
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
+
+    async def _collect_batch(self) -> list[WriteRequest]:
+        """
+        Собрать пачку операций: ждёт первую, затем добирает следующие, пока
+        не наберётся write_batch_size или не истечёт write_max_latency.
+        Операция без транзакции (checkpoint) всегда выполняется отдельно.
+        """
+        if self._carry is not None:
+            first, self._carry = self._carry, None
+        else:
+            first = await self._write_queue.get()
+
+        batch = [first]
+        if not first[2]:
+            return batch
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.write_max_latency
+        while len(batch) < self.write_batch_size:
+            if not self._write_queue.empty():
+                request = self._write_queue.get_nowait()
+            else:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._write_queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+
+            if not request[2]:
+                self._carry = request
+                break
+            batch.append(request)
+        return batch
+
+    async def _commit_batch(self, batch: list[WriteRequest]) -> None:
+        db = self._writer
+        results: list[tuple[asyncio.Future, object]] = []
+
+        try:
+            await db.execute("BEGIN IMMEDIATE")
+            for op, future, _ in batch:
+                if future.cancelled():
+                    continue
+                await db.execute("SAVEPOINT write_op")
+                try:
+                    result = await op(db)
+                except Exception as e:
+                    if not db.in_transaction:
+                        # SQLite откатил всю транзакцию (например, диск заполнен) - пачка потеряна
+                        raise
+                    await db.execute("ROLLBACK TO write_op")
+                    await db.execute("RELEASE write_op")
+                    # Вызывающего могли отменить, пока операция выполнялась: пачку это не ломает
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    await db.execute("RELEASE write_op")
+                    results.append((future, result))
+            await db.commit()
+        except Exception as e:
+            if db.in_transaction:
+                await db.rollback()
+            logger.error(f"[Storage] Write batch failed: size={len(batch)}, error_type={type(e).__name__}, error={e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self._writes += len(results)
+        self._commits += 1
+        # Результаты отдаём только после COMMIT: вызывающий видит уже сохранённые данные
+        for future, result in results:
+            if not future.done():
+                future.set_result(result)
+
+    async def _run_single(self, request: WriteRequest) -> None:
+        op, future, _ = request
+        if future.cancelled():
+            return
+        try:
+            result = await op(self._writer)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    # ~~~~ CHECKPOINT ~~~~
+    async def checkpoint(self, mode: str = "PASSIVE") -> tuple[int, int, int]:
+        """
+        Перенести WAL в основной файл БД.
+
+        Возвращает:
+            tuple[int, int, int]: (busy, страниц в WAL, перенесено страниц)
+        """
+        async def _checkpoint(db: Connection) -> tuple[int, int, int]:
+            async with db.execute(f"PRAGMA wal_checkpoint({mode})") as cursor:
+                return tuple(await cursor.fetchone())
+
+        return await self.write(_checkpoint, transaction=False)
+
+    async def _checkpoint_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                busy, wal_pages, moved_pages = await self.checkpoint()
+                logger.debug(f"[Storage] Checkpoint: busy={busy}, wal_pages={wal_pages}, moved_pages={moved_pages}")
+            except Exception as e:
+                logger.error(f"[Storage] Checkpoint failed: error_type={type(e).__name__}, error={e}")
+
+    # ~~~~ STATS ~~~~
+    async def stats(self) -> StorageStats:
+        """Размер файла, свободные страницы и настройки кэша"""
+        values = {}
+        async with self.read() as db:
+            for pragma in ("page_size", "page_count", "freelist_count", "auto_vacuum", "cache_size", "mmap_size"):
+                async with db.execute(f"PRAGMA {pragma}") as cursor:
+                    row = await cursor.fetchone()
+                    values[pragma] = row[0] if row else 0
+
+        wal_path = f"{self.path}-wal"
+        return StorageStats(
+            file_size=os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            wal_size=os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+            **values,
+        )
+
+    # ~~~~ LIFECYCLE ~~~~
+    async def close(self, timeout: float = 5.0) -> None:
+        """Дождаться очереди записи, сбросить WAL и закрыть соединения"""
+        if self._writer_task is None:
+            return
+
+        self._checkpoint_task.cancel()
+        try:
+            await asyncio.wait_for(self._write_queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"[Storage] Closing with {self._write_queue.qsize()} writes left in queue")
+
+        try:
+            await self.checkpoint(mode="TRUNCATE")
+        except Exception as e:
+            logger.error(f"[Storage] Final checkpoint failed: {e}")
+
+        self._writer_task.cancel()
+        await asyncio.gather(self._writer_task, self._checkpoint_task, return_exceptions=True)
+
+        for db in [self._writer, *self._readers]:
+            await db.close()
+
+        self._writer = None
+        self._readers = []
+        self._reader_pool = None
+        self._write_queue = None
+        self._writer_task = None
+        self._checkpoint_task = None
+        logger.info(f"[Storage] Closed: name={self.name}, writes={self._writes}, commits={self._commits}")
+
+    # ~~~~ METRICS ~~~~
+    @property
+    def writes(self) -> int:
+        """Количество выполненных операций записи"""
+        return self._writes
+
+    @property
+    def commits(self) -> int:
+        """Количество COMMIT (fsync) для этих операций"""
+        return self._commits
+
+    @property
+    def statements(self) -> int:
+        """Количество выполненных SQL-выражений (чтение и запись, включая BEGIN/SAVEPOINT/COMMIT)"""
+        return self._statements
+
+    @property
+    def write_queue_size(self) -> int:
+        """Операций записи в очереди писателя"""
+        return self._write_queue.qsize() if self._write_queue else 0
+
+    def collect_metrics(self) -> list[tuple[str, dict[str, str], float]]:
+        """Метрики хранилища для реестра метрик (регистрируется в main: utils импортирует database)"""
+        labels = {"db": self.name}
+        return [
+            ("db_writes_total", labels, self._writes),
+            ("db_commits_total", labels, self._commits),
+            ("db_statements_total", labels, self._statements),
+            ("db_write_queue_size", labels, self.write_queue_size),
+            ("db_write_batch_size", labels, self.write_batch_size),
+        ]
+
+
+# Глобальный инстанс хранилища
+storage = Storage(
+    path=BASE_PATH,
+    readers=settings.db_readers,
+    checkpoint_interval=settings.db_checkpoint_interval,
+    write_batch_size=settings.db_write_batch_size,
+    write_max_latency=settings.db_write_max_latency,
+)
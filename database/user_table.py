@@ -1,11 +1,15 @@
+import json
 from dataclasses import dataclass
-from aiosqlite import connect, OperationalError
-from config import BASE_PATH
+from aiosqlite import Connection, OperationalError
+from database.rows import row_constructor
+from database.storage import storage
+from database.shards import shards
 from logs.logger import logger
+from utils.time_helpers import get_timestamp
 
 
 # ~~~~ TABLE MODEL ~~~~
-@dataclass
+@dataclass(slots=True, frozen=True)
 class UserModel:
     """
     Параметры:
@@ -16,6 +20,8 @@ class UserModel:
         user_first_seen_at (str): timestamp первого появления
         user_language (str): язык пользователя
         user_is_premium (int | None): 1 - есть Premium, 0 - нет, NULL - неизвестно
+        user_last_seen_at (str | None): timestamp последней активности (обновляется с задержкой)
+        user_trust_score (int): оценка доверия 0-100 (пересчитывается пачками, utils/trust.py)
     """
     user_id: int
     user_username: str
@@ -24,39 +30,58 @@ class UserModel:
     user_first_seen_at: str
     user_language: str
     user_is_premium: int | None
+    user_last_seen_at: str | None
+    user_trust_score: int
+
+
+UserModel.from_row = staticmethod(row_constructor(UserModel))
+
+
+USER_COLUMNS = (
+    "user_id, user_username, user_name, user_status, user_first_seen_at, user_language, user_is_premium, "
+    "user_last_seen_at, user_trust_score"
+)
 
 
 # ~~~~ BASE CREATING ~~~~
 async def create_db() -> None:
-    async with connect(BASE_PATH) as db:
-        try:
-            await db.execute("""
-                CREATE TABLE user_table (
-                    user_id INTEGER PRIMARY KEY,
-                    user_username TEXT,
-                    user_name TEXT,
-                    user_status INTEGER DEFAULT 0,
-                    user_first_seen_at TEXT,
-                    user_language TEXT,
-                    user_is_premium INTEGER
-                )
-            """)
-            await db.commit()
-        except OperationalError:
-            pass
+    try:
+        await storage.execute("""
+            CREATE TABLE user_table (
+                user_id INTEGER PRIMARY KEY,
+                user_username TEXT,
+                user_name TEXT,
+                user_status INTEGER DEFAULT 0,
+                user_first_seen_at TEXT,
+                user_language TEXT,
+                user_is_premium INTEGER,
+                user_last_seen_at TEXT,
+                user_trust_score INTEGER DEFAULT 0
+            )
+        """)
+    except OperationalError:
+        pass
 
 
 # ~~~~ DATA GETTING ~~~~
 async def get_user(user_id: int) -> UserModel | None:
-    async with connect(BASE_PATH) as db:
+    """Получить пользователя. Пользователь из архива прозрачно возвращается в user_table."""
+    async with storage.read() as db:
         cursor = await db.execute(
-            "SELECT user_id, user_username, user_name, user_status, user_first_seen_at, user_language, "
-            "user_is_premium "
-            "FROM user_table WHERE user_id = ?",
+            f"SELECT {USER_COLUMNS} FROM user_table WHERE user_id = ?",
             (user_id,)
         )
         row = await cursor.fetchone()
-        return UserModel(*row) if row else None
+        if row:
+            return UserModel.from_row(row)
+
+        # Промах бывает только у новых и архивных пользователей - проверяем архив
+        cursor = await db.execute("SELECT 1 FROM user_archive_table WHERE user_id = ?", (user_id,))
+        archived = await cursor.fetchone()
+
+    if not archived:
+        return None
+    return await restore_user(user_id=user_id)
 
 
 # ~~~~ DATA ADDING ~~~~
@@ -69,21 +94,114 @@ async def add_user(
     user_is_premium: int | None = None
 ) -> UserModel:
     """Добавить нового пользователя с аналитическими данными."""
-    async with connect(BASE_PATH) as db:
-        await db.execute(
-            "INSERT INTO user_table (user_id, user_username, user_name, user_status, user_first_seen_at, "
-            "user_language, user_is_premium) "
-            "VALUES (?, ?, ?, 0, ?, ?, ?)",
-            (user_id, user_username, user_name, user_first_seen_at, user_language,
-             user_is_premium)
-        )
-        await db.commit()
-        result = await get_user(user_id=user_id)
-        if result is None:
-            logger.error(f"[UserTable] Failed to retrieve user {user_id} after insert")
-            raise RuntimeError(f"Database inconsistency: user {user_id} was inserted but not found")
-        pass
-        return result
+    await storage.execute(
+        "INSERT INTO user_table (user_id, user_username, user_name, user_status, user_first_seen_at, "
+        "user_language, user_is_premium, user_last_seen_at) "
+        "VALUES (?, ?, ?, 0, ?, ?, ?, ?)",
+        (user_id, user_username, user_name, user_first_seen_at, user_language,
+         user_is_premium, user_first_seen_at)
+    )
+    result = await get_user(user_id=user_id)
+    if result is None:
+        logger.error(f"[UserTable] Failed to retrieve user {user_id} after insert")
+        raise RuntimeError(f"Database inconsistency: user {user_id} was inserted but not found")
+    return result
+
+
+# ~~~~ DATA UPSERTING ~~~~
+# Профиль обновляется всегда; статус и Premium - только если переданы (NULL - оставить как есть)
+UPSERT_USER_SQL = (
+    "INSERT INTO user_table (user_id, user_username, user_name, user_status, user_first_seen_at, "
+    "user_language, user_is_premium, user_last_seen_at) "
+    "VALUES (:user_id, :user_username, :user_name, COALESCE(:user_status, 0), :user_first_seen_at, "
+    ":user_language, :user_is_premium, :user_first_seen_at) "
+    "ON CONFLICT(user_id) DO UPDATE SET "
+    "user_username = excluded.user_username, "
+    "user_name = excluded.user_name, "
+    "user_language = COALESCE(NULLIF(excluded.user_language, ''), user_language), "
+    "user_status = COALESCE(:user_status, user_status), "
+    "user_is_premium = COALESCE(excluded.user_is_premium, user_is_premium), "
+    "user_last_seen_at = excluded.user_last_seen_at"
+)
+
+
+def _upsert_params(
+    user_id: int,
+    user_username: str,
+    user_name: str,
+    user_language: str,
+    user_status: int | None,
+    user_is_premium: int | None,
+    user_first_seen_at: str
+) -> dict:
+    return {
+        "user_id": user_id,
+        "user_username": user_username,
+        "user_name": user_name,
+        "user_language": user_language,
+        "user_status": user_status,
+        "user_is_premium": user_is_premium,
+        "user_first_seen_at": user_first_seen_at,
+    }
+
+
+async def upsert_user(
+    user_id: int,
+    user_username: str,
+    user_name: str,
+    user_language: str,
+    user_status: int | None = None,
+    user_is_premium: int | None = None
+) -> UserModel:
+    """
+    Добавить пользователя или обновить его профиль одним запросом.
+
+    Параметры:
+        user_status (int | None): новый статус (None - не менять, для нового пользователя 0)
+        user_is_premium (int | None): флаг Premium (None - не менять)
+
+    Возвращает:
+        UserModel: запись пользователя после изменения
+    """
+    params = _upsert_params(
+        user_id, user_username, user_name, user_language, user_status, user_is_premium, get_timestamp()
+    )
+
+    async def _upsert(db: Connection) -> UserModel:
+        # Сначала возвращаем пользователя из архива, чтобы не потерять статус и first_seen
+        await _restore_archived(db, [(user_id,)])
+        async with db.execute(f"{UPSERT_USER_SQL} RETURNING {USER_COLUMNS}", params) as cursor:
+            return UserModel.from_row(await cursor.fetchone())
+
+    return await storage.write(_upsert)
+
+
+async def upsert_users(users: list[tuple[int, str, str, str]], user_status: int | None = None) -> int:
+    """
+    Добавить или обновить пачку пользователей в одной транзакции (синхронизация админов, рейды).
+
+    Параметры:
+        users (list[tuple]): кортежи (user_id, user_username, user_name, user_language)
+        user_status (int | None): статус для всех пользователей пачки (None - не менять)
+
+    Возвращает:
+        int: количество обработанных пользователей
+    """
+    if not users:
+        return 0
+
+    first_seen_at = get_timestamp()
+    rows = [
+        _upsert_params(user_id, user_username, user_name, user_language, user_status, None, first_seen_at)
+        for user_id, user_username, user_name, user_language in users
+    ]
+
+    async def _upsert(db: Connection) -> None:
+        await _restore_archived(db, [(row["user_id"],) for row in rows])
+        await db.executemany(UPSERT_USER_SQL, rows)
+
+    await storage.write(_upsert)
+    return len(users)
 
 
 # ~~~~ DATA UPDATING ~~~~
@@ -96,39 +214,213 @@ async def update_user(field: str, data: str | int | None, user_id: int) -> None:
     if field not in ALLOWED_USER_FIELDS:
         return logger.error(f"[UserTable] Invalid field name: {field}")
 
-    async with connect(BASE_PATH) as db:
-        await db.execute(
-            f"UPDATE user_table SET {field} = ? WHERE user_id = ?",
-            (data, user_id)
+    await storage.execute(
+        f"UPDATE user_table SET {field} = ? WHERE user_id = ?",
+        (data, user_id)
+    )
+
+
+# ~~~~ ARCHIVE ~~~~
+async def _restore_archived(db: Connection, user_ids: list[tuple[int]]) -> None:
+    """Вернуть пользователей из архива в user_table (внутри операции записи)"""
+    await db.executemany(
+        f"INSERT OR IGNORE INTO user_table ({USER_COLUMNS}) "
+        f"SELECT {USER_COLUMNS} FROM user_archive_table WHERE user_id = ?",
+        user_ids
+    )
+    await db.executemany("DELETE FROM user_archive_table WHERE user_id = ?", user_ids)
+
+
+async def restore_user(user_id: int) -> UserModel | None:
+    """Вернуть пользователя из архива. None - если в архиве его нет."""
+    now = get_timestamp()
+
+    async def _restore(db: Connection) -> UserModel | None:
+        await _restore_archived(db, [(user_id,)])
+        async with db.execute(
+            f"UPDATE user_table SET user_last_seen_at = ? WHERE user_id = ? RETURNING {USER_COLUMNS}",
+            (now, user_id)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return UserModel.from_row(row) if row else None
+
+    user = await storage.write(_restore)
+    if user is not None:
+        logger.info(f"[UserTable] Restored user from archive: user_id={user_id}")
+    return user
+
+
+async def archive_inactive_users(seen_before: str, limit: int) -> int:
+    """
+    Перенести в архив пачку неверифицированных пользователей, не появлявшихся
+    с seen_before и без активных капч.
+
+    Возвращает:
+        int: количество перенесённых пользователей
+    """
+    archived_at = get_timestamp()
+    # Капчи шардов не видны из транзакции основной БД - их пользователей собираем заранее
+    shard_captcha_users = json.dumps(await _get_shard_captcha_user_ids())
+
+    async def _archive(db: Connection) -> int:
+        cursor = await db.execute(
+            "SELECT user_id FROM user_table "
+            "WHERE user_status = 0 AND user_last_seen_at < ? "
+            "AND NOT EXISTS (SELECT 1 FROM captcha_table WHERE captcha_user_id = user_id) "
+            "AND user_id NOT IN (SELECT value FROM json_each(?)) "
+            "LIMIT ?",
+            (seen_before, shard_captcha_users, limit)
+        )
+        user_ids = await cursor.fetchall()
+        if not user_ids:
+            return 0
+
+        await db.executemany(
+            f"INSERT OR REPLACE INTO user_archive_table ({USER_COLUMNS}, user_archived_at) "
+            f"SELECT {USER_COLUMNS}, ? FROM user_table WHERE user_id = ?",
+            [(archived_at, user_id) for user_id, in user_ids]
         )
-        await db.commit()
+        await db.executemany("DELETE FROM user_table WHERE user_id = ?", user_ids)
+        return len(user_ids)
+
+    return await storage.write(_archive)
+
+
+async def _get_shard_captcha_user_ids() -> list[int]:
+    """Пользователи с активными капчами в шардах"""
+    user_ids: set[int] = set()
+    for shard in shards:
+        async with shard.read() as db:
+            cursor = await db.execute("SELECT DISTINCT captcha_user_id FROM captcha_table")
+            user_ids.update(row[0] for row in await cursor.fetchall())
+    return sorted(user_ids)
+
+
+# ~~~~ LAST SEEN ~~~~
+async def update_users_last_seen(rows: list[tuple[str, int]]) -> int:
+    """
+    Обновить user_last_seen_at пачкой.
+
+    Параметры:
+        rows (list[tuple]): кортежи (user_last_seen_at, user_id)
+    """
+    if not rows:
+        return 0
+    await storage.write(lambda db: db.executemany(
+        "UPDATE user_table SET user_last_seen_at = ? WHERE user_id = ?",
+        rows
+    ))
+    return len(rows)
+
+
+# ~~~~ TRUST SCORE ~~~~
+async def get_unverified_users_chunk(after_user_id: int, limit: int) -> list[tuple[int, int | None, str, str, int]]:
+    """
+    Пачка неверифицированных пользователей для пересчёта оценки доверия (по возрастанию user_id).
+
+    Возвращает:
+        list[tuple]: кортежи (user_id, user_is_premium, user_language, user_first_seen_at, user_trust_score)
+    """
+    async with storage.read() as db:
+        cursor = await db.execute(
+            "SELECT user_id, user_is_premium, user_language, user_first_seen_at, user_trust_score "
+            "FROM user_table WHERE user_id > ? AND user_status = 0 ORDER BY user_id LIMIT ?",
+            (after_user_id, limit)
+        )
+        return await cursor.fetchall()
+
+
+async def update_trust_scores(rows: list[tuple[int, int]]) -> int:
+    """
+    Обновить user_trust_score пачкой.
+
+    Параметры:
+        rows (list[tuple]): кортежи (user_trust_score, user_id)
+    """
+    if not rows:
+        return 0
+    await storage.write(lambda db: db.executemany(
+        "UPDATE user_table SET user_trust_score = ? WHERE user_id = ?",
+        rows
+    ))
+    return len(rows)
 
 
 # ~~~~ MIGRATION ~~~~
 async def migrate_user_table() -> None:
     """Добавить колонку is_premium для аналитики"""
-    async with connect(BASE_PATH) as db:
-        try:
-            # Проверяем существующие колонки
-            cursor = await db.execute("PRAGMA table_info(user_table)")
-            columns = await cursor.fetchall()
-            column_names = {col[1] for col in columns}
-            
-            # Добавляем user_is_premium если отсутствует
-            if "user_is_premium" not in column_names:
-                await db.execute("ALTER TABLE user_table ADD COLUMN user_is_premium INTEGER")
-                logger.info("[UserTable] Migration: added user_is_premium column")
-            
-            await db.commit()
-            logger.info("[UserTable] Migration completed successfully")
-        except OperationalError as e:
-            logger.warning(f"[UserTable] Migration warning: {e}")
+    async def _migrate(db: Connection) -> None:
+        # Проверяем существующие колонки
+        cursor = await db.execute("PRAGMA table_info(user_table)")
+        columns = await cursor.fetchall()
+        column_names = {col[1] for col in columns}
+
+        # Добавляем user_is_premium если отсутствует
+        if "user_is_premium" not in column_names:
+            await db.execute("ALTER TABLE user_table ADD COLUMN user_is_premium INTEGER")
+            logger.info("[UserTable] Migration: added user_is_premium column")
+
+    try:
+        await storage.write(_migrate)
+        logger.info("[UserTable] Migration completed successfully")
+    except OperationalError as e:
+        logger.warning(f"[UserTable] Migration warning: {e}")
+
+
+async def migrate_user_table_v2() -> None:
+    """Добавить user_last_seen_at, индекс для архивации и таблицу архива пользователей"""
+    async def _migrate(db: Connection) -> None:
+        cursor = await db.execute("PRAGMA table_info(user_table)")
+        column_names = {col[1] for col in await cursor.fetchall()}
+
+        if "user_last_seen_at" not in column_names:
+            await db.execute("ALTER TABLE user_table ADD COLUMN user_last_seen_at TEXT")
+            await db.execute("UPDATE user_table SET user_last_seen_at = user_first_seen_at")
+            logger.info("[UserTable] Migration: added user_last_seen_at column")
+
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_user_inactive ON user_table(user_status, user_last_seen_at)"
+        )
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS user_archive_table (
+                user_id INTEGER PRIMARY KEY,
+                user_username TEXT,
+                user_name TEXT,
+                user_status INTEGER DEFAULT 0,
+                user_first_seen_at TEXT,
+                user_language TEXT,
+                user_is_premium INTEGER,
+                user_last_seen_at TEXT,
+                user_archived_at TEXT
+            )
+        """)
+
+    try:
+        await storage.write(_migrate)
+    except OperationalError as e:
+        logger.warning(f"[UserTable] Migration v2 warning: {e}")
+
+
+async def migrate_user_table_v3() -> None:
+    """Добавить user_trust_score в user_table и архив"""
+    async def _migrate(db: Connection) -> None:
+        for table in ("user_table", "user_archive_table"):
+            cursor = await db.execute(f"PRAGMA table_info({table})")
+            column_names = {col[1] for col in await cursor.fetchall()}
+            if "user_trust_score" not in column_names:
+                await db.execute(f"ALTER TABLE {table} ADD COLUMN user_trust_score INTEGER DEFAULT 0")
+                logger.info(f"[UserTable] Migration: added user_trust_score column to {table}")
+
+    try:
+        await storage.write(_migrate)
+    except OperationalError as e:
+        logger.warning(f"[UserTable] Migration v3 warning: {e}")
 
 
 # ~~~~ STATISTICS ~~~~
 async def get_users_count() -> int:
     """Получить общее количество пользователей"""
-    async with connect(BASE_PATH) as db:
+    async with storage.read() as db:
         cursor = await db.execute("SELECT COUNT(*) FROM user_table")
         result = await cursor.fetchone()
         return result[0] if result else 0
@@ -136,7 +428,15 @@ async def get_users_count() -> int:
 
 async def get_verified_count() -> int:
     """Получить количество верифицированных пользователей"""
-    async with connect(BASE_PATH) as db:
+    async with storage.read() as db:
         cursor = await db.execute("SELECT COUNT(*) FROM user_table WHERE user_status = 1")
         result = await cursor.fetchone()
-        return result[0] if result else 0
\ No newline at end of file
+        return result[0] if result else 0
+
+
+async def get_archived_count() -> int:
+    """Получить количество пользователей в архиве"""
+    async with storage.read() as db:
+        cursor = await db.execute("SELECT COUNT(*) FROM user_archive_table")
+        result = await cursor.fetchone()
+        return result[0] if result else 0
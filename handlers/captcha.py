@@ -1,18 +1,14 @@
-from datetime import datetime
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
 from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
-from database.captcha_table import (
-    get_captchas_for_user,
-    delete_captcha, 
-    delete_all_captchas_for_user,
-    increment_captcha_attempts
-)
-from database.user_table import update_user
-from database.chat_table import get_chat
-from utils.time_helpers import is_expired
-from utils.helpers import safe_callback_answer
+from database.captcha_table import resolve_captcha, CaptchaOutcome
+from utils.helpers import safe_callback_answer, delete_messages_bulk, unrestrict_member, kick_member
 from utils.notifications import notify_owner_about_error
+from utils.purge_queue import captcha_purge_queue, PurgeJob
+from utils.chat_state import chat_states
+from utils.event_log import event_log
+from utils.blocklist import spammer_blocklist
+from database.event_table import EventType
 from logs.logger import logger
 
 
@@ -26,8 +22,8 @@ async def captcha_callback(callback: CallbackQuery) -> None:
     """
     Обработка нажатий на кнопки капчи.
     
-    При успешной верификации удаляет ВСЕ капчи пользователя в чате,
-    чтобы очистить спам-сообщения.
+    Ответ проверяется атомарно через resolve_captcha. При успешной верификации
+    удаляются ВСЕ капчи пользователя во всех чатах (верификация глобальная).
     """
     if callback.message is None:
         return
@@ -50,99 +46,84 @@ async def captcha_callback(callback: CallbackQuery) -> None:
         await safe_callback_answer(callback, "❌ Эта капча не для вас", show_alert=True)
         return
 
-    # Ищем все капчи пользователя в этом чате
-    captchas = await get_captchas_for_user(captcha_user_id=user_id, captcha_chat_id=chat_id)
+    # Проверка ответа, попытки и верификация - одной транзакцией
+    resolution = await resolve_captcha(captcha_user_id=user_id, captcha_chat_id=chat_id, captcha_payload=token)
+    captcha = resolution.captcha
 
-    if not captchas:
+    if resolution.outcome == CaptchaOutcome.NOT_FOUND:
         await safe_callback_answer(callback, "❌ Капча не найдена или истекла", show_alert=True)
         return
 
-    # Берём первую активную капчу (обычно она одна)
-    captcha = captchas[0]
+    if resolution.outcome == CaptchaOutcome.EXPIRED:
+        # Удаляем капчу через общую очередь, чтобы не удалить её повторно в cleanup
+        captcha_purge_queue.schedule(PurgeJob(
+            captcha_id=captcha.captcha_id,
+            chat_id=chat_id,
+            message_id=captcha.captcha_message_id,
+            user_message_id=captcha.captcha_user_message_id,
+            notify_on_error=True,
+            kick_user_id=user_id if captcha.captcha_restricted else None,
+            user_id=user_id,
+        ))
 
-    # Проверяем, не истекла ли капча
-    if is_expired(captcha.captcha_expires_at):
-        # Удаляем сообщение капчи
-        try:
-            await callback.message.delete()
-        except (TelegramForbiddenError, TelegramBadRequest, Exception) as e:
-            if callback.bot:
-                await notify_owner_about_error(
-                    bot=callback.bot,
-                    error_type="delete_expired_captcha_failed",
-                    chat_id=chat_id,
-                    message_id=captcha.captcha_message_id,
-                    error_description=f"Failed to delete expired captcha: {e}"
-                )
-        
-        # Удаляем запись из БД
-        try:
-            await delete_captcha(captcha_id=captcha.captcha_id)
-        except Exception:
-            pass
-        
         await safe_callback_answer(callback, "❌ Время капчи истекло", show_alert=True)
         return
 
-    # Проверяем правильность ответа
-    if token == captcha.captcha_payload:
+    if resolution.outcome == CaptchaOutcome.SOLVED:
         logger.info(
             f"[Captcha] User verified: user_id={user_id}, chat_id={chat_id}"
         )
-        
-        # Удаляем ВСЕ капчи пользователя в этом чате (чтобы очистить спам)
-        try:
-            await delete_all_captchas_for_user(
-                captcha_user_id=user_id, 
-                captcha_chat_id=chat_id
-            )
-        except Exception:
-            pass
-        
-        # Обновляем статус пользователя
-        try:
-            await update_user(field="user_status", data=1, user_id=user_id)
-        except Exception:
-            pass
-        
-        # Удаляем сообщение с капчей
-        try:
-            await callback.message.delete()
-        except (TelegramForbiddenError, TelegramBadRequest, Exception) as e:
-            if callback.bot:
+        event_log.record(EventType.SOLVED, chat_id=chat_id, user_id=user_id, started_at=captcha.captcha_created_at)
+        spammer_blocklist.discard([user_id])
+
+        captcha_purge_queue.mark_resolved([removed.captcha_id for removed in resolution.removed])
+
+        # Удаляем сообщения капч пользователя во всех чатах: один deleteMessages на чат
+        messages_by_chat: dict[int, list[int]] = {}
+        for removed in resolution.removed:
+            messages_by_chat.setdefault(removed.captcha_chat_id, []).append(removed.captcha_message_id)
+        messages_by_chat.setdefault(chat_id, []).append(callback.message.message_id)
+
+        for removed_chat_id, message_ids in messages_by_chat.items():
+            if not chat_states.is_active(removed_chat_id):
+                continue
+            try:
+                await delete_messages_bulk(bot=callback.bot, chat_id=removed_chat_id, message_ids=message_ids)
+            except (TelegramForbiddenError, TelegramBadRequest, Exception) as e:
+                if await chat_states.handle_api_error(removed_chat_id, e):
+                    continue
                 await notify_owner_about_error(
                     bot=callback.bot,
                     error_type="delete_captcha_failed",
-                    chat_id=chat_id,
-                    message_id=captcha.captcha_message_id,
-                    error_description=f"Failed to delete captcha: {e}"
+                    chat_id=removed_chat_id,
+                    message_id=message_ids[0],
+                    error_description=f"Failed to delete captchas: {e}"
                 )
-        
-        await safe_callback_answer(callback, "✅ Верификация пройдена!")
-        return
 
-    # Неправильный ответ - увеличиваем счётчик попыток
-    updated_captcha = await increment_captcha_attempts(captcha_id=captcha.captcha_id)
-
-    if updated_captcha is None:
-        await safe_callback_answer(callback, "❌ Ошибка капчи", show_alert=True)
-        return
-
-    # Получаем настройки чата
-    chat = await get_chat(chat_id=chat_id)
+        # Снимаем ограничения режима "ограничение при входе"
+        for removed in resolution.removed:
+            if not removed.captcha_restricted or not chat_states.is_active(removed.captcha_chat_id):
+                continue
+            try:
+                await unrestrict_member(bot=callback.bot, chat_id=removed.captcha_chat_id, user_id=user_id)
+            except (TelegramForbiddenError, TelegramBadRequest, Exception) as e:
+                await notify_owner_about_error(
+                    bot=callback.bot,
+                    error_type="unrestrict_member_failed",
+                    chat_id=removed.captcha_chat_id,
+                    message_id=None,
+                    error_description=f"Failed to lift restriction for user {user_id}: {e}"
+                )
 
-    if chat is None:
-        await safe_callback_answer(callback, "❌ Чат не найден", show_alert=True)
+        await safe_callback_answer(callback, "✅ Верификация пройдена!")
         return
 
-    max_attempts = chat.chat_max_attempts
-    attempts_used = updated_captcha.captcha_attempts
-    attempts_remaining = max_attempts - attempts_used
-
-    # Проверяем лимит попыток
-    if attempts_remaining <= 0:
+    if resolution.outcome == CaptchaOutcome.MAX_ATTEMPTS:
         logger.info(f"[Captcha] Max attempts exceeded: user_id={user_id}")
-        
+        event_log.record(
+            EventType.MAX_ATTEMPTS, chat_id=chat_id, user_id=user_id, started_at=captcha.captcha_created_at
+        )
+
         # Удаляем сообщение капчи
         try:
             await callback.message.delete()
@@ -157,11 +138,11 @@ async def captcha_callback(callback: CallbackQuery) -> None:
                 )
 
         # Удаляем сообщение пользователя
-        if updated_captcha.captcha_user_message_id:
+        if captcha.captcha_user_message_id:
             try:
                 await callback.bot.delete_message(
                     chat_id=chat_id,
-                    message_id=updated_captcha.captcha_user_message_id
+                    message_id=captcha.captcha_user_message_id
                 )
             except (TelegramForbiddenError, TelegramBadRequest, Exception) as e:
                 if callback.bot:
@@ -169,21 +150,23 @@ async def captcha_callback(callback: CallbackQuery) -> None:
                         bot=callback.bot,
                         error_type="delete_user_message_max_attempts_failed",
                         chat_id=chat_id,
-                        message_id=updated_captcha.captcha_user_message_id,
+                        message_id=captcha.captcha_user_message_id,
                         error_description=f"Failed to delete user message on max attempts: {e}"
                     )
 
-        # Удаляем капчу из БД
-        try:
-            await delete_captcha(captcha_id=captcha.captcha_id)
-        except Exception:
-            pass
+        # Не прошёл капчу при входе - исключаем, чтобы он мог зайти и попробовать снова
+        if captcha.captcha_restricted:
+            try:
+                await kick_member(bot=callback.bot, chat_id=chat_id, user_id=user_id)
+            except (TelegramForbiddenError, TelegramBadRequest, Exception) as e:
+                logger.error(f"[Captcha] Failed to kick restricted user: user_id={user_id}, error={e}")
 
         await safe_callback_answer(callback, "❌ Превышен лимит попыток", show_alert=True)
         return
 
     # Отвечаем о неправильном ответе
+    event_log.record(EventType.WRONG, chat_id=chat_id, user_id=user_id, started_at=captcha.captcha_created_at)
     await safe_callback_answer(
         callback,
-        f"❌ Неправильно! Осталось попыток: {attempts_remaining}"
-    )
\ No newline at end of file
+        f"❌ Неправильно! Осталось попыток: {resolution.attempts_remaining}"
+    )
@@ -1,15 +1,24 @@
-from aiogram import Router
-from aiogram.filters import ChatMemberUpdatedFilter, IS_NOT_MEMBER, MEMBER, LEFT
+from datetime import timedelta
+from aiogram import Router, F
+from aiogram.filters import (
+    ChatMemberUpdatedFilter, IS_MEMBER, IS_NOT_MEMBER, MEMBER, RESTRICTED, LEFT, KICKED, ADMINISTRATOR,
+    PROMOTED_TRANSITION
+)
 from aiogram.handlers import ChatMemberHandler
-from aiogram.types import ChatMemberUpdated
-from aiogram.enums import ChatMemberStatus
-from aiogram.exceptions import TelegramForbiddenError
-from aiosqlite import IntegrityError
+from aiogram.types import ChatMemberUpdated, Message, User
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
 from config import settings
-from database.chat_table import add_chat, get_chat
-from database.user_table import get_user, add_user, update_user
+from database.chat_table import ChatModel, ChatState, add_chat, get_chat
+from database.user_table import upsert_user
 from utils.time_helpers import get_timestamp
-from utils.helpers import get_chat_title
+from utils.helpers import get_chat_title, restrict_member, unrestrict_member
+from utils.captcha import send_join_captcha
+from utils.single_flight import captcha_issue_locks
+from utils.admin_cache import admin_cache, sync_chat_admins, mark_admin_promoted, mark_admin_demoted
+from utils.chat_state import chat_states
+from utils.trust import TrustTier, get_trust_tier, trusted_passes
+from utils.blocklist import blocklist_penalties, spammer_blocklist
+from utils.metrics import metrics
 from logs.logger import logger
 
 
@@ -38,30 +47,15 @@ class BotAddedHandler(ChatMemberHandler):
         except RuntimeError as e:
             logger.error(f"[ChatMember] Failed to add chat {chat_id} to database: {e}")
 
-        if event.from_user:
-            try:
-                member = await bot.get_chat_member(chat_id=chat_id, user_id=event.from_user.id)
-                if member.status in (ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR):
-                    db_admin = await get_user(user_id=event.from_user.id)
-                    if db_admin is None:
-                        try:
-                            db_admin = await add_user(
-                                user_id=event.from_user.id,
-                                user_username=event.from_user.username or "",
-                                user_name=event.from_user.full_name,
-                                user_first_seen_at=get_timestamp(),
-                                user_language=event.from_user.language_code or ""
-                            )
-                        except RuntimeError as e:
-                            logger.error(f"[ChatMember] Failed to add admin {event.from_user.id} to database: {e}")
-                            return
-                        await update_user(field="user_status", data=1, user_id=event.from_user.id)
-                    elif db_admin.user_status != 1:
-                        await update_user(field="user_status", data=1, user_id=event.from_user.id)
-            except TelegramForbiddenError:
-                pass
-            except Exception as e:
-                logger.error(f"[ChatMember] Error checking admin status: {e}")
+        await chat_states.set_state(chat_id, ChatState.ACTIVE)
+
+        # Один get_chat_administrators вместо проверки только добавившего пользователя
+        try:
+            await sync_chat_admins(bot=bot, chat_id=chat_id)
+        except TelegramForbiddenError:
+            pass
+        except Exception as e:
+            logger.error(f"[ChatMember] Error syncing chat admins: {e}")
 
         notification = (
             f"🔔 <b>Бот добавлен в чат</b>\n"
@@ -88,7 +82,7 @@ class BotAddedHandler(ChatMemberHandler):
 # ~~~~ USER ADDED TO CHAT HANDLER ~~~~
 @chat_member_router.chat_member(ChatMemberUpdatedFilter(IS_NOT_MEMBER >> MEMBER))
 class UserAddedHandler(ChatMemberHandler):
-    """Обработчик добавления пользователя в чат"""
+    """Обработчик добавления пользователя в чат (и капча при входе, если она включена в чате)"""
 
     async def handle(self) -> None:
         event: ChatMemberUpdated = self.event
@@ -97,26 +91,98 @@ class UserAddedHandler(ChatMemberHandler):
         if user.is_bot:
             return
 
-        db_user = await get_user(user_id=user.id)
-        if db_user is None:
+        # Один INSERT ... ON CONFLICT: одновременные входы одного пользователя не конфликтуют
+        try:
+            db_user = await upsert_user(
+                user_id=user.id,
+                user_username=user.username or "",
+                user_name=user.full_name,
+                user_language=user.language_code or "",
+                user_is_premium=1 if user.is_premium else 0
+            )
+        except Exception as e:
+            logger.error(f"[ChatMember] Failed to add user {user.id} to database: {e}")
+            return
+
+        if db_user.user_status == 1:
+            return
+
+        chat = await get_chat(chat_id=event.chat.id)
+        if chat is None or not chat.chat_captcha_enabled:
+            return
+
+        if user.id in spammer_blocklist and not blocklist_penalties.served(user_id=user.id, chat_id=chat.chat_id):
+            await self._restrict_blocklisted(chat=chat, user=user)
+            return
+
+        if not chat.chat_restrict_on_join:
+            return
+
+        # Доверенных пользователей не ограничиваем: пропускаем без капчи в этом
+        # чате или оставляем упрощённую капчу на первое сообщение
+        trust_tier = get_trust_tier(db_user.user_trust_score, chat)
+        if trust_tier == TrustTier.SKIP:
+            trusted_passes.allow(user_id=user.id, chat_id=chat.chat_id, trust_score=db_user.user_trust_score)
+            return
+        if trust_tier == TrustTier.LIGHT:
+            return
+
+        await self._restrict_and_send_captcha(chat=chat, user=user)
+
+    async def _restrict_blocklisted(self, chat: ChatModel, user: User) -> None:
+        """
+        Пользователь из блок-листа: ограничиваем на blocklist_restrict_seconds без капчи
+        (после - обычная капча на первое сообщение, см. BlocklistPenalties)
+        """
+        metrics.inc("blocklist_hits_total", labels={"source": "join"})
+        if not blocklist_penalties.start(
+            user_id=user.id, chat_id=chat.chat_id, seconds=settings.blocklist_restrict_seconds
+        ):
+            return
+        try:
+            await restrict_member(
+                bot=self.event.bot,
+                chat_id=chat.chat_id,
+                user_id=user.id,
+                duration=timedelta(seconds=settings.blocklist_restrict_seconds),
+            )
+            logger.info(f"[ChatMember] Restricted blocklisted user: user_id={user.id}, chat_id={chat.chat_id}")
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            logger.warning(f"[ChatMember] Cannot restrict blocklisted user: chat_id={chat.chat_id}, error={e}")
+
+    async def _restrict_and_send_captcha(self, chat: ChatModel, user: User) -> None:
+        """
+        Режим ограничения при входе: запрещаем писать и выдаём одну капчу.
+        Ограничение снимается при прохождении капчи (handlers/captcha.py).
+        """
+        bot = self.event.bot
+
+        async with captcha_issue_locks.hold((user.id, chat.chat_id)):
             try:
-                db_user = await add_user(
-                    user_id=user.id,
-                    user_username=user.username or "",
-                    user_name=user.full_name,
-                    user_first_seen_at=get_timestamp(),
-                    user_language=user.language_code or ""
-                )
-            except IntegrityError:
-                pass
+                await restrict_member(bot=bot, chat_id=chat.chat_id, user_id=user.id)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Нет права ограничивать участников - остаётся капча на первое сообщение
+                logger.warning(f"[ChatMember] Cannot restrict new member: chat_id={chat.chat_id}, error={e}")
+                return
+
+            try:
+                captcha = await send_join_captcha(bot=bot, chat=chat, user=user)
             except RuntimeError as e:
-                logger.error(f"[ChatMember] Failed to add user {user.id} to database: {e}")
+                logger.error(f"[ChatMember] Failed to save join captcha: user_id={user.id}, error={e}")
+                captcha = None
+
+            if captcha is None:
+                # Капчу выдать не удалось - не оставляем пользователя ограниченным навсегда
+                try:
+                    await unrestrict_member(bot=bot, chat_id=chat.chat_id, user_id=user.id)
+                except Exception as e:
+                    logger.error(f"[ChatMember] Failed to lift restriction: user_id={user.id}, error={e}")
 
 
 # ~~~~ BOT KICKED FROM CHAT HANDLER ~~~~
-@chat_member_router.my_chat_member(ChatMemberUpdatedFilter(MEMBER >> LEFT))
+@chat_member_router.my_chat_member(ChatMemberUpdatedFilter(IS_MEMBER >> IS_NOT_MEMBER))
 class BotKickedHandler(ChatMemberHandler):
-    """Обработчик удаления бота из чата"""
+    """Обработчик удаления бота из чата (выход, исключение, бан)"""
 
     async def handle(self) -> None:
         event: ChatMemberUpdated = self.event
@@ -128,6 +194,10 @@ class BotKickedHandler(ChatMemberHandler):
         chat_title = get_chat_title(event.chat)
         timestamp = get_timestamp(event.date)
 
+        # Фоновые задачи больше не обращаются к этому чату
+        await chat_states.set_state(chat_id, ChatState.KICKED)
+        admin_cache.forget(chat_id)
+
         notification = (
             f"👋 <b>Бот удален из чата</b>\n"
             f"📌 <b>Chat ID:</b> {chat_id}\n"
@@ -165,6 +235,8 @@ class BotReturnedHandler(ChatMemberHandler):
             except RuntimeError as e:
                 logger.error(f"[ChatMember] Failed to add chat {chat_id} to database: {e}")
 
+        await chat_states.set_state(chat_id, ChatState.ACTIVE)
+
         notification = (
             f"🔄 <b>Бот возвращен в чат</b>\n"
             f"📌 <b>Chat ID:</b> {chat_id}\n"
@@ -184,3 +256,63 @@ class BotReturnedHandler(ChatMemberHandler):
             pass
         except Exception as e:
             logger.error(f"[ChatMember] Error sending welcome message: {e}")
+
+
+
+# ~~~~ ADMIN PROMOTED HANDLER ~~~~
+@chat_member_router.chat_member(ChatMemberUpdatedFilter(PROMOTED_TRANSITION))
+class AdminPromotedHandler(ChatMemberHandler):
+    """Обработчик назначения пользователя админом: обновляет кэш и верифицирует"""
+
+    async def handle(self) -> None:
+        event: ChatMemberUpdated = self.event
+
+        try:
+            await mark_admin_promoted(chat_id=event.chat.id, user=event.new_chat_member.user)
+        except Exception as e:
+            logger.error(f"[ChatMember] Error handling admin promotion: {e}")
+
+
+# ~~~~ ADMIN DEMOTED HANDLER ~~~~
+@chat_member_router.chat_member(ChatMemberUpdatedFilter(ADMINISTRATOR >> (MEMBER | RESTRICTED | LEFT | KICKED)))
+class AdminDemotedHandler(ChatMemberHandler):
+    """Обработчик снятия админки: убирает пользователя из кэша админов"""
+
+    async def handle(self) -> None:
+        event: ChatMemberUpdated = self.event
+        mark_admin_demoted(chat_id=event.chat.id, user_id=event.new_chat_member.user.id)
+
+
+# ~~~~ BOT PROMOTED HANDLER ~~~~
+@chat_member_router.my_chat_member(ChatMemberUpdatedFilter(PROMOTED_TRANSITION))
+class BotPromotedHandler(ChatMemberHandler):
+    """Обработчик выдачи боту админки: полная синхронизация админов чата"""
+
+    async def handle(self) -> None:
+        event: ChatMemberUpdated = self.event
+
+        try:
+            await sync_chat_admins(bot=event.bot, chat_id=event.chat.id)
+        except TelegramForbiddenError:
+            pass
+        except Exception as e:
+            logger.error(f"[ChatMember] Error syncing chat admins: {e}")
+
+
+# ~~~~ BOT DEMOTED HANDLER ~~~~
+@chat_member_router.my_chat_member(ChatMemberUpdatedFilter(ADMINISTRATOR >> (MEMBER | RESTRICTED)))
+class BotDemotedHandler(ChatMemberHandler):
+    """Обработчик снятия админки с бота"""
+
+    async def handle(self) -> None:
+        event: ChatMemberUpdated = self.event
+        mark_admin_demoted(chat_id=event.chat.id, user_id=event.new_chat_member.user.id)
+        await chat_states.set_state(event.chat.id, ChatState.NO_RIGHTS)
+
+
+# ~~~~ CHAT MIGRATED HANDLER ~~~~
+@chat_member_router.message(F.migrate_to_chat_id)
+async def chat_migrated_handler(message: Message) -> None:
+    """Группа стала супергруппой: переносим настройки чата на новый ID"""
+    admin_cache.forget(message.chat.id)
+    await chat_states.migrate(old_chat_id=message.chat.id, new_chat_id=message.migrate_to_chat_id)
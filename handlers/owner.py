@@ -1,3 +1,6 @@
+import asyncio
+import os
+from datetime import timedelta
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 from aiogram.filters import CommandStart
@@ -5,10 +8,20 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import BufferedInputFile
 from logs.logger import logger
 from config import settings, BASE_PATH
-from database.user_table import get_users_count, get_verified_count
+from database.user_table import get_users_count, get_verified_count, get_archived_count
 from database.chat_table import get_chats_count
 from database.captcha_table import get_captchas_count
+from database.storage import storage
+from database.shards import shards, hot_storages
+from database.event_table import EventType, EventRollup, get_hourly_rollup, get_chat_rollups
 from utils.helpers import safe_callback_answer
+from utils.metrics import metrics
+from utils.update_scheduler import update_scheduler
+from utils.leader import leader
+from utils.clock import clock
+from utils.loop_watchdog import loop_watchdog
+from utils.update_cost import update_costs
+from utils.blocklist import spammer_blocklist
 
 
 # ~~~~ ROUTER ~~~~
@@ -20,7 +33,10 @@ def get_owner_keyboard() -> InlineKeyboardMarkup:
     """Создание клавиатуры панели владельца"""
     builder = InlineKeyboardBuilder()
     builder.button(text="📊 Статистика", callback_data="owner:stats")
+    builder.button(text="📉 Аналитика капч", callback_data="owner:analytics")
+    builder.button(text="💸 Стоимость обновлений", callback_data="owner:costs")
     builder.button(text="📁 Экспорт БД", callback_data="owner:export_db")
+    builder.button(text="📈 Экспорт метрик", callback_data="owner:export_metrics")
     builder.adjust(1)
     return builder.as_markup()
 
@@ -34,6 +50,95 @@ def get_stats_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+# ~~~~ ANALYTICS TEXT ~~~~
+ANALYTICS_TOP_CHATS = 5
+
+
+def _count(rollups: dict[str, EventRollup], event_type: EventType) -> int:
+    rollup = rollups.get(event_type.value)
+    return rollup.event_count if rollup else 0
+
+
+def _solve_rate(rollups: dict[str, EventRollup]) -> str:
+    issued = _count(rollups, EventType.ISSUED)
+    if not issued:
+        return "—"
+    return f"{_count(rollups, EventType.SOLVED) / issued:.0%}"
+
+
+async def get_analytics_text() -> str:
+    """Аналитика капч по свёрткам событий (сырой журнал не читается)"""
+    since_hour = (clock.now() - timedelta(hours=24)).strftime("%Y-%m-%d %H")
+    last_day = await get_hourly_rollup(since_hour=since_hour)
+    top_chats = await get_chat_rollups(limit=ANALYTICS_TOP_CHATS)
+
+    solved = last_day.get(EventType.SOLVED.value)
+    average_solve = solved.average_duration if solved else None
+
+    text = (
+        "📉 <b>Аналитика капч за 24 часа</b>\n\n"
+        f"📨 <b>Выдано:</b> {_count(last_day, EventType.ISSUED)}\n"
+        f"✅ <b>Решено:</b> {_count(last_day, EventType.SOLVED)} ({_solve_rate(last_day)})\n"
+        f"❌ <b>Неверных ответов:</b> {_count(last_day, EventType.WRONG)}\n"
+        f"🚫 <b>Лимит попыток:</b> {_count(last_day, EventType.MAX_ATTEMPTS)}\n"
+        f"⌛ <b>Истекло:</b> {_count(last_day, EventType.EXPIRED)}\n"
+        f"🛡 <b>Без капчи по доверию:</b> {_count(last_day, EventType.TRUSTED)}\n"
+        f"⏱ <b>Среднее время решения:</b> "
+        f"{f'{average_solve:.1f} с' if average_solve is not None else '—'}\n"
+    )
+
+    if top_chats:
+        text += f"\n💬 <b>Топ-{ANALYTICS_TOP_CHATS} чатов (за всё время):</b>\n"
+        for chat_id, rollups in sorted(
+            top_chats.items(), key=lambda item: _count(item[1], EventType.ISSUED), reverse=True
+        ):
+            failures = (
+                _count(rollups, EventType.MAX_ATTEMPTS) + _count(rollups, EventType.EXPIRED)
+            )
+            text += (
+                f"<code>{chat_id}</code>: выдано {_count(rollups, EventType.ISSUED)}, "
+                f"решено {_solve_rate(rollups)}, не прошли {failures}\n"
+            )
+
+    return text
+
+
+# ~~~~ COSTS TEXT ~~~~
+COSTS_TOP_ROUTES = 8
+
+
+def get_costs_text() -> str:
+    """Самые затратные маршруты обработки обновлений с запуска процесса"""
+    top_routes = update_costs.top(limit=COSTS_TOP_ROUTES)
+    if not top_routes:
+        return "💸 <b>Стоимость обновлений</b>\n\nОбновлений ещё не было"
+
+    text = f"💸 <b>Стоимость обновлений (топ-{COSTS_TOP_ROUTES} по времени)</b>\n"
+    for update_type, route_name, route in top_routes:
+        api_calls = ", ".join(
+            f"{method} {calls / route.updates:.1f}" for method, calls in route.api_calls.most_common(3)
+        )
+        tables = ", ".join(
+            f"{table} {statements / route.updates:.1f}" for table, statements in route.db_statements.most_common(3)
+        )
+        text += (
+            f"\n<b>{update_type}</b> <code>{route_name}</code>\n"
+            f"обновлений {route.updates}, в среднем {route.stages['total'] / route.updates * 1000:.0f} мс "
+            f"(очередь {route.stages['queue'] / route.updates * 1000:.0f}, "
+            f"API {route.stages['api'] / route.updates * 1000:.0f}, "
+            f"БД {route.stages['db'] / route.updates * 1000:.0f})\n"
+            f"API: {api_calls or '—'}\n"
+            f"SQL: {tables or '—'}\n"
+        )
+    return text
+
+
+# ~~~~ EXPORT HELPER ~~~~
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
 # ~~~~ OWNER PANEL ~~~~
 async def show_owner_panel(message: Message) -> None:
     """Показать панель владельца с inline keyboard"""
@@ -62,32 +167,81 @@ async def owner_callback(callback: CallbackQuery) -> None:
     if action == "stats":
         total_users = await get_users_count()
         verified_users = await get_verified_count()
+        archived_users = await get_archived_count()
         total_chats = await get_chats_count()
         active_captchas = await get_captchas_count()
+        db_writes = sum(target.writes for target in hot_storages())
+        db_commits = sum(target.commits for target in hot_storages())
+        current_leader = await leader.get_current()
+        if current_leader is None:
+            leader_text = "нет"
+        elif current_leader.lease_holder == leader.holder_id:
+            leader_text = f"<code>{current_leader.lease_holder}</code> (этот процесс)"
+        else:
+            leader_text = f"<code>{current_leader.lease_holder}</code>"
 
         text = (
             "📊 <b>Статистика бота</b>\n\n"
             f"👥 <b>Пользователей:</b> {total_users}\n"
             f"✅ <b>Верифицировано:</b> {verified_users}\n"
+            f"🗄 <b>В архиве:</b> {archived_users}\n"
             f"💬 <b>Чатов:</b> {total_chats}\n"
-            f"🔒 <b>Активных капч:</b> {active_captchas}"
+            f"🔒 <b>Активных капч:</b> {active_captchas}\n"
+            f"🚫 <b>В блок-листе:</b> {len(spammer_blocklist)}\n\n"
+            f"⚙️ <b>Обработка обновлений:</b> {update_scheduler.active}/{update_scheduler.max_concurrency}\n"
+            f"📥 <b>В очереди:</b> {update_scheduler.queued}\n"
+            f"🗑️ <b>Отброшено:</b> {update_scheduler.shed}\n"
+            f"💾 <b>Записей в БД / коммитов:</b> {db_writes}/{db_commits}\n"
+            f"👑 <b>Лидер фоновых задач:</b> {leader_text}\n"
+            f"⏱ <b>Задержка event loop:</b> {loop_watchdog.lag * 1000:.0f} мс"
+            f"{' (режим деградации)' if loop_watchdog.degraded else ''}"
         )
 
         keyboard = get_stats_keyboard()
         await callback.message.edit_text(text=text, reply_markup=keyboard)
         await safe_callback_answer(callback)
 
+    elif action == "analytics":
+        text = await get_analytics_text()
+        keyboard = get_stats_keyboard()
+        await callback.message.edit_text(text=text, reply_markup=keyboard)
+        await safe_callback_answer(callback)
+
+    elif action == "costs":
+        keyboard = get_stats_keyboard()
+        await callback.message.edit_text(text=get_costs_text(), reply_markup=keyboard)
+        await safe_callback_answer(callback)
+
     elif action == "export_db":
         try:
-            with open(BASE_PATH, "rb") as f:
-                file = BufferedInputFile(file=f.read(), filename="data.db")
+            # В режиме WAL свежие изменения могут быть только в -wal файле
+            await storage.checkpoint(mode="FULL")
+            # Файл БД читается в потоке: синхронное чтение блокировало бы event loop
+            file = BufferedInputFile(file=await asyncio.to_thread(_read_file, BASE_PATH), filename="data.db")
 
             await callback.message.answer_document(document=file, caption="📁 Экспорт базы данных")
+
+            for shard in shards:
+                await shard.checkpoint(mode="FULL")
+                file = BufferedInputFile(
+                    file=await asyncio.to_thread(_read_file, shard.path),
+                    filename=os.path.basename(shard.path),
+                )
+                await callback.message.answer_document(document=file, caption=f"📁 Экспорт шарда {shard.name}")
             await safe_callback_answer(callback, "✅ База данных экспортирована")
         except Exception as e:
             await safe_callback_answer(callback, f"❌ Ошибка при экспорте: {e}", show_alert=True)
             logger.error(f"Error exporting database: {e}")
 
+    elif action == "export_metrics":
+        try:
+            file = BufferedInputFile(file=metrics.render().encode(), filename="metrics.prom")
+            await callback.message.answer_document(document=file, caption="📈 Метрики бота")
+            await safe_callback_answer(callback, "✅ Метрики экспортированы")
+        except Exception as e:
+            await safe_callback_answer(callback, f"❌ Ошибка при экспорте: {e}", show_alert=True)
+            logger.error(f"Error exporting metrics: {e}")
+
     elif action == "main":
         text = (
             "👑 <b>Панель владельца</b>\n\n"
@@ -4,7 +4,7 @@ from aiogram.exceptions import TelegramForbiddenError
 from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from logs.logger import logger
-from database.chat_table import get_chat, update_chat
+from database.chat_table import ChatModel, get_chat, update_chat
 from utils.helpers import is_admin, is_bot_admin, safe_callback_answer
 from config import settings
 
@@ -80,12 +80,7 @@ async def settings_command(message: Message) -> None:
             logger.error(f"[Settings] Error sending message: {e}")
         return
 
-    text = (
-        f"⚙️ <b>Настройки чата: {chat_data.chat_title}</b>\n\n"
-        f"🔹 <b>Капча:</b> {'✅ Включена' if chat_data.chat_captcha_enabled else '❌ Выключена'}\n"
-        f"🔹 <b>Таймаут:</b> {chat_data.chat_captcha_timeout} сек\n"
-        f"🔹 <b>Попыток:</b> {chat_data.chat_max_attempts}"
-    )
+    text = get_settings_text(chat=chat_data)
 
     keyboard = get_settings_keyboard(chat_id=chat.id)
     try:
@@ -96,6 +91,24 @@ async def settings_command(message: Message) -> None:
         logger.error(f"[Settings] Error sending message: {e}")
 
 
+# ~~~~ SETTINGS TEXT ~~~~
+def get_settings_text(chat: ChatModel) -> str:
+    """Текст сообщения настроек чата"""
+    return (
+        f"⚙️ <b>Настройки чата: {chat.chat_title}</b>\n\n"
+        f"🔹 <b>Капча:</b> {'✅ Включена' if chat.chat_captcha_enabled else '❌ Выключена'}\n"
+        f"🔹 <b>Таймаут:</b> {chat.chat_captcha_timeout} сек\n"
+        f"🔹 <b>Попыток:</b> {chat.chat_max_attempts}\n"
+        f"🔹 <b>Ограничение при входе:</b> {'✅ Включено' if chat.chat_restrict_on_join else '❌ Выключено'}\n"
+        f"🔹 <b>Без капчи при доверии ⏭:</b> {_trust_threshold_text(chat.chat_trust_skip_score)}\n"
+        f"🔹 <b>Упрощённая капча при доверии 🪶:</b> {_trust_threshold_text(chat.chat_trust_light_score)}"
+    )
+
+
+def _trust_threshold_text(score: int) -> str:
+    return f"от {score}" if score else "❌ Выключено"
+
+
 # ~~~~ SETTINGS KEYBOARD ~~~~
 def get_settings_keyboard(chat_id: int) -> InlineKeyboardMarkup:
     """Создание клавиатуры настроек"""
@@ -104,6 +117,8 @@ def get_settings_keyboard(chat_id: int) -> InlineKeyboardMarkup:
     builder.button(text="🔔 Вкл/Выкл капчу", callback_data=f"settings:toggle_captcha:{chat_id}")
     builder.button(text="⏱️ Таймаут", callback_data=f"settings:timeout:{chat_id}")
     builder.button(text="🔢 Попытки", callback_data=f"settings:attempts:{chat_id}")
+    builder.button(text="🔐 Вкл/Выкл ограничение при входе", callback_data=f"settings:toggle_restrict:{chat_id}")
+    builder.button(text="🛡 Доверие", callback_data=f"settings:trust:{chat_id}")
     builder.button(text="🗑️ Удалить", callback_data=f"settings:delete:{chat_id}")
 
     builder.adjust(1)
@@ -142,6 +157,23 @@ def get_attempts_keyboard(chat_id: int) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+def get_trust_keyboard(chat_id: int) -> InlineKeyboardMarkup:
+    """Клавиатура выбора порогов доверия (оценка пользователя 0-100)"""
+    builder = InlineKeyboardBuilder()
+
+    # Ряд на каждый порог: ⏭ - без капчи, 🪶 - упрощённая капча
+    for action, icon in (("set_trust_skip", "⏭"), ("set_trust_light", "🪶")):
+        for score in settings.trust_score_options:
+            builder.button(
+                text=f"{icon} {score}" if score else f"{icon} выкл",
+                callback_data=f"settings:{action}:{chat_id}:{score}"
+            )
+
+    builder.adjust(len(settings.trust_score_options))
+    builder.button(text="🔙 Назад", callback_data=f"settings:main:{chat_id}")
+    return builder.as_markup()
+
+
 # ~~~~ SETTINGS CALLBACK HANDLER ~~~~
 @settings_router.callback_query(F.data.startswith("settings:"))
 async def settings_callback(callback: CallbackQuery) -> None:
@@ -208,6 +240,11 @@ async def settings_callback(callback: CallbackQuery) -> None:
         await update_chat(field="chat_captcha_enabled", data=new_value, chat_id=chat_id)
         await safe_callback_answer(callback, f"✅ Капча {'включена' if new_value else 'выключена'}")
 
+    elif action == "toggle_restrict":
+        new_value = 0 if chat.chat_restrict_on_join else 1
+        await update_chat(field="chat_restrict_on_join", data=new_value, chat_id=chat_id)
+        await safe_callback_answer(callback, f"✅ Ограничение при входе {'включено' if new_value else 'выключено'}")
+
     elif action == "timeout":
         keyboard = get_timeout_keyboard(chat_id=chat_id)
         try:
@@ -240,6 +277,27 @@ async def settings_callback(callback: CallbackQuery) -> None:
         await update_chat(field="chat_max_attempts", data=value, chat_id=chat_id)
         await safe_callback_answer(callback, f"✅ Макс. попыток: {value}")
 
+    elif action == "trust":
+        keyboard = get_trust_keyboard(chat_id=chat_id)
+        try:
+            await callback.message.edit_reply_markup(reply_markup=keyboard)
+            await safe_callback_answer(callback)
+        except TelegramForbiddenError:
+            pass
+        except Exception as e:
+            logger.error(f"[Settings] Error editing trust keyboard: {e}")
+        return
+
+    elif action == "set_trust_skip":
+        value = int(parts[3])
+        await update_chat(field="chat_trust_skip_score", data=value, chat_id=chat_id)
+        await safe_callback_answer(callback, f"✅ Без капчи: {f'от {value}' if value else 'выключено'}")
+
+    elif action == "set_trust_light":
+        value = int(parts[3])
+        await update_chat(field="chat_trust_light_score", data=value, chat_id=chat_id)
+        await safe_callback_answer(callback, f"✅ Упрощённая капча: {f'от {value}' if value else 'выключено'}")
+
     elif action == "main":
         keyboard = get_settings_keyboard(chat_id=chat_id)
         try:
@@ -262,12 +320,7 @@ async def settings_callback(callback: CallbackQuery) -> None:
 
     updated_chat = await get_chat(chat_id=chat_id)
 
-    text = (
-        f"⚙️ <b>Настройки чата: {updated_chat.chat_title}</b>\n\n"
-        f"🔹 <b>Капча:</b> {'✅ Включена' if updated_chat.chat_captcha_enabled else '❌ Выключена'}\n"
-        f"🔹 <b>Таймаут:</b> {updated_chat.chat_captcha_timeout} сек\n"
-        f"🔹 <b>Попыток:</b> {updated_chat.chat_max_attempts}"
-    )
+    text = get_settings_text(chat=updated_chat)
 
     keyboard = get_settings_keyboard(chat_id=chat_id)
     try:
@@ -4,9 +4,8 @@ from aiogram.types import Message
 from aiogram.filters import CommandStart
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from config import settings
-from database.user_table import get_user, add_user
+from database.user_table import upsert_user
 from handlers.owner import show_owner_panel
-from utils.time_helpers import get_timestamp
 from logs.logger import logger
 
 
@@ -28,18 +27,16 @@ async def start_command(message: Message) -> None:
         await show_owner_panel(message=message)
         return
 
-    db_user = await get_user(user_id=user_id)
-    if db_user is None:
-        try:
-            db_user = await add_user(
-                user_id=user_id,
-                user_username=user.username or "",
-                user_name=user.full_name,
-                user_first_seen_at=get_timestamp(),
-                user_language=user.language_code or ""
-            )
-        except RuntimeError as e:
-            logger.error(f"[Start] Failed to add user {user_id} to database: {e}")
+    try:
+        await upsert_user(
+            user_id=user_id,
+            user_username=user.username or "",
+            user_name=user.full_name,
+            user_language=user.language_code or "",
+            user_is_premium=1 if user.is_premium else 0
+        )
+    except Exception as e:
+        logger.error(f"[Start] Failed to add user {user_id} to database: {e}")
 
     text = (
         "🤖 <b>Chat Defender Bot</b>\n\n"
@@ -1,13 +1,27 @@
 import asyncio
+import functools
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from logs.logger import logger
 
 from config import settings
-from database.captcha_table import create_db as create_captcha_db, migrate_captcha_table, migrate_captcha_table_v2
-from database.chat_table import create_db as create_chat_db, migrate_chat_table
-from database.user_table import create_db as create_user_db, migrate_user_table
+from database.captcha_table import (
+    create_db as create_captcha_db, migrate_captcha_table, migrate_captcha_table_v2, migrate_captcha_table_v3,
+    migrate_captcha_table_v4, migrate_captcha_table_v5, rebalance_captchas
+)
+from database.chat_table import (
+    create_db as create_chat_db, migrate_chat_table, migrate_chat_table_v2, migrate_chat_table_v3,
+    migrate_chat_table_v4
+)
+from database.user_table import (
+    create_db as create_user_db, migrate_user_table, migrate_user_table_v2, migrate_user_table_v3
+)
+from database.event_table import create_db as create_event_db, migrate_event_table
+from database.lease_table import create_db as create_lease_db
+from database.blocklist_table import create_db as create_blocklist_db
 from handlers.captcha import captcha_router
 from handlers.chat_member import chat_member_router
 from handlers.settings import settings_router
@@ -15,7 +29,30 @@ from handlers.start import start_router
 from handlers.owner import owner_router
 from middleware.verification import VerificationMiddleware
 from middleware.error_handler import ErrorHandlerMiddleware
+from middleware.update_scheduler import UpdateSchedulerMiddleware
+from middleware.slow_update import SlowUpdateMiddleware
+from middleware.update_recorder import UpdateRecorderMiddleware
+from middleware.update_cost import UpdateCostMiddleware, HandlerCostMiddleware, ApiCostMiddleware
 from tasks.cleanup import cleanup_expired_captchas
+from tasks.admin_sync import sync_all_admins
+from tasks.retention import archive_inactive_users_cycle, prune_events_cycle
+from tasks.maintenance import maintain_db, seconds_until_window
+from tasks.trust import update_trust_scores_cycle
+from tasks.blocklist import refresh_blocklist
+from utils.update_scheduler import update_scheduler
+from utils.purge_queue import captcha_purge_queue
+from utils.event_log import event_log
+from utils.last_seen import last_seen_tracker
+from utils.chat_state import chat_states
+from utils.leader import leader
+from utils.supervisor import supervisor
+from utils.loop_watchdog import loop_watchdog
+from utils.notifications import send_deferred_notifications
+from utils.update_recorder import update_recorder
+from utils.update_cost import update_costs
+from utils.blocklist import spammer_blocklist
+from database.shards import hot_storages
+from utils.metrics import metrics
 
 
 # ~~~~ CREATE DATABASES ~~~~
@@ -24,11 +61,24 @@ async def create_databases() -> None:
     await create_user_db()
     await create_captcha_db()
     await create_chat_db()
+    await create_event_db()
+    await create_lease_db()
+    await create_blocklist_db()
 
     await migrate_captcha_table_v2()  # Новая миграция для captcha_id
     await migrate_captcha_table()  # Старая миграция для captcha_attempts
+    await migrate_captcha_table_v3()  # Индекс только по captcha_user_id
+    await migrate_captcha_table_v4()  # captcha_restricted
+    await migrate_captcha_table_v5()  # captcha_created_at
     await migrate_chat_table()
+    await migrate_chat_table_v2()  # chat_restrict_on_join
+    await migrate_chat_table_v3()  # chat_state
+    await migrate_chat_table_v4()  # пороги доверия
     await migrate_user_table()  # Миграция для аналитики (is_premium, rating)
+    await migrate_user_table_v2()  # user_last_seen_at и архив пользователей
+    await migrate_user_table_v3()  # user_trust_score
+    await migrate_event_table()  # подневная свёртка событий по пользователям
+    await rebalance_captchas()  # Открытые капчи - в хранилище их чата (после смены db_shards)
 
     logger.info("All database tables created and migrated")
 
@@ -61,45 +111,141 @@ async def on_shutdown(dispatcher: Dispatcher, bot: Bot) -> None:
         logger.error(f"Failed to send shutdown notification: {e}")
 
 
+# ~~~~ DISPATCHER ~~~~
+def create_dispatcher() -> Dispatcher:
+    """
+    Диспетчер с middleware и роутерами бота (без startup/shutdown и фоновых задач).
+    Роутеры - модульные синглтоны, поэтому вызывается один раз на процесс.
+    """
+    dp = Dispatcher()
+
+    if update_recorder.enabled:
+        dp.update.outer_middleware(UpdateRecorderMiddleware(update_recorder))
+    dp.message.outer_middleware(VerificationMiddleware())
+    dp.update.outer_middleware(UpdateSchedulerMiddleware(update_scheduler))
+    dp.update.outer_middleware(SlowUpdateMiddleware(loop_watchdog, threshold=settings.slow_update_threshold))
+    dp.update.outer_middleware(UpdateCostMiddleware(update_costs))
+    dp.update.outer_middleware(ErrorHandlerMiddleware())
+    # Inner-middleware диспетчера действуют и в дочерних роутерах
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(HandlerCostMiddleware())
+
+    dp.include_router(chat_member_router)
+    dp.include_router(start_router)
+    dp.include_router(settings_router)
+    dp.include_router(captcha_router)
+    dp.include_router(owner_router)
+    return dp
+
+
+# ~~~~ SERVICES ~~~~
+def register_services(bot: Bot) -> None:
+    """
+    Долгоживущие фоновые задачи под супервизором: упавшая перезапускается с backoff.
+    Остаток работы (очередь удаления, буферы) дописывает stop() компонента после
+    остановки супервизора. Сторож event loop работает отдельно: он должен видеть
+    event loop до конца остановки.
+    """
+    supervisor.register_service("leader", leader.run)
+    supervisor.register_service("captcha_purge", functools.partial(captcha_purge_queue.run, bot))
+    supervisor.register_service("event_log", event_log.run)
+    supervisor.register_service("last_seen", last_seen_tracker.run)
+    if update_recorder.enabled:
+        supervisor.register_service("update_recorder", update_recorder.run)
+
+
 # ~~~~ MAIN ~~~~
 async def main() -> None:
     """Главная функция запуска бота"""
+    # Свой сервер Bot API (локальный Bot API или tools/fake_bot_api.py для нагрузочных тестов)
+    session = None
+    if settings.bot_api_url:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.bot_api_url))
+        logger.info(f"[Main] Using Bot API server: {settings.bot_api_url}")
+
     bot = Bot(
         token=settings.bot_token,
+        session=session,
         default=DefaultBotProperties(parse_mode="HTML", link_preview_is_disabled=True),
     )
-    dp = Dispatcher()
-    cleanup_stop_event = asyncio.Event()
+    bot.session.middleware(ApiCostMiddleware())
+    dp = create_dispatcher()
 
     await create_databases()
+    await chat_states.load()
+    await spammer_blocklist.load()
+    # Роль процесса известна до запуска одиночных фоновых задач
+    await leader.start()
+    for target in hot_storages():
+        metrics.register_collector(target.collect_metrics)
+    metrics.register_collector(update_costs.collect_metrics)
 
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
-    dp.message.outer_middleware(VerificationMiddleware())
-    dp.update.outer_middleware(ErrorHandlerMiddleware())
-
-    dp.include_router(chat_member_router)
-    dp.include_router(start_router)
-    dp.include_router(settings_router)
-    dp.include_router(captcha_router)
-    dp.include_router(owner_router)
-
-    cleanup_task = asyncio.create_task(cleanup_expired_captchas(bot, cleanup_stop_event))
+    # Одиночные фоновые задачи: только у лидера, с таймаутом и backoff после ошибок
+    supervisor.register_periodic(
+        "cleanup", cleanup_expired_captchas,
+        interval=settings.cleanup_interval, timeout=60, leader_only=True,
+    )
+    supervisor.register_periodic(
+        "admin_sync", functools.partial(sync_all_admins, bot),
+        interval=settings.admin_sync_interval, timeout=settings.admin_sync_interval, leader_only=True,
+    )
+    supervisor.register_periodic(
+        "retention", archive_inactive_users_cycle,
+        interval=settings.user_retention_interval, timeout=settings.user_retention_interval, leader_only=True,
+    )
+    supervisor.register_periodic(
+        "event_retention", prune_events_cycle,
+        interval=settings.event_retention_interval, timeout=settings.event_retention_interval, leader_only=True,
+    )
+    supervisor.register_periodic(
+        "trust_scores", update_trust_scores_cycle,
+        interval=settings.trust_score_interval, timeout=settings.trust_score_interval, leader_only=True,
+    )
+    supervisor.register_periodic(
+        "maintenance", maintain_db,
+        interval=24 * 3600, timeout=settings.db_maintenance_window + 60,
+        initial_delay=seconds_until_window(), leader_only=True,
+    )
+    # Блок-лист пересобирает лидер, перезагружают в память все процессы
+    supervisor.register_periodic(
+        "blocklist", refresh_blocklist,
+        interval=settings.blocklist_refresh_interval, timeout=settings.blocklist_refresh_interval,
+    )
+    # Уведомления владельцу, отложенные в режиме деградации
+    supervisor.register_periodic(
+        "deferred_notifications", functools.partial(send_deferred_notifications, bot),
+        interval=30, timeout=60,
+    )
+    register_services(bot)
 
     try:
         await bot.delete_webhook(drop_pending_updates=True)
     except Exception as e:
         logger.error(f"[Main] Failed to drop pending updates: {e}")
 
+    loop_watchdog.start()
+    update_scheduler.start()
+    await update_recorder.start(bot_id=bot.id)
+    supervisor.start()
+
     try:
-        await dp.start_polling(bot)
+        # Параллельность обработки ограничивает update_scheduler, а не polling
+        await dp.start_polling(bot, handle_as_tasks=False)
     finally:
-        cleanup_stop_event.set()
-        try:
-            await asyncio.wait_for(cleanup_task, timeout=5.0)
-        except asyncio.TimeoutError:
-            logger.error("[Main] Cleanup task timeout, forcing shutdown")
+        await update_scheduler.stop(timeout=5.0)
+        await update_recorder.stop()
+        await supervisor.stop(timeout=settings.task_shutdown_timeout)
+        await captcha_purge_queue.stop(timeout=5.0)
+        await event_log.stop()
+        await last_seen_tracker.stop()
+        await leader.stop()
+        await loop_watchdog.stop()
+        for target in hot_storages():
+            await target.close(timeout=5.0)
         await bot.session.close()
 
 
@@ -0,0 +1,46 @@
+import time
+from aiogram import BaseMiddleware
+from aiogram.types import Update, TelegramObject
+from typing import Any, Callable, Dict, Awaitable
+from utils.loop_watchdog import LoopWatchdog
+from utils.metrics import metrics
+from logs.logger import logger
+
+
+# ~~~~ SLOW UPDATE MIDDLEWARE ~~~~
+class SlowUpdateMiddleware(BaseMiddleware):
+    """
+    Замер времени обработки обновления.
+
+    Регистрируется после UpdateSchedulerMiddleware, поэтому выполняется уже в воркере
+    планировщика. Сообщает сторожу loop тип обрабатываемого обновления (для отчёта
+    о блокировке) и пишет в лог обновления, обработка которых дольше threshold секунд.
+    """
+
+    def __init__(self, watchdog: LoopWatchdog, threshold: float) -> None:
+        self.watchdog = watchdog
+        self.threshold = threshold
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        update_type = event.event_type
+        self.watchdog.enter_update(update_type)
+        started_at = time.monotonic()
+        try:
+            return await handler(event, data)
+        finally:
+            self.watchdog.exit_update()
+            duration = time.monotonic() - started_at
+            if duration > self.threshold:
+                metrics.inc("slow_updates_total", labels={"type": update_type})
+                logger.warning(
+                    f"[SlowUpdate] Update handled in {duration:.2f}s: "
+                    f"update_id={event.update_id}, update_type={update_type}"
+                )
@@ -0,0 +1,91 @@
+import time
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod, Response
+from aiogram.types import Update, TelegramObject
+from typing import Any, Callable, Dict, Awaitable
+from utils.update_cost import UpdateCost, UpdateCostStats, current_cost, mark_branch
+
+
+# ~~~~ UPDATE COST MIDDLEWARE ~~~~
+class UpdateCostMiddleware(BaseMiddleware):
+    """
+    Учёт стоимости обработки обновления.
+
+    Регистрируется после UpdateSchedulerMiddleware, поэтому выполняется в воркере
+    планировщика. Создаёт UpdateCost текущего обновления: в него пишут вызовы Bot API
+    (ApiCostMiddleware), SQL-выражения (Storage) и ветки маршрута (mark_branch).
+    После обработки стоимость добавляется в статистику по типу обновления и маршруту.
+    """
+
+    def __init__(self, stats: UpdateCostStats) -> None:
+        self.stats = stats
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        cost = UpdateCost(update_type=event.event_type)
+        token = current_cost.set(cost)
+        started_at = time.monotonic()
+        # Время в очереди планировщика (queued_at ставит UpdateSchedulerMiddleware)
+        queue_time = started_at - data.get("queued_at", started_at)
+        try:
+            return await handler(event, data)
+        finally:
+            current_cost.reset(token)
+            self.stats.record(cost, queue_time=queue_time, total_time=time.monotonic() - started_at)
+
+
+# ~~~~ HANDLER COST MIDDLEWARE ~~~~
+class HandlerCostMiddleware(BaseMiddleware):
+    """
+    Отметка обработчика в маршруте обновления.
+
+    Регистрируется inner-middleware на наблюдателях событий диспетчера (message,
+    callback_query, chat_member, ...) и вызывается только для найденного обработчика.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        if handler_object is not None:
+            callback = handler_object.callback
+            mark_branch(f"{callback.__module__}.{callback.__qualname__}")
+        return await handler(event, data)
+
+
+# ~~~~ API COST MIDDLEWARE ~~~~
+class ApiCostMiddleware(BaseRequestMiddleware):
+    """
+    Учёт вызовов Bot API в стоимости текущего обновления.
+
+    Регистрируется на сессии бота (bot.session.middleware). Вызовы вне обработки
+    обновлений (фоновые задачи) не учитываются.
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[Any],
+        bot: Bot,
+        method: TelegramMethod[Any],
+    ) -> Response[Any]:
+        cost = current_cost.get()
+        if cost is None:
+            return await make_request(bot, method)
+
+        cost.api_calls[method.__api_method__] += 1
+        started_at = time.monotonic()
+        try:
+            return await make_request(bot, method)
+        finally:
+            cost.api_time += time.monotonic() - started_at
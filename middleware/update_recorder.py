@@ -0,0 +1,34 @@
+import time
+from aiogram import BaseMiddleware
+from aiogram.types import Update, TelegramObject
+from typing import Any, Callable, Dict, Awaitable
+from utils.update_recorder import UpdateRecorder
+
+
+# ~~~~ UPDATE RECORDER MIDDLEWARE ~~~~
+class UpdateRecorderMiddleware(BaseMiddleware):
+    """
+    Запись входящих обновлений в UpdateRecorder.
+
+    Регистрируется самым внешним middleware (до UpdateSchedulerMiddleware), чтобы
+    в запись попадало время прихода обновления. Обновление записывается после
+    передачи в обработку, запись в файл идёт в фоне.
+    """
+
+    def __init__(self, recorder: UpdateRecorder) -> None:
+        self.recorder = recorder
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        received_at = time.monotonic()
+        try:
+            return await handler(event, data)
+        finally:
+            self.recorder.record(event, received_at)
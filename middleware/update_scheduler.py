@@ -0,0 +1,53 @@
+import time
+from aiogram import BaseMiddleware
+from aiogram.types import Update, TelegramObject
+from typing import Any, Callable, Dict, Awaitable
+from utils.update_scheduler import UpdateScheduler, NO_CHAT_ID
+
+
+# ~~~~ CHAT ID HELPER ~~~~
+def get_update_chat_id(update: Update) -> int:
+    """Получить ID чата, к которому относится обновление"""
+    if update.message is not None:
+        return update.message.chat.id
+    if update.edited_message is not None:
+        return update.edited_message.chat.id
+    if update.callback_query is not None and update.callback_query.message is not None:
+        return update.callback_query.message.chat.id
+    if update.chat_member is not None:
+        return update.chat_member.chat.id
+    if update.my_chat_member is not None:
+        return update.my_chat_member.chat.id
+    if update.chat_join_request is not None:
+        return update.chat_join_request.chat.id
+    return NO_CHAT_ID
+
+
+# ~~~~ UPDATE SCHEDULER MIDDLEWARE ~~~~
+class UpdateSchedulerMiddleware(BaseMiddleware):
+    """
+    Передаёт обработку обновления в UpdateScheduler и сразу возвращает управление.
+
+    Регистрируется самым внешним middleware на dp.update, polling запускается
+    с handle_as_tasks=False - параллельность ограничивает планировщик.
+    """
+
+    def __init__(self, scheduler: UpdateScheduler) -> None:
+        self.scheduler = scheduler
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        # Для учёта времени в очереди (UpdateCostMiddleware)
+        data["queued_at"] = time.monotonic()
+        self.scheduler.submit(
+            chat_id=get_update_chat_id(event),
+            job=lambda: handler(event, data),
+            priority=event.callback_query is not None,
+        )
@@ -1,17 +1,25 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from aiogram import BaseMiddleware
-from aiogram.types import Message, TelegramObject
+from aiogram.types import Message, TelegramObject, User
 from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
 from typing import Any, Callable, Dict, Awaitable
-from aiogram.enums import ChatMemberStatus
 from aiogram.enums.content_type import ContentType
+from config import settings
 from logs.logger import logger
-from database.user_table import get_user, add_user, update_user
-from database.captcha_table import get_captchas_for_user, delete_captcha
+from database.user_table import UserModel, get_user, upsert_user
+from database.captcha_table import get_captchas_for_user
 from database.chat_table import get_chat
 from utils.captcha import send_captcha
-from utils.time_helpers import get_timestamp, is_expired
-from utils.helpers import is_bot_admin
+from utils.helpers import restrict_member
+from utils.time_helpers import is_expired
+from utils.admin_cache import get_chat_admins
+from utils.single_flight import captcha_issue_locks, lookup_flight
+from utils.purge_queue import captcha_purge_queue, PurgeJob
+from utils.last_seen import last_seen_tracker
+from utils.update_cost import mark_branch
+from utils.trust import TrustTier, resolve_trust_tier, trusted_passes
+from utils.blocklist import blocklist_penalties, spammer_blocklist
+from utils.metrics import metrics
 
 
 # Сервисные типы сообщений, которые нужно игнорировать
@@ -72,41 +80,26 @@ class VerificationMiddleware(BaseMiddleware):
 
         bot = data.get("bot")
         if bot is not None:
+            # Админы чата (включая бота) из кэша: проверки прав - поиск в множестве
             try:
-                bot_member = await bot.get_chat_member(chat_id=chat.id, user_id=bot.id)
-                if bot_member.status not in (ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR):
-                    if event.text and (event.text.startswith("/start") or event.text.startswith("/settings")):
-                        return await handler(event, data)
-                    return
+                admins = await get_chat_admins(bot=bot, chat_id=chat.id)
             except TelegramForbiddenError:
                 return
             except Exception as e:
-                logger.error(f"[Verification] Error checking bot admin status: {e}")
-        if bot is not None:
-            try:
-                member = await bot.get_chat_member(chat_id=chat.id, user_id=user.id)
-                if member.status in (ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR):
-                    db_admin = await get_user(user_id=user.id)
-                    if db_admin is None:
-                        try:
-                            db_admin = await add_user(
-                                user_id=user.id,
-                                user_username=user.username or "",
-                                user_name=user.full_name,
-                                user_first_seen_at=get_timestamp(),
-                                user_language=user.language_code or ""
-                            )
-                        except RuntimeError as e:
-                            logger.error(f"[Verification] Failed to add admin {user.id} to database: {e}")
-                            return await handler(event, data)
-                        await update_user(field="user_status", data=1, user_id=user.id)
-                    elif db_admin.user_status != 1:
-                        await update_user(field="user_status", data=1, user_id=user.id)
+                logger.error(f"[Verification] Error loading chat admins: {e}")
+                admins = None
+
+            if admins is not None:
+                if bot.id not in admins:
+                    mark_branch("verification:bot_not_admin")
+                    if event.text and (event.text.startswith("/start") or event.text.startswith("/settings")):
+                        return await handler(event, data)
+                    return
+
+                # Админы верифицируются пачкой при синхронизации
+                if user.id in admins:
+                    mark_branch("verification:admin")
                     return await handler(event, data)
-            except TelegramForbiddenError:
-                return
-            except Exception as e:
-                logger.error(f"[Verification] Error checking admin status: {e}")
 
         if event.sender_chat and event.sender_chat.type == "channel":
             return await handler(event, data)
@@ -117,75 +110,128 @@ class VerificationMiddleware(BaseMiddleware):
         if user.is_bot:
             return await handler(event, data)
 
-        db_user = await get_user(user_id=user.id)
+        # Одновременные сообщения одного пользователя делят один запрос к БД
+        db_user = await lookup_flight.do(("get_or_add_user", user.id), lambda: self._get_or_add_user(user))
 
         if db_user is None:
-            # Получаем аналитические данные о пользователе
-            is_premium = 1 if user.is_premium else 0
-            
-            try:
-                db_user = await add_user(
-                    user_id=user.id,
-                    user_username=user.username or "",
-                    user_name=user.full_name,
-                    user_first_seen_at=get_timestamp(),
-                    user_language=user.language_code or "",
-                    user_is_premium=is_premium
-                )
-                logger.info(
-                    f"[Verification] Added user with analytics: user_id={user.id}, "
-                    f"is_premium={is_premium}"
-                )
-            except RuntimeError as e:
-                logger.error(f"[Verification] Failed to add user {user.id} to database: {e}, skipping message")
-                return
+            logger.error(f"[Verification] Failed to add user {user.id} to database, skipping message")
+            return
+
+        last_seen_tracker.touch(user.id)
 
         if db_user.user_status == 1:
+            mark_branch("verification:verified")
             return await handler(event, data)
 
-        # Получаем все активные капчи для пользователя в этом чате
-        existing_captchas = await get_captchas_for_user(captcha_user_id=user.id, captcha_chat_id=chat.id)
-        
-        if existing_captchas:
-            # Проверяем, есть ли среди них истёкшие
-            expired_captchas = [c for c in existing_captchas if is_expired(c.captcha_expires_at)]
-            active_captchas = [c for c in existing_captchas if not is_expired(c.captcha_expires_at)]
-            
-            # Удаляем истёкшие капчи (сообщения и записи из БД)
-            for expired_captcha in expired_captchas:
-                # Удаляем сообщение капчи
-                try:
-                    await bot.delete_message(chat_id=chat.id, message_id=expired_captcha.captcha_message_id)
-                except (TelegramForbiddenError, TelegramBadRequest, Exception):
-                    pass
-                
-                # Удаляем сообщение пользователя (если есть)
-                if expired_captcha.captcha_user_message_id:
+        # Пользователь из блок-листа: сообщение удаляется без капчи, сам он ограничивается
+        # на blocklist_restrict_seconds. После ограничения - обычная капча (см. BlocklistPenalties)
+        blocklisted = user.id in spammer_blocklist
+        if blocklisted and not blocklist_penalties.served(user_id=user.id, chat_id=chat.id):
+            mark_branch("verification:blocklisted")
+            metrics.inc("blocklist_hits_total", labels={"source": "message"})
+            await self._penalize_blocklisted(event=event, bot=bot)
+            return
+
+        # Проверка и выдача капчи под локом (user_id, chat_id): пачка сообщений
+        # подряд получает одну капчу, остальные сообщения просто удаляются
+        async with captcha_issue_locks.hold((user.id, chat.id)):
+            # Получаем все активные капчи для пользователя в этом чате
+            existing_captchas = await get_captchas_for_user(captcha_user_id=user.id, captcha_chat_id=chat.id)
+
+            if existing_captchas:
+                # Проверяем, есть ли среди них истёкшие
+                expired_captchas = [c for c in existing_captchas if is_expired(c.captcha_expires_at)]
+                active_captchas = [c for c in existing_captchas if not is_expired(c.captcha_expires_at)]
+
+                # Истёкшие капчи удаляются в фоне, решение зависит только от активных
+                for expired_captcha in expired_captchas:
+                    captcha_purge_queue.schedule(PurgeJob(
+                        captcha_id=expired_captcha.captcha_id,
+                        chat_id=chat.id,
+                        message_id=expired_captcha.captcha_message_id,
+                        user_message_id=expired_captcha.captcha_user_message_id,
+                        kick_user_id=user.id if expired_captcha.captcha_restricted else None,
+                        user_id=user.id,
+                    ))
+
+                # Если есть активные капчи - удаляем текущее сообщение пользователя
+                if active_captchas:
+                    mark_branch("verification:captcha_pending")
                     try:
-                        await bot.delete_message(chat_id=chat.id, message_id=expired_captcha.captcha_user_message_id)
+                        await event.delete()
                     except (TelegramForbiddenError, TelegramBadRequest, Exception):
                         pass
-                
-                # Удаляем запись из БД
-                try:
-                    await delete_captcha(captcha_id=expired_captcha.captcha_id)
-                except Exception:
-                    pass
-            
-            # Если есть активные капчи - удаляем текущее сообщение пользователя
-            if active_captchas:
+                    return
+
+            # Пороги доверия чата читаются, только когда капча была бы выдана:
+            # сообщения при активной капче не обращаются к chat_table
+            trust_tier = TrustTier.NONE if blocklisted else await resolve_trust_tier(user=db_user, chat_id=chat.id)
+            if trust_tier != TrustTier.SKIP:
+                # Создаём новую капчу (упрощённую при пороге LIGHT)
+                mark_branch("verification:captcha_issued")
                 try:
-                    await event.delete()
-                except (TelegramForbiddenError, TelegramBadRequest, Exception):
-                    pass
+                    captcha = await send_captcha(message=event, bot=bot, light=trust_tier == TrustTier.LIGHT)
+                    if captcha is not None and trust_tier == TrustTier.LIGHT:
+                        metrics.inc("trust_light_captchas_total")
+                except Exception as e:
+                    logger.error(
+                        f"[Verification] Error sending captcha: user_id={user.id}, chat_id={chat.id}, "
+                        f"error_type={type(e).__name__}, error={e}"
+                    )
                 return
-        
-        # Создаём новую капчу
+
+        # Порог пропуска чата пройден: без капчи в этом чате, обработчик вызывается вне лока
+        mark_branch("verification:trusted")
+        trusted_passes.allow(user_id=user.id, chat_id=chat.id, trust_score=db_user.user_trust_score)
+        return await handler(event, data)
+
+    @staticmethod
+    async def _penalize_blocklisted(event: Message, bot) -> None:
+        """Удалить сообщение пользователя из блок-листа и ограничить его в чате (один раз)"""
+        try:
+            await event.delete()
+        except (TelegramForbiddenError, TelegramBadRequest, Exception):
+            pass
+
+        user_id, chat_id = event.from_user.id, event.chat.id
+        if bot is None or not blocklist_penalties.start(
+            user_id=user_id, chat_id=chat_id, seconds=settings.blocklist_restrict_seconds
+        ):
+            return
+        try:
+            await restrict_member(
+                bot=bot, chat_id=chat_id, user_id=user_id,
+                duration=timedelta(seconds=settings.blocklist_restrict_seconds),
+            )
+            logger.info(f"[Verification] Restricted blocklisted user: user_id={user_id}, chat_id={chat_id}")
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Нет права ограничивать: до конца срока сообщения просто удаляются
+            logger.warning(f"[Verification] Cannot restrict blocklisted user: chat_id={chat_id}, error={e}")
+
+    @staticmethod
+    async def _get_or_add_user(user: User) -> UserModel | None:
+        """Получить пользователя из БД или добавить его. None - если добавить не удалось."""
+        # Горячий путь: известный пользователь - только чтение, без записи на каждое сообщение
+        db_user = await get_user(user_id=user.id)
+        if db_user is not None:
+            return db_user
+
+        # Получаем аналитические данные о пользователе
+        is_premium = 1 if user.is_premium else 0
+
         try:
-            captcha = await send_captcha(message=event, bot=bot)
-            return 
+            db_user = await upsert_user(
+                user_id=user.id,
+                user_username=user.username or "",
+                user_name=user.full_name,
+                user_language=user.language_code or "",
+                user_is_premium=is_premium
+            )
+            logger.info(
+                f"[Verification] Added user with analytics: user_id={user.id}, "
+                f"is_premium={is_premium}"
+            )
+            return db_user
         except Exception as e:
-            logger.error(
-                f"[Verification] Error sending captcha: user_id={user.id}, chat_id={chat.id}, "
-                f"error_type={type(e).__name__}, error={e}"
-            )
\ No newline at end of file
+            logger.error(f"[Verification] Failed to add user {user.id} to database: {e}")
+            return None
@@ -0,0 +1,45 @@
+import asyncio
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+from logs.logger import logger
+from database.chat_table import get_chat_ids
+from utils.admin_cache import sync_chat_admins
+from utils.chat_state import chat_states
+from utils.leader import leader
+
+
+# Пауза между чатами, чтобы не упираться в лимиты Bot API
+CHAT_SYNC_DELAY = 0.1
+
+
+# ~~~~ ADMIN SYNC ~~~~
+async def sync_all_admins(bot: Bot, stop_event: asyncio.Event) -> None:
+    """
+    Один проход синхронизации админов всех чатов
+    (запускается супервизором раз в admin_sync_interval секунд, только у лидера).
+
+    Для каждого активного чата делает один get_chat_administrators, пачкой
+    верифицирует админов в БД и обновляет кэш админов. Остальные реплики
+    загружают админов чата в свой кэш по первому запросу.
+    """
+    chat_ids = await get_chat_ids()
+    synced = 0
+
+    for chat_id in chat_ids:
+        if stop_event.is_set() or not leader.is_leader:
+            break
+
+        try:
+            await sync_chat_admins(bot=bot, chat_id=chat_id)
+            synced += 1
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            await chat_states.handle_api_error(chat_id, e)
+            logger.warning(f"[AdminSync] Cannot sync admins: chat_id={chat_id}, error={e}")
+        except Exception as e:
+            logger.error(
+                f"[AdminSync] Error syncing admins: chat_id={chat_id}, "
+                f"error_type={type(e).__name__}, error={e}"
+            )
+        await asyncio.sleep(CHAT_SYNC_DELAY)
+
+    logger.info(f"[AdminSync] Sync cycle finished: {synced}/{len(chat_ids)} chats")
@@ -0,0 +1,37 @@
+import asyncio
+from datetime import timedelta
+from logs.logger import logger
+from config import settings
+from database.blocklist_table import replace_blocklist
+from database.event_table import get_user_failures
+from utils.blocklist import score_failures, spammer_blocklist
+from utils.time_helpers import get_timestamp
+from utils.clock import clock
+from utils.leader import leader
+
+
+# ~~~~ BLOCKLIST ~~~~
+async def refresh_blocklist(stop_event: asyncio.Event) -> None:
+    """
+    Обновление блок-листа (запускается супервизором раз в blocklist_refresh_interval
+    секунд во всех процессах).
+
+    Лидер пересобирает blocklist_table по подневной свёртке непройденных капч за
+    blocklist_window_days дней: в блок-лист попадают пользователи с оценкой (с затуханием, см. score_failures)
+    не ниже blocklist_threshold в blocklist_min_chats и более чатах. Затем каждый
+    процесс перезагружает блок-лист в память.
+    """
+    if leader.is_leader:
+        now = clock.now()
+        failures = await get_user_failures(since=get_timestamp(now - timedelta(days=settings.blocklist_window_days)))
+        scores = score_failures(failures, now.date(), settings.blocklist_half_life_days)
+        updated_at = get_timestamp(now)
+        rows = [
+            (user_id, round(score, 3), chat_count, updated_at)
+            for user_id, (score, chat_count) in scores.items()
+            if score >= settings.blocklist_threshold and chat_count >= settings.blocklist_min_chats
+        ]
+        size = await replace_blocklist(rows)
+        logger.info(f"[Blocklist] Rebuilt from {sum(row[3] for row in failures)} failed captchas: {size} users")
+
+    await spammer_blocklist.load()
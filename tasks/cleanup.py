@@ -1,112 +1,51 @@
 import asyncio
-from aiosqlite import connect
-from aiogram import Bot
-from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
 from logs.logger import logger
-from config import BASE_PATH
-from database.captcha_table import delete_captcha
+from database.shards import hot_storages
 from utils.time_helpers import get_timestamp
-from utils.notifications import notify_owner_about_error
+from utils.purge_queue import captcha_purge_queue, PurgeJob
 
 
 # ~~~~ CAPTCHA CLEANUP ~~~~
-async def cleanup_expired_captchas(bot: Bot, stop_event: asyncio.Event) -> None:
+async def cleanup_expired_captchas(stop_event: asyncio.Event) -> None:
     """
-    Фоновая задача для удаления истекших капч с graceful shutdown.
-    
-    Для каждой истёкшей капчи:
+    Один проход очистки истекших капч (запускается супервизором раз в 10 секунд, только у лидера).
+
+    Находит истёкшие капчи и передаёт их в очередь удаления captcha_purge_queue,
+    которая для каждой капчи:
     1. Удаляет сообщение капчи из чата
     2. Удаляет сообщение пользователя (если есть)
     3. Удаляет запись из БД
-    
-    При ошибках удаления сообщений логирует детали, но всё равно удаляет запись из БД
-    (чтобы не оставлять "зомби"-записи).
-    """
-    while not stop_event.is_set():
-        now = get_timestamp()
-
-        try:
-            async with connect(BASE_PATH) as db:
-                cursor = await db.execute(
-                    "SELECT captcha_id, captcha_user_id, captcha_chat_id, captcha_message_id, captcha_user_message_id "
-                    "FROM captcha_table WHERE captcha_expires_at < ?",
-                    (now,)
-                )
-                expired_captchas = await cursor.fetchall()
-
-            expired_list = list(expired_captchas)
-            if expired_list:
-                logger.info(f"[Cleanup] Found {len(expired_list)} expired captchas")
-
-            for captcha_id, captcha_user_id, captcha_chat_id, captcha_message_id, captcha_user_message_id in expired_captchas:
-                if stop_event.is_set():
-                    logger.info("[Cleanup] Stop event received, breaking cleanup loop")
-                    break
 
-                # Удаляем сообщение капчи
-                captcha_deleted = False
-                try:
-                    await bot.delete_message(chat_id=captcha_chat_id, message_id=captcha_message_id)
-                    captcha_deleted = True
-                except (TelegramForbiddenError, TelegramBadRequest, Exception) as e:
-                    error_msg = str(e)
-                    logger.error(
-                        f"[Cleanup] Error deleting captcha message: "
-                        f"captcha_id={captcha_id}, chat_id={captcha_chat_id}, message_id={captcha_message_id}, "
-                        f"error={error_msg}"
-                    )
-                    await notify_owner_about_error(
-                        bot=bot,
-                        error_type="cleanup_delete_captcha_failed",
-                        chat_id=captcha_chat_id,
-                        message_id=captcha_message_id,
-                        error_description=f"Failed to delete captcha message: {error_msg}"
-                    )
-
-                # Удаляем сообщение пользователя
-                user_message_deleted = False
-                if captcha_user_message_id:
-                    try:
-                        await bot.delete_message(chat_id=captcha_chat_id, message_id=captcha_user_message_id)
-                        user_message_deleted = True
-                    except (TelegramForbiddenError, TelegramBadRequest, Exception) as e:
-                        error_msg = str(e)
-                        logger.error(
-                            f"[Cleanup] Error deleting user message: "
-                            f"captcha_id={captcha_id}, chat_id={captcha_chat_id}, user_message_id={captcha_user_message_id}, "
-                            f"error={error_msg}"
-                        )
-                        await notify_owner_about_error(
-                            bot=bot,
-                            error_type="cleanup_delete_user_message_failed",
-                            chat_id=captcha_chat_id,
-                            message_id=captcha_user_message_id,
-                            error_description=f"Failed to delete user message: {error_msg}"
-                        )
-
-                # Удаляем запись из БД в любом случае
-                try:
-                    deleted = await delete_captcha(captcha_id=captcha_id)
-                    if deleted:
-                        logger.info(
-                            f"[Cleanup] Deleted captcha record from DB: captcha_id={captcha_id}, "
-                            f"captcha_message_deleted={captcha_deleted}, user_message_deleted={user_message_deleted}"
-                        )
-                    else:
-                        logger.warning(
-                            f"[Cleanup] Captcha record not found in DB (already deleted?): captcha_id={captcha_id}"
-                        )
-                except Exception as e:
-                    logger.error(
-                        f"[Cleanup] Error deleting captcha from DB: "
-                        f"captcha_id={captcha_id}, error_type={type(e).__name__}, error={e}"
-                    )
-
-        except Exception as e:
-            logger.error(f"[Cleanup] Error in cleanup cycle: error_type={type(e).__name__}, error={e}")
-        
-        # Sleep for 10 seconds or until stop_event is set
-        for _ in range(10):
-            if stop_event.is_set():
-                break
-            await asyncio.sleep(1)
\ No newline at end of file
+    Капчи, которые уже поставлены в очередь (например, из VerificationMiddleware)
+    или только что удалены, повторно не удаляются.
+    """
+    now = get_timestamp()
+
+    expired_captchas = []
+    for target in hot_storages():
+        async with target.read() as db:
+            cursor = await db.execute(
+                "SELECT captcha_id, captcha_user_id, captcha_chat_id, captcha_message_id, "
+                "captcha_user_message_id, captcha_restricted "
+                "FROM captcha_table WHERE captcha_expires_at < ?",
+                (now,)
+            )
+            expired_captchas += await cursor.fetchall()
+
+    scheduled = 0
+    for (captcha_id, captcha_user_id, captcha_chat_id, captcha_message_id, captcha_user_message_id,
+         captcha_restricted) in expired_captchas:
+        if stop_event.is_set():
+            break
+        scheduled += captcha_purge_queue.schedule(PurgeJob(
+            captcha_id=captcha_id,
+            chat_id=captcha_chat_id,
+            message_id=captcha_message_id,
+            user_message_id=captcha_user_message_id,
+            notify_on_error=True,
+            kick_user_id=captcha_user_id if captcha_restricted else None,
+            user_id=captcha_user_id,
+        ))
+
+    if expired_captchas:
+        logger.info(f"[Cleanup] Found {len(expired_captchas)} expired captchas, scheduled {scheduled} for purge")
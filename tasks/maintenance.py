@@ -0,0 +1,173 @@
+import asyncio
+from datetime import timedelta
+from aiosqlite import Connection
+from logs.logger import logger
+from config import settings
+from database.storage import Storage, StorageStats
+from database.shards import hot_storages
+from utils.leader import leader
+from utils.clock import clock
+
+
+# Пауза между шагами, чтобы обработчики сообщений успевали писать между ними
+STEP_DELAY = 0.2
+# Строк, которые ANALYZE просматривает в одном индексе (приблизительная статистика)
+ANALYSIS_LIMIT = 1000
+# Режимы PRAGMA auto_vacuum
+AUTO_VACUUM_NONE = 0
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+# ~~~~ HELPERS ~~~~
+def _format_stats(stats: StorageStats) -> str:
+    return (
+        f"file={stats.file_size / 1024 / 1024:.1f}MB, wal={stats.wal_size / 1024 / 1024:.1f}MB, "
+        f"pages={stats.page_count}, freelist={stats.freelist_count} ({stats.free_bytes / 1024 / 1024:.1f}MB), "
+        f"auto_vacuum={stats.auto_vacuum}, cache_size={stats.cache_size}, mmap_size={stats.mmap_size}"
+    )
+
+
+async def _wait_quiet(target: Storage, stop_event: asyncio.Event, deadline: float) -> bool:
+    """
+    Дождаться паузы перед следующим шагом: очередь записи короче db_maintenance_busy_queue.
+
+    Возвращает:
+        bool: False если окно закончилось, бот останавливается или процесс больше не лидер
+    """
+    loop = asyncio.get_running_loop()
+    while not stop_event.is_set() and loop.time() < deadline and leader.is_leader:
+        if target.write_queue_size < settings.db_maintenance_busy_queue:
+            await asyncio.sleep(STEP_DELAY)
+            return not stop_event.is_set() and leader.is_leader
+        await asyncio.sleep(1)
+    return False
+
+
+# ~~~~ STEPS ~~~~
+async def _vacuum_full(db: Connection) -> None:
+    # Перевод существующей БД в INCREMENTAL возможен только полным VACUUM
+    async with db.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}"):
+        pass
+    async with db.execute("VACUUM"):
+        pass
+
+
+async def _incremental_vacuum(db: Connection) -> None:
+    # executescript выполняет прагму до конца: через execute освобождается только одна страница
+    await db.executescript(f"PRAGMA incremental_vacuum({settings.db_maintenance_vacuum_pages});")
+
+
+def _analyze(table: str):
+    async def _op(db: Connection) -> None:
+        async with db.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}"):
+            pass
+        async with db.execute(f'ANALYZE "{table}"'):
+            pass
+    return _op
+
+
+async def _optimize(db: Connection) -> None:
+    async with db.execute("PRAGMA optimize"):
+        pass
+
+
+async def _get_tables(target: Storage) -> list[str]:
+    async with target.read() as db:
+        cursor = await db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )
+        return [row[0] for row in await cursor.fetchall()]
+
+
+# ~~~~ MAINTENANCE ~~~~
+async def run_maintenance(target: Storage, stop_event: asyncio.Event, deadline: float) -> None:
+    """
+    Один проход обслуживания БД небольшими шагами.
+
+    1. Освобождение страниц: incremental_vacuum по db_maintenance_vacuum_pages страниц
+       за шаг (если БД ещё не в режиме INCREMENTAL и файл небольшой - разовый VACUUM)
+    2. ANALYZE по одной таблице с analysis_limit
+    3. PRAGMA optimize
+    4. Checkpoint TRUNCATE, чтобы WAL не занимал место после вакуума
+
+    Каждый шаг - отдельная операция писателя вне транзакции пачки, между шагами
+    задача ждёт затишья в очереди записи. Не успевшие шаги переносятся на следующее окно.
+    """
+    before = await target.stats()
+    logger.info(f"[Maintenance] Started {target.name}: {_format_stats(before)}")
+    started_at = asyncio.get_running_loop().time()
+    vacuumed_pages = 0
+
+    # ~~~~ VACUUM ~~~~
+    if before.auto_vacuum == AUTO_VACUUM_NONE:
+        if before.file_size <= settings.db_maintenance_vacuum_max_size:
+            if not await _wait_quiet(target, stop_event, deadline):
+                return
+            await target.write(_vacuum_full, transaction=False)
+            logger.info(f"[Maintenance] Converted {target.name} to auto_vacuum=INCREMENTAL with full VACUUM")
+        else:
+            logger.warning(
+                f"[Maintenance] auto_vacuum of {target.name} is NONE and file is {before.file_size} bytes, "
+                f"run VACUUM manually to enable incremental vacuum"
+            )
+    else:
+        freelist_count = before.freelist_count
+        while freelist_count > 0:
+            if not await _wait_quiet(target, stop_event, deadline):
+                return
+            await target.write(_incremental_vacuum, transaction=False)
+            remaining = (await target.stats()).freelist_count
+            if remaining >= freelist_count:
+                break
+            vacuumed_pages += freelist_count - remaining
+            freelist_count = remaining
+
+    # ~~~~ ANALYZE ~~~~
+    for table in await _get_tables(target):
+        if not await _wait_quiet(target, stop_event, deadline):
+            return
+        await target.write(_analyze(table), transaction=False)
+
+    if not await _wait_quiet(target, stop_event, deadline):
+        return
+    await target.write(_optimize, transaction=False)
+    await target.checkpoint(mode="TRUNCATE")
+
+    after = await target.stats()
+    elapsed = asyncio.get_running_loop().time() - started_at
+    logger.info(
+        f"[Maintenance] Finished {target.name} in {elapsed:.1f}s: vacuumed_pages={vacuumed_pages}, "
+        f"file_delta={(after.file_size - before.file_size) / 1024 / 1024:+.1f}MB, {_format_stats(after)}"
+    )
+
+
+def seconds_until_window() -> float:
+    """Секунд до начала ближайшего окна обслуживания (0, если окно уже идёт)"""
+    now = clock.now()
+    start = now.replace(hour=settings.db_maintenance_hour, minute=0, second=0, microsecond=0)
+    if start <= now < start + timedelta(seconds=settings.db_maintenance_window):
+        return 0
+    if start <= now:
+        start += timedelta(days=1)
+    return (start - now).total_seconds()
+
+
+async def maintain_db(stop_event: asyncio.Event) -> None:
+    """
+    Обслуживание всех файлов БД в окне db_maintenance_hour
+    (супервизор запускает раз в сутки, первый запуск - в начале ближайшего окна, только у лидера).
+
+    captcha_table живёт в режиме "вставил - удалил через секунды", поэтому без
+    вакуума файл фрагментируется, а без ANALYZE статистика планировщика устаревает.
+    """
+    deadline = asyncio.get_running_loop().time() + settings.db_maintenance_window
+    for target in hot_storages():
+        if stop_event.is_set() or not leader.is_leader:
+            break
+        try:
+            await run_maintenance(target, stop_event, deadline)
+        except Exception as e:
+            logger.error(
+                f"[Maintenance] Error in maintenance pass of {target.name}: "
+                f"error_type={type(e).__name__}, error={e}"
+            )
@@ -0,0 +1,67 @@
+import asyncio
+from datetime import timedelta
+from logs.logger import logger
+from config import settings
+from database.user_table import archive_inactive_users
+from database.event_table import prune_event_log, prune_event_rollups
+from database.shards import hot_storages
+from utils.time_helpers import get_timestamp
+from utils.clock import clock
+from utils.leader import leader
+
+
+# Пауза между пачками, чтобы архивация не занимала писателя БД целиком
+CHUNK_DELAY = 0.5
+
+
+# ~~~~ USER RETENTION ~~~~
+async def archive_inactive_users_cycle(stop_event: asyncio.Event) -> None:
+    """
+    Один проход переноса неактивных неверифицированных пользователей в архив
+    (запускается супервизором раз в user_retention_interval секунд, только у лидера).
+
+    Пользователи без верификации, не появлявшиеся user_retention_days дней,
+    переносятся в user_archive_table пачками по user_retention_chunk.
+    При следующем обращении они прозрачно возвращаются (get_user / upsert_user).
+    """
+    seen_before = get_timestamp(clock.now() - timedelta(days=settings.user_retention_days))
+    archived = 0
+
+    while not stop_event.is_set() and leader.is_leader:
+        moved = await archive_inactive_users(seen_before=seen_before, limit=settings.user_retention_chunk)
+        archived += moved
+        if moved < settings.user_retention_chunk:
+            break
+        await asyncio.sleep(CHUNK_DELAY)
+
+    if archived:
+        logger.info(f"[Retention] Archived {archived} inactive users (seen before {seen_before})")
+
+
+# ~~~~ EVENT RETENTION ~~~~
+async def prune_events_cycle(stop_event: asyncio.Event) -> None:
+    """
+    Один проход удаления старых событий во всех хранилищах (запускается
+    супервизором раз в event_retention_interval секунд, только у лидера).
+
+    Журнал и почасовая свёртка хранятся event_retention_days дней, подневная
+    свёртка по пользователям - не меньше окон оценки доверия и блок-листа.
+    Журнал удаляется пачками по event_retention_chunk.
+    """
+    now = clock.now()
+    log_before = get_timestamp(now - timedelta(days=settings.event_retention_days))
+    daily_days = max(settings.event_retention_days, settings.trust_history_days, settings.blocklist_window_days)
+    # Форматы свёрток - начало timestamp: час YYYY-MM-DD HH, день YYYY-MM-DD
+    daily_before = get_timestamp(now - timedelta(days=daily_days))[:10]
+
+    for target in hot_storages():
+        pruned = await prune_event_rollups(target, before_hour=log_before[:13], before_day=daily_before)
+        while not stop_event.is_set() and leader.is_leader:
+            deleted = await prune_event_log(target, before=log_before, limit=settings.event_retention_chunk)
+            pruned += deleted
+            if deleted < settings.event_retention_chunk:
+                break
+            await asyncio.sleep(CHUNK_DELAY)
+
+        if pruned:
+            logger.info(f"[Retention] Pruned {pruned} old event rows from {target.name}")
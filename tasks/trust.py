@@ -0,0 +1,51 @@
+import asyncio
+from datetime import timedelta
+from logs.logger import logger
+from config import settings
+from database.event_table import get_user_event_history
+from database.user_table import get_unverified_users_chunk, update_trust_scores
+from utils.time_helpers import get_timestamp
+from utils.trust import AGE_SCORES, compute_trust_score
+from utils.clock import clock
+from utils.leader import leader
+
+
+# Пауза между пачками, чтобы пересчёт не занимал писателя БД целиком
+CHUNK_DELAY = 0.5
+
+
+# ~~~~ TRUST SCORES ~~~~
+async def update_trust_scores_cycle(stop_event: asyncio.Event) -> None:
+    """
+    Один проход пересчёта оценок доверия неверифицированных пользователей
+    (запускается супервизором раз в trust_score_interval секунд, только у лидера).
+
+    История капч за trust_history_days дней читается из свёртки событий один раз,
+    пользователи обходятся пачками по trust_score_chunk, в БД пишутся только
+    изменившиеся оценки. Обработчики читают готовую оценку вместе с пользователем.
+    """
+    now = clock.now()
+    history = await get_user_event_history(since=get_timestamp(now - timedelta(days=settings.trust_history_days)))
+    age_cutoffs = [(get_timestamp(now - timedelta(days=days)), points) for days, points in AGE_SCORES]
+
+    after_user_id = 0
+    scored = changed = 0
+    while not stop_event.is_set() and leader.is_leader:
+        users = await get_unverified_users_chunk(after_user_id=after_user_id, limit=settings.trust_score_chunk)
+        if not users:
+            break
+
+        rows = []
+        for user_id, is_premium, language, first_seen_at, old_score in users:
+            score = compute_trust_score(is_premium, language, first_seen_at, history.get(user_id), age_cutoffs)
+            if score != old_score:
+                rows.append((score, user_id))
+        changed += await update_trust_scores(rows)
+        scored += len(users)
+        after_user_id = users[-1][0]
+
+        if len(users) < settings.trust_score_chunk:
+            break
+        await asyncio.sleep(CHUNK_DELAY)
+
+    logger.info(f"[Trust] Scored {scored} unverified users, changed {changed}")
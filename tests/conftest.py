@@ -0,0 +1,8 @@
+import os
+import sys
+
+# config требует переменные окружения бота, для тестов подойдут любые
+os.environ.setdefault("BOT_TOKEN", "0:test")
+os.environ.setdefault("OWNER_ID", "1")
+os.environ.setdefault("BOT_USERNAME", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
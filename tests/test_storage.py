@@ -0,0 +1,44 @@
+import asyncio
+import os
+import tempfile
+from aiosqlite import Connection
+from database.storage import Storage
+
+
+def _storage(base_dir: str) -> Storage:
+    return Storage(
+        path=os.path.join(base_dir, "data.db"),
+        readers=1,
+        checkpoint_interval=300,
+        write_batch_size=16,
+        write_max_latency=0.005,
+        name="test",
+    )
+
+
+def test_cancelled_failing_op_does_not_break_batch() -> None:
+    """Отмена вызывающего во время упавшей операции не откатывает остальные записи пачки"""
+    async def run() -> tuple[object, int]:
+        with tempfile.TemporaryDirectory() as base_dir:
+            storage = _storage(base_dir)
+            await storage.execute("CREATE TABLE t (x INTEGER)")
+
+            async def failing(db: Connection) -> None:
+                await asyncio.sleep(0.1)
+                raise RuntimeError("op failed")
+
+            # Обе операции попадают в одну пачку; вызывающего упавшей отменяют по таймауту
+            failing_write = asyncio.ensure_future(asyncio.wait_for(storage.write(failing), 0.02))
+            good_write = asyncio.ensure_future(storage.execute("INSERT INTO t (x) VALUES (1)"))
+            results = await asyncio.gather(failing_write, good_write, return_exceptions=True)
+
+            async with storage.read() as db:
+                cursor = await db.execute("SELECT COUNT(*) FROM t")
+                count = (await cursor.fetchone())[0]
+            await storage.close()
+            return results, count
+
+    (failing_result, good_result), count = asyncio.run(run())
+    assert isinstance(failing_result, asyncio.TimeoutError)
+    assert not isinstance(good_result, BaseException)
+    assert count == 1
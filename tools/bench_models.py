@@ -0,0 +1,100 @@
+"""
+Бенчмарк моделей строк БД.
+
+Сравнивает для UserModel память на одну закэшированную строку и скорость
+выборки строк из SQLite с построением моделей:
+- сырой кортеж из курсора;
+- обычный датакласс (как модели до slots/frozen);
+- UserModel(*row) - __init__ frozen-датакласса;
+- UserModel.from_row(row) - быстрый конструктор из database.rows.
+
+Запуск из корня репозитория:
+    python tools/bench_models.py --rows 100000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+from dataclasses import fields, make_dataclass
+
+# config требует переменные окружения бота, для бенчмарка подойдут любые
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ.setdefault("OWNER_ID", "1")
+os.environ.setdefault("BOT_USERNAME", "bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.user_table import UserModel, USER_COLUMNS  # noqa: E402
+
+
+# Модель в прежнем виде: обычный датакласс с __dict__ у каждого экземпляра
+PlainUserModel = make_dataclass("PlainUserModel", [(field.name, field.type) for field in fields(UserModel)])
+
+
+# ~~~~ DATA ~~~~
+def _make_db(rows: int) -> sqlite3.Connection:
+    db = sqlite3.connect(":memory:")
+    db.execute(
+        "CREATE TABLE user_table (user_id INTEGER PRIMARY KEY, user_username TEXT, user_name TEXT, "
+        "user_status INTEGER, user_first_seen_at TEXT, user_language TEXT, user_is_premium INTEGER, "
+        "user_last_seen_at TEXT, user_trust_score INTEGER)"
+    )
+    db.executemany(
+        "INSERT INTO user_table VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (user_id, f"user{user_id}", f"User {user_id}", user_id % 2, "2026-01-01 00:00:00", "ru", None,
+             "2026-01-01 00:00:00", 0)
+            for user_id in range(rows)
+        ]
+    )
+    return db
+
+
+def _fetch(db: sqlite3.Connection) -> list[tuple]:
+    return db.execute(f"SELECT {USER_COLUMNS} FROM user_table").fetchall()
+
+
+# ~~~~ BENCH ~~~~
+BUILDERS = {
+    "tuple": lambda rows: rows,
+    "dataclass": lambda rows: [PlainUserModel(*row) for row in rows],
+    "UserModel(*row)": lambda rows: [UserModel(*row) for row in rows],
+    "UserModel.from_row": lambda rows: [UserModel.from_row(row) for row in rows],
+}
+
+
+def _memory_per_row(db: sqlite3.Connection, build, rows: int) -> float:
+    tracemalloc.start()
+    cached = build(_fetch(db))
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del cached
+    return size / rows
+
+
+def _fetch_rate(db: sqlite3.Connection, build, rows: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        build(_fetch(db))
+        best = min(best, time.perf_counter() - started)
+    return rows / best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="строк в таблице")
+    parser.add_argument("--repeat", type=int, default=5, help="повторов выборки, берётся лучший")
+    args = parser.parse_args()
+
+    db = _make_db(args.rows)
+    print(f"{'model':>20} {'bytes/row':>10} {'rows/s':>12}")
+    for name, build in BUILDERS.items():
+        memory = _memory_per_row(db, build, args.rows)
+        rate = _fetch_rate(db, build, args.rows, args.repeat)
+        print(f"{name:>20} {memory:>10.0f} {rate:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
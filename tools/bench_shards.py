@@ -0,0 +1,152 @@
+"""
+Бенчмарк изоляции чатов при шардировании БД.
+
+Имитирует рейд: много одновременных вступлений в один чат (выдача капчи,
+неверный или - с долей --solve-ratio - верный ответ, удаление), и параллельно
+в нескольких других чатах измеряет
+задержку выдачи и удаления капчи. Сравнивает режим одной БД (db_shards = 0)
+и режим с шардами.
+
+Запуск из корня репозитория:
+    python tools/bench_shards.py --shards 4 --duration 10 --solve-ratio 0.5
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# config требует переменные окружения бота, для бенчмарка подойдут любые
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ.setdefault("OWNER_ID", "1")
+os.environ.setdefault("BOT_USERNAME", "bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logs.logger import logger  # noqa: E402
+from database.storage import storage  # noqa: E402
+from database.shards import configure_shards, hot_storages  # noqa: E402
+from database import captcha_table, chat_table, user_table  # noqa: E402
+from utils.time_helpers import get_timestamp  # noqa: E402
+
+
+RAID_CHAT_ID = -1000000000000
+
+
+# ~~~~ WORKLOAD ~~~~
+async def _add(chat_id: int, user_id: int) -> captcha_table.CaptchaModel:
+    return await captcha_table.add_captcha(
+        captcha_user_id=user_id,
+        captcha_chat_id=chat_id,
+        captcha_expires_at=get_timestamp(datetime.now() + timedelta(minutes=5)),
+        captcha_payload=f"{chat_id}:{user_id}:{time.monotonic_ns()}",
+        captcha_message_id=1,
+        captcha_correct_emoji="🍎",
+        captcha_user_message_id=2,
+    )
+
+
+async def _raider(stop: asyncio.Event, user_id: int, solve_ratio: float, counter: list[int]) -> None:
+    while not stop.is_set():
+        captcha = await _add(RAID_CHAT_ID, user_id)
+        # Верный ответ снимает капчи пользователя во всех хранилищах и верифицирует его
+        payload = captcha.captcha_payload if random.random() < solve_ratio else "wrong"
+        resolution = await captcha_table.resolve_captcha(user_id, RAID_CHAT_ID, payload)
+        if resolution.outcome != captcha_table.CaptchaOutcome.SOLVED:
+            await captcha_table.delete_captcha(captcha.captcha_id)
+        counter[0] += 1
+
+
+async def _victim(stop: asyncio.Event, chat_id: int, user_id: int, latencies: list[float]) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        captcha = await _add(chat_id, user_id)
+        await captcha_table.delete_captcha(captcha.captcha_id)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+
+
+def _victim_chats(count: int, shards: int) -> list[int]:
+    """Чаты, которые при шардировании не попадают в шард рейда"""
+    chats = []
+    chat_id = RAID_CHAT_ID - 1
+    while len(chats) < count:
+        if not shards or chat_id % shards != RAID_CHAT_ID % shards:
+            chats.append(chat_id)
+        chat_id -= 1
+    return chats
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] * 1000
+
+
+# ~~~~ RUN ~~~~
+async def run(shards: int, raiders: int, victims: int, duration: float, victim_shards: int, solve_ratio: float) -> dict:
+    with tempfile.TemporaryDirectory() as base_dir:
+        storage.path = os.path.join(base_dir, "data.db")
+        configure_shards(shards, base_dir)
+        await user_table.create_db()
+        await chat_table.create_db()
+        await captcha_table.create_db()
+
+        stop = asyncio.Event()
+        raid_counter = [0]
+        latencies: list[float] = []
+        tasks = [
+            asyncio.create_task(_raider(stop, 10_000 + index, solve_ratio, raid_counter))
+            for index in range(raiders)
+        ]
+        tasks += [
+            asyncio.create_task(_victim(stop, chat_id, 20_000 + index, latencies))
+            for index, chat_id in enumerate(_victim_chats(victims, victim_shards))
+        ]
+
+        await asyncio.sleep(duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+
+        for target in hot_storages():
+            await target.close()
+
+    return {
+        "shards": shards,
+        "raiders": raiders,
+        "raid_ops": raid_counter[0] / duration,
+        "victim_ops": len(latencies) / duration,
+        "p50": _percentile(latencies, 0.50),
+        "p95": _percentile(latencies, 0.95),
+        "p99": _percentile(latencies, 0.99),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=4, help="количество шардов для сравнения")
+    parser.add_argument("--raiders", type=int, default=200, help="одновременных вступлений в чат рейда")
+    parser.add_argument("--victims", type=int, default=8, help="других чатов, в которых меряется задержка")
+    parser.add_argument("--duration", type=float, default=10.0, help="длительность каждого прогона в секундах")
+    parser.add_argument("--solve-ratio", type=float, default=0.5, help="доля верных ответов в рейде (0-1)")
+    args = parser.parse_args()
+
+    logger.remove()
+    results = []
+    for shards in (0, args.shards):
+        for raiders in (0, args.raiders):
+            results.append(await run(shards, raiders, args.victims, args.duration, args.shards, args.solve_ratio))
+
+    print(f"{'shards':>6} {'raiders':>7} {'raid op/s':>10} {'victim op/s':>11} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for result in results:
+        print(
+            f"{result['shards']:>6} {result['raiders']:>7} {result['raid_ops']:>10.0f} {result['victim_ops']:>11.0f} "
+            f"{result['p50']:>8.2f} {result['p95']:>8.2f} {result['p99']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
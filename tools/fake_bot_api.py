@@ -0,0 +1,351 @@
+"""
+Локальный фейковый сервер Telegram Bot API для нагрузочных тестов.
+
+Отвечает на запросы бота по HTTP так же, как api.telegram.org, поэтому бот
+работает через настоящий клиент aiohttp. Поддерживает методы, которыми
+пользуется бот: getMe, getUpdates, getChat, getChatMember,
+getChatAdministrators, sendMessage, editMessageText, sendDocument,
+deleteMessage(s), answerCallbackQuery, restrictChatMember, banChatMember,
+unbanChatMember, deleteWebhook.
+
+Настраивается через аргументы при запуске и через управляющие запросы:
+    POST /control/config  {"latency": 50, "jitter": 20, "method_latency": {"sendMessage": 200},
+                           "errors": [{"code": 429, "rate": 0.05, "method": "sendMessage"}],
+                           "retry_after": 3}
+    POST /control/raid    {"chat_id": -1001, "users": 500, "duration": 10,
+                           "messages": 2, "click_rate": 0.5, "click_delay": 2}
+    GET  /control/stats   счётчики запросов по методам и внедрённых ошибок
+
+Рейд: бот добавляется в чат администратором, затем users пользователей
+вступают в чат за duration секунд и пишут по messages сообщений. На капчу
+(сообщение с кнопками captcha:verify) пользователь с вероятностью click_rate
+через click_delay секунд нажимает случайную кнопку.
+
+Запуск из корня репозитория:
+    python tools/fake_bot_api.py --port 8081 --latency 30 --error 429:0.01 \\
+        --raid=-1001000000001:300:10
+    BOT_API_URL=http://127.0.0.1:8081 python main.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from aiohttp import web
+
+
+# Описания ошибок в формате Bot API
+ERROR_DESCRIPTIONS = {
+    400: "Bad Request: message to delete not found",
+    403: "Forbidden: bot was kicked from the supergroup chat",
+    429: "Too Many Requests: retry after {retry_after}",
+}
+
+OWNER_USER = {"id": 1, "is_bot": False, "first_name": "Owner"}
+FIRST_RAID_USER_ID = 7_000_000_000
+
+
+# ~~~~ ERROR RULE ~~~~
+@dataclass
+class ErrorRule:
+    """
+    Параметры:
+        code (int): код ошибки Bot API (400, 403, 429)
+        rate (float): доля запросов, на которые возвращается ошибка
+        method (str | None): метод Bot API (None - любой, кроме getUpdates)
+    """
+    code: int
+    rate: float
+    method: str | None = None
+
+    @classmethod
+    def parse(cls, value: str) -> "ErrorRule":
+        """Разобрать правило вида [method:]code:rate"""
+        parts = value.split(":")
+        method = parts.pop(0) if len(parts) == 3 else None
+        return cls(code=int(parts[0]), rate=float(parts[1]), method=method)
+
+
+# ~~~~ FAKE BOT API ~~~~
+@dataclass
+class FakeBotAPI:
+    """
+    Состояние фейкового сервера.
+
+    Параметры:
+        latency (float): задержка ответа в миллисекундах
+        jitter (float): случайный разброс задержки в миллисекундах
+        method_latency (dict[str, float]): задержка отдельных методов в миллисекундах
+        errors (list[ErrorRule]): правила внедрения ошибок
+        retry_after (int): retry_after для ошибки 429 в секундах
+        click_rate (float): доля капч, на которые пользователи рейда нажимают кнопку
+        click_delay (float): через сколько секунд после капчи пользователь нажимает кнопку
+    """
+    latency: float = 0.0
+    jitter: float = 0.0
+    method_latency: dict[str, float] = field(default_factory=dict)
+    errors: list[ErrorRule] = field(default_factory=list)
+    retry_after: int = 1
+    click_rate: float = 0.0
+    click_delay: float = 2.0
+
+    updates: list[dict] = field(default_factory=list)
+    next_update_id: int = 1
+    message_ids: Counter = field(default_factory=Counter)
+    requests: Counter = field(default_factory=Counter)
+    injected: Counter = field(default_factory=Counter)
+    new_updates: asyncio.Event = field(default_factory=asyncio.Event)
+    tasks: set[asyncio.Task] = field(default_factory=set)
+
+    # ~~~~ OBJECTS ~~~~
+    @staticmethod
+    def bot_user(token: str) -> dict:
+        bot_id = int(token.split(":")[0])
+        return {"id": bot_id, "is_bot": True, "first_name": "Fake Bot", "username": f"fake_{bot_id}_bot"}
+
+    @staticmethod
+    def chat(chat_id: int) -> dict:
+        if chat_id > 0:
+            return {"id": chat_id, "type": "private", "first_name": f"User {chat_id}"}
+        return {"id": chat_id, "type": "supergroup", "title": f"Chat {chat_id}"}
+
+    @staticmethod
+    def admin_member(user: dict, can_restrict: bool = True) -> dict:
+        return {
+            "status": "administrator", "user": user, "can_be_edited": False, "is_anonymous": False,
+            "can_manage_chat": True, "can_delete_messages": True, "can_manage_video_chats": False,
+            "can_restrict_members": can_restrict, "can_promote_members": False, "can_change_info": False,
+            "can_invite_users": True, "can_post_stories": False, "can_edit_stories": False,
+            "can_delete_stories": False,
+        }
+
+    def message(self, chat_id: int, sender: dict, **fields) -> dict:
+        self.message_ids[chat_id] += 1
+        return {
+            "message_id": self.message_ids[chat_id], "date": int(time.time()),
+            "chat": self.chat(chat_id), "from": sender, **fields,
+        }
+
+    # ~~~~ UPDATES ~~~~
+    def push_update(self, kind: str, payload: dict) -> None:
+        self.updates.append({"update_id": self.next_update_id, kind: payload})
+        self.next_update_id += 1
+        self.new_updates.set()
+
+    async def get_updates(self, offset: int, limit: int, timeout: float) -> list[dict]:
+        # Подтверждённые (update_id < offset) обновления больше не нужны
+        self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates and timeout > 0:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:limit]
+
+    def member_update(self, chat_id: int, user: dict, old: dict, new: dict, kind: str) -> None:
+        self.push_update(kind, {
+            "chat": self.chat(chat_id), "from": OWNER_USER if kind == "my_chat_member" else user,
+            "date": int(time.time()), "old_chat_member": old, "new_chat_member": new,
+        })
+
+    # ~~~~ RAID ~~~~
+    async def raid(
+        self,
+        bot: dict,
+        chat_id: int,
+        users: int,
+        duration: float,
+        messages: int = 1,
+        click_rate: float = 0.0,
+        click_delay: float = 2.0,
+    ) -> None:
+        """Добавить бота администратором в чат и устроить массовое вступление"""
+        self.click_rate = click_rate
+        self.click_delay = click_delay
+        self.member_update(chat_id, bot, {"status": "left", "user": bot}, {"status": "member", "user": bot}, "my_chat_member")
+        self.member_update(chat_id, bot, {"status": "member", "user": bot}, self.admin_member(bot), "my_chat_member")
+        await asyncio.sleep(1)
+
+        first_user_id = FIRST_RAID_USER_ID + abs(chat_id) % 1_000_000 * 1000
+        for index in range(users):
+            user = {"id": first_user_id + index, "is_bot": False, "first_name": f"Raider {index}"}
+            self.member_update(chat_id, user, {"status": "left", "user": user}, {"status": "member", "user": user}, "chat_member")
+            for number in range(messages):
+                self.push_update("message", self.message(chat_id, user, text=f"spam {number}"))
+            await asyncio.sleep(duration / users)
+
+    def maybe_click(self, chat_id: int, message: dict) -> None:
+        """Пользователь нажимает случайную кнопку капчи через click_delay секунд"""
+        keyboard = (message.get("reply_markup") or {}).get("inline_keyboard") or []
+        buttons = [button for row in keyboard for button in row if button.get("callback_data", "").startswith("captcha:verify:")]
+        if not buttons or random.random() >= self.click_rate:
+            return
+
+        button = random.choice(buttons)
+        user_id = int(button["callback_data"].split(":")[3])
+        user = {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+        async def click() -> None:
+            await asyncio.sleep(self.click_delay)
+            self.push_update("callback_query", {
+                "id": str(random.getrandbits(63)), "from": user, "chat_instance": str(chat_id),
+                "message": message, "data": button["callback_data"],
+            })
+
+        task = asyncio.create_task(click())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    # ~~~~ METHODS ~~~~
+    async def call(self, token: str, method: str, params: dict) -> object:
+        bot = self.bot_user(token)
+        chat_id = int(params.get("chat_id", 0) or 0)
+
+        if method == "getMe":
+            return bot
+        if method == "getUpdates":
+            return await self.get_updates(
+                offset=int(params.get("offset", 0) or 0),
+                limit=int(params.get("limit", 100) or 100),
+                timeout=float(params.get("timeout", 0) or 0),
+            )
+        if method == "getChat":
+            return self.chat(chat_id)
+        if method == "getChatMember":
+            user_id = int(params["user_id"])
+            if user_id == bot["id"]:
+                return self.admin_member(bot)
+            return {"status": "member", "user": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}}
+        if method == "getChatAdministrators":
+            return [{"status": "creator", "user": OWNER_USER, "is_anonymous": False}, self.admin_member(bot)]
+        if method in ("sendMessage", "editMessageText", "sendDocument"):
+            reply_markup = params.get("reply_markup")
+            if isinstance(reply_markup, str):
+                reply_markup = json.loads(reply_markup)
+            message = self.message(chat_id, bot, text=params.get("text") or params.get("caption") or "")
+            if reply_markup:
+                message["reply_markup"] = reply_markup
+            if method == "sendMessage":
+                self.maybe_click(chat_id, message)
+            return message
+        if method in (
+            "deleteMessage", "deleteMessages", "answerCallbackQuery", "restrictChatMember",
+            "banChatMember", "unbanChatMember", "deleteWebhook", "setMyCommands",
+        ):
+            return True
+        raise web.HTTPNotFound()
+
+    def injected_error(self, method: str) -> int | None:
+        if method == "getUpdates":
+            return None
+        for rule in self.errors:
+            if (rule.method is None or rule.method == method) and random.random() < rule.rate:
+                return rule.code
+        return None
+
+    async def respond(self, token: str, method: str, params: dict) -> tuple[int, dict]:
+        """Ответ на вызов метода с задержкой и внедрёнными ошибками: (HTTP-статус, тело ответа)"""
+        self.requests[method] += 1
+
+        delay = self.method_latency.get(method, self.latency) + random.uniform(-self.jitter, self.jitter)
+        if delay > 0 and method != "getUpdates":
+            await asyncio.sleep(delay / 1000)
+
+        code = self.injected_error(method)
+        if code is not None:
+            self.injected[f"{method}:{code}"] += 1
+            body = {"ok": False, "error_code": code, "description": ERROR_DESCRIPTIONS[code].format(retry_after=self.retry_after)}
+            if code == 429:
+                body["parameters"] = {"retry_after": self.retry_after}
+            return code, body
+
+        try:
+            result = await self.call(token, method, params)
+        except web.HTTPNotFound:
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found: method not found"}
+        return 200, {"ok": True, "result": result}
+
+    # ~~~~ HTTP ~~~~
+    async def handle_method(self, request: web.Request) -> web.Response:
+        status, body = await self.respond(request.match_info["token"], request.match_info["method"], dict(await request.post()))
+        return web.json_response(body, status=status)
+
+    async def handle_config(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        for name in ("latency", "jitter", "retry_after"):
+            if name in data:
+                setattr(self, name, data[name])
+        if "method_latency" in data:
+            self.method_latency = dict(data["method_latency"])
+        if "errors" in data:
+            self.errors = [ErrorRule(**rule) for rule in data["errors"]]
+        return web.json_response({"ok": True})
+
+    async def handle_raid(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        bot = self.bot_user(data.pop("token", "0:fake"))
+        task = asyncio.create_task(self.raid(bot, **data))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return web.json_response({"ok": True})
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "requests": dict(self.requests),
+            "injected_errors": dict(self.injected),
+            "pending_updates": len(self.updates),
+        })
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/control/config", self.handle_config)
+        app.router.add_post("/control/raid", self.handle_raid)
+        app.router.add_get("/control/stats", self.handle_stats)
+        app.router.add_route("*", "/bot{token}/{method}", self.handle_method)
+        return app
+
+
+# ~~~~ RUN ~~~~
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--token", default="123456:fake", help="токен бота, для которого генерируются рейды")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа в мс")
+    parser.add_argument("--jitter", type=float, default=0.0, help="разброс задержки в мс")
+    parser.add_argument("--error", action="append", default=[], type=ErrorRule.parse,
+                        help="внедрение ошибок: [method:]code:rate, например sendMessage:429:0.05")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after для ошибки 429")
+    parser.add_argument("--raid", action="append", default=[],
+                        help="рейд при старте: chat_id:users:duration[:click_rate]")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(latency=args.latency, jitter=args.jitter, errors=args.error, retry_after=args.retry_after)
+    runner = web.AppRunner(api.build_app())
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.port).start()
+    print(f"Fake Bot API listening on http://{args.host}:{args.port}")
+
+    for raid in args.raid:
+        chat_id, users, duration, *rest = raid.split(":")
+        task = asyncio.create_task(api.raid(
+            api.bot_user(args.token), chat_id=int(chat_id), users=int(users), duration=float(duration),
+            click_rate=float(rest[0]) if rest else 0.0,
+        ))
+        api.tasks.add(task)
+        task.add_done_callback(api.tasks.discard)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,241 @@
+"""
+Воспроизведение записи обновлений (update_record_path) через диспетчер бота.
+
+Обновления из записи подаются в тот же диспетчер, что и в main.py (middleware,
+планировщик, роутеры), с исходными интервалами, ускоренно или без пауз. Bot API
+отвечает фейковая сессия в процессе (логика tools/fake_bot_api.py без HTTP),
+БД - временная. Чаты из записи заранее заводятся в БД с включённой капчей.
+Токены кнопок капчи случайны, поэтому нажатия из записи воспроизводятся как
+нажатия на устаревшую капчу.
+
+Отчёт: пропускная способность, задержка обработки (от подачи до завершения
+обработчика, включая очередь планировщика), SQL-выражения и вызовы Bot API
+на одно обновление и самые затратные маршруты (utils.update_cost). Сравнение
+двух сборок - запуск одной записи на каждой.
+
+Запуск из корня репозитория:
+    python tools/replay_updates.py updates.jsonl.gz --speed 10
+    python tools/replay_updates.py updates.jsonl.gz --speed 0 --api-latency 30
+"""
+import argparse
+import asyncio
+import functools
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict
+
+# config требует переменные окружения бота, для воспроизведения подойдут любые
+os.environ.setdefault("BOT_TOKEN", "0:replay")
+os.environ.setdefault("OWNER_ID", "1")
+os.environ.setdefault("BOT_USERNAME", "replay")
+os.environ.pop("UPDATE_RECORD_PATH", None)
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TOOLS_DIR))
+sys.path.insert(0, TOOLS_DIR)
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.default import DefaultBotProperties  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.types import Update, TelegramObject  # noqa: E402
+from fake_bot_api import FakeBotAPI  # noqa: E402
+from middleware.update_cost import ApiCostMiddleware  # noqa: E402
+import main as bot_main  # noqa: E402
+from config import settings  # noqa: E402
+from logs.logger import logger  # noqa: E402
+from database.storage import storage  # noqa: E402
+from database.shards import configure_shards, hot_storages  # noqa: E402
+from database.chat_table import add_chat  # noqa: E402
+from utils.chat_state import chat_states  # noqa: E402
+from utils.event_log import event_log  # noqa: E402
+from utils.last_seen import last_seen_tracker  # noqa: E402
+from utils.purge_queue import captcha_purge_queue  # noqa: E402
+from utils.supervisor import TaskSupervisor  # noqa: E402
+from utils.update_scheduler import update_scheduler  # noqa: E402
+from utils.update_cost import update_costs  # noqa: E402
+
+
+# ~~~~ FAKE SESSION ~~~~
+class ReplaySession(BaseSession):
+    """Сессия aiogram, отвечающая на вызовы Bot API из FakeBotAPI без HTTP"""
+
+    def __init__(self, api: FakeBotAPI) -> None:
+        super().__init__()
+        self.api = api
+
+    async def make_request(self, bot: Bot, method: Any, timeout: int | None = None) -> Any:
+        # Параметры готовятся так же, как для form-data настоящей сессии
+        params = {}
+        for key, value in method.model_dump(warnings=False).items():
+            value = self.prepare_value(value, bot=bot, files={})
+            if value:
+                params[key] = value
+        status, body = await self.api.respond(bot.token, method.__api_method__, params)
+        response = self.check_response(bot=bot, method=method, status_code=status, content=json.dumps(body))
+        return response.result
+
+    async def stream_content(self, url: str, headers: dict | None = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+# ~~~~ RECORDING ~~~~
+def load_recording(path: str, limit: int | None) -> tuple[int, list[tuple[float, dict]]]:
+    """Прочитать запись: ID бота и список (секунды от начала, обновление)"""
+    bot_id = 0
+    records = []
+    # Запись может состоять из нескольких запусков: время каждого продолжает предыдущий
+    base = last = 0.0
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            item = json.loads(line)
+            if "bot_id" in item:
+                bot_id = item["bot_id"]
+                base = last
+                continue
+            last = base + item["t"]
+            records.append((last, item["update"]))
+            if limit and len(records) >= limit:
+                break
+    return bot_id, records
+
+
+def recorded_chats(records: list[tuple[float, dict]]) -> set[int]:
+    chat_ids = set()
+    for _, update in records:
+        for kind in ("message", "edited_message", "chat_member", "my_chat_member", "chat_join_request"):
+            if kind in update:
+                chat_ids.add(update[kind]["chat"]["id"])
+        message = update.get("callback_query", {}).get("message")
+        if message:
+            chat_ids.add(message["chat"]["id"])
+    return {chat_id for chat_id in chat_ids if chat_id < 0}
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] * 1000
+
+
+# ~~~~ RUN ~~~~
+async def run(path: str, speed: float, limit: int | None, shards: int, api_latency: float) -> None:
+    bot_id, records = load_recording(path, limit)
+    if not records:
+        print("recording is empty")
+        return
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        storage.path = os.path.join(base_dir, "data.db")
+        configure_shards(shards, base_dir)
+
+        api = FakeBotAPI(latency=api_latency)
+        bot = Bot(
+            token=f"{bot_id}:replay",
+            session=ReplaySession(api),
+            default=DefaultBotProperties(parse_mode="HTML", link_preview_is_disabled=True),
+        )
+        bot.session.middleware(ApiCostMiddleware())
+        dp = bot_main.create_dispatcher()
+
+        fed_at: dict[int, float] = {}
+        latencies: list[float] = []
+
+        # Самый внутренний outer-middleware: выполняется в воркере планировщика
+        async def measure(
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+        ) -> Any:
+            try:
+                return await handler(event, data)
+            finally:
+                if isinstance(event, Update) and event.update_id in fed_at:
+                    latencies.append(time.perf_counter() - fed_at.pop(event.update_id))
+
+        dp.update.outer_middleware(measure)
+
+        await bot_main.create_databases()
+        for chat_id in recorded_chats(records):
+            await add_chat(chat_id=chat_id, chat_title="Chat")
+        await chat_states.load()
+
+        update_scheduler.start()
+        supervisor = TaskSupervisor(backoff_base=1.0, backoff_max=settings.task_backoff_max)
+        supervisor.register_service("captcha_purge", functools.partial(captcha_purge_queue.run, bot))
+        supervisor.register_service("event_log", event_log.run)
+        supervisor.register_service("last_seen", last_seen_tracker.run)
+        supervisor.start()
+
+        statements_before = sum(target.statements for target in hot_storages())
+        api.requests.clear()
+        update_costs.routes.clear()
+
+        started = time.perf_counter()
+        first_t = records[0][0]
+        for update_id, (t, data) in enumerate(records, start=1):
+            if speed > 0:
+                delay = (t - first_t) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            # update_id записи могут повторяться между запусками - нумеруем заново
+            update = Update.model_validate({**data, "update_id": update_id}, context={"bot": bot})
+            fed_at[update_id] = time.perf_counter()
+            await dp.feed_update(bot, update)
+
+        while update_scheduler.queued or update_scheduler.active:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+
+        statements = sum(target.statements for target in hot_storages()) - statements_before
+        api_calls = dict(api.requests)
+
+        await update_scheduler.stop()
+        await supervisor.stop(timeout=5.0)
+        await captcha_purge_queue.stop()
+        await event_log.stop()
+        await last_seen_tracker.stop()
+        for target in hot_storages():
+            await target.close()
+
+    count = len(records)
+    print(f"updates:          {count} (recording span {records[-1][0] - first_t:.1f}s, speed {'max' if speed <= 0 else f'{speed}x'})")
+    print(f"elapsed:          {elapsed:.2f}s, {count / elapsed:.0f} updates/s")
+    print(f"latency ms:       p50 {_percentile(latencies, 0.5):.1f}, p95 {_percentile(latencies, 0.95):.1f}, "
+          f"p99 {_percentile(latencies, 0.99):.1f}, max {_percentile(latencies, 1.0):.1f}")
+    print(f"DB statements:    {statements / count:.2f} per update")
+    print(f"API calls:        {sum(api_calls.values()) / count:.2f} per update")
+    for method, calls in sorted(api_calls.items(), key=lambda item: -item[1]):
+        print(f"    {method:<24} {calls / count:.3f}")
+    print("top routes by total time:")
+    for update_type, route_name, route in update_costs.top(limit=10):
+        stages = ", ".join(f"{stage} {seconds / route.updates * 1000:.1f}" for stage, seconds in route.stages.items())
+        tables = ", ".join(f"{table} {n / route.updates:.1f}" for table, n in route.db_statements.most_common(4))
+        print(f"    {update_type} {route_name}")
+        print(f"        updates {route.updates}, avg ms: {stages}")
+        print(f"        API/update {sum(route.api_calls.values()) / route.updates:.2f}, "
+              f"SQL/update {sum(route.db_statements.values()) / route.updates:.2f} ({tables or '-'})")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="файл записи (.jsonl.gz)")
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение относительно записи (0 - без пауз)")
+    parser.add_argument("--limit", type=int, default=None, help="воспроизвести только первые N обновлений")
+    parser.add_argument("--shards", type=int, default=0, help="количество шардов БД")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа Bot API в мс")
+    args = parser.parse_args()
+
+    logger.remove()
+    await run(args.path, args.speed, args.limit, args.shards, args.api_latency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,153 @@
+"""
+Ускоренная симуляция жизненного цикла капч: выдача, истечение, очистка.
+
+Подменяет часы бота на SimulatedClock и прогоняет несколько часов работы
+за секунды: вступления в чаты выдают капчи, периодическая очистка под
+супервизором находит истёкшие и удаляет их через очередь удаления. Бот
+в чатах симуляции считается удалённым, поэтому очередь чистит только БД
+и Bot API не нужен.
+
+Раз в минуту симуляции считается, сколько истёкших капч ждут очистки дольше
+двух периодов cleanup_interval; в исправном конвейере таких нет.
+
+Запуск из корня репозитория:
+    python tools/sim_expiry.py --hours 6 --joins-per-minute 30
+"""
+import argparse
+import asyncio
+import functools
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+# config требует переменные окружения бота, для симуляции подойдут любые
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ.setdefault("OWNER_ID", "1")
+os.environ.setdefault("BOT_USERNAME", "bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logs.logger import logger  # noqa: E402
+from config import settings  # noqa: E402
+from database.storage import storage  # noqa: E402
+from database.shards import configure_shards, hot_storages  # noqa: E402
+from database import captcha_table, chat_table, user_table  # noqa: E402
+from database.chat_table import ChatState  # noqa: E402
+from tasks.cleanup import cleanup_expired_captchas  # noqa: E402
+from utils.clock import clock, SimulatedClock  # noqa: E402
+from utils.chat_state import chat_states  # noqa: E402
+from utils.metrics import metrics  # noqa: E402
+from utils.purge_queue import captcha_purge_queue  # noqa: E402
+from utils.supervisor import TaskSupervisor  # noqa: E402
+from utils.time_helpers import get_timestamp  # noqa: E402
+
+
+FIRST_CHAT_ID = -1000000000000
+
+
+# ~~~~ WORKLOAD ~~~~
+async def _joins(stop: asyncio.Event, chats: int, joins_per_minute: float, timeout: int, issued: list[int]) -> None:
+    interval = 60 / joins_per_minute
+    user_id = 10_000
+    while not stop.is_set():
+        await clock.sleep(interval)
+        user_id += 1
+        chat_id = FIRST_CHAT_ID - user_id % chats
+        await captcha_table.add_captcha(
+            captcha_user_id=user_id,
+            captcha_chat_id=chat_id,
+            captcha_expires_at=get_timestamp(clock.now() + timedelta(seconds=timeout)),
+            captcha_payload=f"{chat_id}:{user_id}",
+            captcha_message_id=1,
+            captcha_correct_emoji="🍎",
+            captcha_user_message_id=2,
+        )
+        issued[0] += 1
+
+
+async def _overdue_count() -> int:
+    overdue_at = get_timestamp(clock.now() - timedelta(seconds=2 * settings.cleanup_interval))
+    count = 0
+    for target in hot_storages():
+        async with target.read() as db:
+            cursor = await db.execute(
+                "SELECT COUNT(*) FROM captcha_table WHERE captcha_expires_at < ?", (overdue_at,)
+            )
+            count += (await cursor.fetchone())[0]
+    return count
+
+
+async def _monitor(stop: asyncio.Event, overdue: list[int]) -> None:
+    while not stop.is_set():
+        await clock.sleep(60)
+        overdue.append(await _overdue_count())
+
+
+# ~~~~ RUN ~~~~
+async def run(hours: float, chats: int, joins_per_minute: float, timeout: int, step: float, settle: float) -> None:
+    simulated = SimulatedClock()
+    clock.use(simulated)
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        storage.path = os.path.join(base_dir, "data.db")
+        configure_shards(0, base_dir)
+        await user_table.create_db()
+        await chat_table.create_db()
+        await captcha_table.create_db()
+        for index in range(chats):
+            await chat_states.set_state(FIRST_CHAT_ID - index, ChatState.KICKED)
+
+        supervisor = TaskSupervisor(backoff_base=1.0, backoff_max=settings.task_backoff_max)
+        supervisor.register_periodic("cleanup", cleanup_expired_captchas, interval=settings.cleanup_interval, timeout=60)
+        supervisor.register_service("captcha_purge", functools.partial(captcha_purge_queue.run, None))
+        supervisor.start()
+
+        stop = asyncio.Event()
+        issued = [0]
+        overdue: list[int] = []
+        workers = [
+            asyncio.create_task(_joins(stop, chats, joins_per_minute, timeout, issued)),
+            asyncio.create_task(_monitor(stop, overdue)),
+        ]
+
+        # Первый проход очистки и запуск задач - до начала симуляции
+        await asyncio.sleep(0.1)
+        started = time.perf_counter()
+        await simulated.run(hours * 3600, step=step, settle=settle)
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await supervisor.stop(timeout=5.0)
+        await captcha_purge_queue.stop(timeout=5.0)
+        remaining = await captcha_table.get_captchas_count()
+
+        for target in hot_storages():
+            await target.close()
+
+    print(f"simulated:      {hours:.1f}h in {elapsed:.1f}s real ({hours * 3600 / elapsed:.0f}x)")
+    print(f"issued:         {issued[0]}")
+    print(f"purged:         {metrics.get('purge_done_total'):.0f}")
+    print(f"left in DB:     {remaining}")
+    print(f"overdue (max):  {max(overdue, default=0)} captchas older than {2 * settings.cleanup_interval}s past expiry")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=6.0, help="сколько часов работы симулировать")
+    parser.add_argument("--chats", type=int, default=20, help="количество чатов")
+    parser.add_argument("--joins-per-minute", type=float, default=30.0, help="вступлений в минуту по всем чатам")
+    parser.add_argument("--timeout", type=int, default=settings.default_captcha_timeout, help="время на капчу в секундах")
+    parser.add_argument("--step", type=float, default=1.0, help="шаг симуляции в секундах")
+    parser.add_argument("--settle", type=float, default=0.05, help="сколько секунд реального времени ждать разбуженную корутину")
+    args = parser.parse_args()
+
+    logger.remove()
+    await run(args.hours, args.chats, args.joins_per_minute, args.timeout, args.step, args.settle)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
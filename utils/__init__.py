@@ -2,6 +2,7 @@ from utils.helpers import is_admin, get_chat_title
 from utils.captcha import send_captcha
 from utils.time_helpers import get_timestamp, parse_timestamp, is_expired
 from utils.rate_limit import RateLimiter, captcha_rate_limiter
+from utils.single_flight import KeyedLock, SingleFlight, captcha_issue_locks, lookup_flight
 
 __all__ = [
     "is_admin",
@@ -12,4 +13,8 @@ __all__ = [
     "is_expired",
     "RateLimiter",
     "captcha_rate_limiter",
+    "KeyedLock",
+    "SingleFlight",
+    "captcha_issue_locks",
+    "lookup_flight",
 ]
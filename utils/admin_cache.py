@@ -0,0 +1,118 @@
+from aiogram import Bot
+from aiogram.types import User
+from config import settings
+from database.user_table import upsert_users
+from database.chat_table import ChatState
+from utils.single_flight import lookup_flight
+from utils.chat_state import chat_states
+from utils.blocklist import spammer_blocklist
+from utils.clock import clock
+from logs.logger import logger
+
+
+# ~~~~ ADMIN CACHE ~~~~
+class AdminCache:
+    """Кэш множеств администраторов по чатам (включая самого бота, если он админ)"""
+
+    def __init__(self, ttl_seconds: int) -> None:
+        self.ttl = ttl_seconds
+        self._admins: dict[int, tuple[set[int], float]] = {}
+
+    def get(self, chat_id: int) -> set[int] | None:
+        """Получить админов чата или None, если кэша нет или он устарел"""
+        entry = self._admins.get(chat_id)
+        if entry is None:
+            return None
+        admins, synced_at = entry
+        if clock.monotonic() - synced_at > self.ttl:
+            return None
+        return admins
+
+    def set(self, chat_id: int, admin_ids: set[int]) -> None:
+        """Заменить множество админов чата"""
+        self._admins[chat_id] = (admin_ids, clock.monotonic())
+
+    def add(self, chat_id: int, user_id: int) -> None:
+        """Добавить админа в уже загруженный кэш чата"""
+        entry = self._admins.get(chat_id)
+        if entry is not None:
+            entry[0].add(user_id)
+
+    def discard(self, chat_id: int, user_id: int) -> None:
+        """Убрать админа из кэша чата"""
+        entry = self._admins.get(chat_id)
+        if entry is not None:
+            entry[0].discard(user_id)
+
+    def forget(self, chat_id: int) -> None:
+        """Удалить кэш чата целиком"""
+        self._admins.pop(chat_id, None)
+
+    def __len__(self) -> int:
+        return len(self._admins)
+
+
+# Глобальный инстанс кэша админов
+admin_cache = AdminCache(ttl_seconds=settings.admin_cache_ttl)
+
+
+# ~~~~ ADMIN SYNC ~~~~
+def _user_row(user: User) -> tuple[int, str, str, str]:
+    return user.id, user.username or "", user.full_name, user.language_code or ""
+
+
+async def sync_chat_admins(bot: Bot, chat_id: int) -> set[int]:
+    """
+    Загрузить админов чата одним get_chat_administrators, верифицировать их в БД
+    одной транзакцией и обновить кэш.
+
+    Параметры:
+        bot (Bot): экземпляр бота
+        chat_id (int): Telegram ID чата
+
+    Возвращает:
+        set[int]: ID админов чата (включая ботов)
+
+    Исключения API (TelegramForbiddenError и т.д.) пробрасываются вызывающему.
+    """
+    members = await bot.get_chat_administrators(chat_id=chat_id)
+
+    admin_ids = {member.user.id for member in members}
+    await upsert_users([_user_row(member.user) for member in members if not member.user.is_bot], user_status=1)
+    spammer_blocklist.discard(admin_ids)
+
+    admin_cache.set(chat_id, admin_ids)
+    # Без админки бот не может удалять сообщения - фоновые задачи пропускают такой чат
+    await chat_states.set_state(chat_id, ChatState.ACTIVE if bot.id in admin_ids else ChatState.NO_RIGHTS)
+    logger.info(f"[AdminSync] Synced admins: chat_id={chat_id}, admins={len(admin_ids)}")
+    return admin_ids
+
+
+async def get_chat_admins(bot: Bot, chat_id: int) -> set[int]:
+    """
+    Админы чата из кэша. При промахе - одна синхронизация на все одновременные запросы.
+
+    Параметры:
+        bot (Bot): экземпляр бота
+        chat_id (int): Telegram ID чата
+
+    Возвращает:
+        set[int]: ID админов чата
+    """
+    admins = admin_cache.get(chat_id)
+    if admins is not None:
+        return admins
+    return await lookup_flight.do(("sync_chat_admins", chat_id), lambda: sync_chat_admins(bot, chat_id))
+
+
+async def mark_admin_promoted(chat_id: int, user: User) -> None:
+    """Учесть повышение пользователя до админа (событие chat_member)"""
+    admin_cache.add(chat_id, user.id)
+    if not user.is_bot:
+        await upsert_users([_user_row(user)], user_status=1)
+        spammer_blocklist.discard([user.id])
+
+
+def mark_admin_demoted(chat_id: int, user_id: int) -> None:
+    """Учесть снятие пользователя с админки (событие chat_member)"""
+    admin_cache.discard(chat_id, user_id)
@@ -0,0 +1,126 @@
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from collections.abc import Iterable
+from datetime import date
+from database.blocklist_table import get_blocklist_ids
+from utils.clock import clock
+from utils.metrics import metrics
+from logs.logger import logger
+
+
+# ~~~~ FAILURE SCORE ~~~~
+def score_failures(
+    failures: list[tuple[int, int, str, int]],
+    today: date,
+    half_life_days: float
+) -> dict[int, tuple[float, int]]:
+    """
+    Оценка непройденных капч пользователей с затуханием.
+
+    Каждая непройденная капча весит 1 в день события и вдвое меньше через
+    каждые half_life_days дней.
+
+    Параметры:
+        failures (list[tuple]): кортежи (user_id, chat_id, day, count) из подневной свёртки событий
+        today (date): текущий день
+        half_life_days (float): период полураспада веса в днях
+
+    Возвращает:
+        dict: user_id -> (оценка, количество разных чатов)
+    """
+    scores: dict[int, float] = {}
+    chats: dict[int, set[int]] = {}
+    for user_id, chat_id, day, count in failures:
+        try:
+            age_days = (today - date.fromisoformat(day)).days
+        except (ValueError, TypeError):
+            continue
+        scores[user_id] = scores.get(user_id, 0.0) + count * 0.5 ** (max(age_days, 0) / half_life_days)
+        chats.setdefault(user_id, set()).add(chat_id)
+    return {user_id: (score, len(chats[user_id])) for user_id, score in scores.items()}
+
+
+# ~~~~ SPAMMER BLOCKLIST ~~~~
+class SpammerBlocklist:
+    """
+    Глобальный блок-лист пользователей, не прошедших капчи в нескольких чатах.
+
+    Собирается лидером из свёртки событий в blocklist_table (tasks/blocklist.py),
+    каждый процесс держит в памяти отсортированный массив ID (8 байт на ID):
+    проверка - бинарный поиск, без обращения к БД. Массив заменяется целиком
+    при перезагрузке, поэтому проверки не видят его частично собранным.
+    """
+
+    def __init__(self) -> None:
+        self._ids = array("q")
+
+        metrics.register_collector(lambda: [("blocklist_size", {}, len(self._ids))])
+
+    def __contains__(self, user_id: int) -> bool:
+        ids = self._ids
+        index = bisect_left(ids, user_id)
+        return index < len(ids) and ids[index] == user_id
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def discard(self, user_ids: Iterable[int]) -> None:
+        """
+        Убрать верифицированных пользователей из блок-листа в памяти, не дожидаясь
+        пересборки (она исключит их и из blocklist_table). Если перезагрузка вернёт
+        их раньше пересборки, проверка верификации в обработчиках идёт первой.
+        """
+        removed = {user_id for user_id in user_ids if user_id in self}
+        if removed:
+            self._ids = array("q", (user_id for user_id in self._ids if user_id not in removed))
+
+    async def load(self) -> None:
+        """Загрузить блок-лист из БД"""
+        ids = array("q", await get_blocklist_ids())
+        if len(ids) != len(self._ids):
+            logger.info(f"[Blocklist] Loaded {len(ids)} users")
+        self._ids = ids
+
+
+# Глобальный инстанс блок-листа
+spammer_blocklist = SpammerBlocklist()
+
+
+# ~~~~ BLOCKLIST PENALTIES ~~~~
+class BlocklistPenalties:
+    """
+    Ограничения пользователей из блок-листа по чатам.
+
+    Пользователь из блок-листа сначала не получает капчу: при входе или первом
+    сообщении он ограничивается на blocklist_restrict_seconds, сообщение удаляется.
+    После окончания ограничения первое сообщение получает обычную капчу - так
+    ошибочно попавший в блок-лист может верифицироваться, а спамер получает не
+    больше одной капчи на срок капчи. Хранится в памяти процесса: после перезапуска
+    ограничение назначается заново.
+    """
+
+    def __init__(self, limit: int = 100_000) -> None:
+        self.limit = limit
+        self._until: OrderedDict[tuple[int, int], float] = OrderedDict()
+
+    def start(self, user_id: int, chat_id: int, seconds: int) -> bool:
+        """Назначить ограничение в чате. False - ограничение уже назначено."""
+        key = (user_id, chat_id)
+        if key in self._until:
+            self._until.move_to_end(key)
+            return False
+
+        self._until[key] = clock.monotonic() + seconds
+        while len(self._until) > self.limit:
+            self._until.popitem(last=False)
+        return True
+
+    def served(self, user_id: int, chat_id: int) -> bool:
+        """Ограничение в чате назначено и закончилось"""
+        until = self._until.get((user_id, chat_id))
+        return until is not None and clock.monotonic() >= until
+
+
+# Глобальный инстанс ограничений блок-листа
+blocklist_penalties = BlocklistPenalties()
@@ -1,17 +1,28 @@
 import secrets
 import random
-from datetime import datetime, timedelta
-from aiogram.types import Message
+from dataclasses import dataclass
+from datetime import timedelta
+from html import escape
+from aiogram import Bot
+from aiogram.types import Message, User, InlineKeyboardMarkup
 from aiogram.exceptions import TelegramForbiddenError
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from database.captcha_table import add_captcha, CaptchaModel
-from database.chat_table import get_chat, add_chat
+from database.chat_table import ChatModel, get_chat, add_chat
+from database.event_table import EventType
 from config import settings
 from utils.helpers import get_chat_title
 from utils.emoji_descriptions import EMOJI_DESCRIPTIONS
+from utils.event_log import event_log
+from utils.clock import clock
+from utils.time_helpers import get_timestamp
 from logs.logger import logger
 
 
+# Кнопок в обычной капче и в упрощённой (для пользователей с доверием, utils/trust.py)
+CAPTCHA_OPTIONS = 6
+LIGHT_CAPTCHA_OPTIONS = 1
+
 CAPTCHA_PROMPTS = [
     "Выберите эмодзи:",
     "Найдите эмодзи:",
@@ -22,10 +33,70 @@ CAPTCHA_PROMPTS = [
 ]
 
 
+# ~~~~ CAPTCHA CHALLENGE ~~~~
+@dataclass
+class CaptchaChallenge:
+    """
+    Параметры:
+        text (str): текст сообщения капчи
+        keyboard (InlineKeyboardMarkup): кнопки с эмодзи
+        expires_at (str): timestamp истечения капчи
+        correct_token (str): токен правильного ответа
+        correct_emoji (str): правильный эмодзи
+    """
+    text: str
+    keyboard: InlineKeyboardMarkup
+    expires_at: str
+    correct_token: str
+    correct_emoji: str
+
+
+def build_captcha(user_id: int, chat_id: int, timeout: int, options: int = CAPTCHA_OPTIONS) -> CaptchaChallenge:
+    """Сгенерировать текст, кнопки (options штук) и правильный ответ капчи"""
+    expires_at = get_timestamp(clock.now() + timedelta(seconds=timeout))
+    correct_token = secrets.token_urlsafe(16)
+    correct_emoji = secrets.SystemRandom().choice(settings.captcha_emojis)
+
+    emoji_options = secrets.SystemRandom().sample(settings.captcha_emojis, k=options)
+    if correct_emoji not in emoji_options:
+        emoji_options[0] = correct_emoji
+    secrets.SystemRandom().shuffle(emoji_options)
+
+    buttons = []
+    for emoji in emoji_options:
+        if emoji == correct_emoji:
+            token = correct_token
+        else:
+            token = secrets.token_urlsafe(16)
+        buttons.append((emoji, f"captcha:verify:{token}:{user_id}:{chat_id}"))
+
+    builder = InlineKeyboardBuilder()
+    for text, callback_data in buttons:
+        builder.button(text=text, callback_data=callback_data)
+    builder.adjust(3)
+    keyboard = builder.as_markup()
+
+    prompt = random.choice(CAPTCHA_PROMPTS)
+    description = EMOJI_DESCRIPTIONS.get(correct_emoji, correct_emoji)
+    text = (
+        f"🔒 <b>Верификация</b>\n\n"
+        f"{prompt} {description}\n"
+        f"У вас есть {timeout} секунд."
+    )
+
+    return CaptchaChallenge(
+        text=text,
+        keyboard=keyboard,
+        expires_at=expires_at,
+        correct_token=correct_token,
+        correct_emoji=correct_emoji,
+    )
+
+
 # ~~~~ SEND CAPTCHA ~~~~
-async def send_captcha(message: Message, bot) -> CaptchaModel | None:
+async def send_captcha(message: Message, bot, light: bool = False) -> CaptchaModel | None:
     """
-    Отправка капчи пользователю.
+    Отправка капчи пользователю (light - упрощённая капча с одной кнопкой).
     
     Returns:
         CaptchaModel: созданная капча
@@ -55,42 +126,17 @@ async def send_captcha(message: Message, bot) -> CaptchaModel | None:
     if chat.chat_captcha_enabled == 0:
         return None
 
-    # Генерируем параметры капчи
-    expires_at = (datetime.now() + timedelta(seconds=chat.chat_captcha_timeout)).strftime("%Y-%m-%d %H:%M:%S")
-    correct_token = secrets.token_urlsafe(16)
-    correct_emoji = secrets.SystemRandom().choice(settings.captcha_emojis)
-
-    emoji_options = secrets.SystemRandom().sample(settings.captcha_emojis, k=6)
-    if correct_emoji not in emoji_options:
-        emoji_options[0] = correct_emoji
-    secrets.SystemRandom().shuffle(emoji_options)
-
-    buttons = []
-    for emoji in emoji_options:
-        if emoji == correct_emoji:
-            token = correct_token
-        else:
-            token = secrets.token_urlsafe(16)
-        buttons.append((emoji, f"captcha:verify:{token}:{user_id}:{chat_id}"))
-
-    builder = InlineKeyboardBuilder()
-    for text, callback_data in buttons:
-        builder.button(text=text, callback_data=callback_data)
-    builder.adjust(3)
-    keyboard = builder.as_markup()
-
-    prompt = random.choice(CAPTCHA_PROMPTS)
-    description = EMOJI_DESCRIPTIONS.get(correct_emoji, correct_emoji)
-    text = (
-        f"🔒 <b>Верификация</b>\n\n"
-        f"{prompt} {description}\n"
-        f"У вас есть {chat.chat_captcha_timeout} секунд."
+    challenge = build_captcha(
+        user_id=user_id,
+        chat_id=chat_id,
+        timeout=chat.chat_captcha_timeout,
+        options=LIGHT_CAPTCHA_OPTIONS if light else CAPTCHA_OPTIONS,
     )
 
     # Отправляем сообщение в Telegram
     captcha_message = None
     try:
-        captcha_message = await message.reply(text=text, reply_markup=keyboard)
+        captcha_message = await message.reply(text=challenge.text, reply_markup=challenge.keyboard)
     except TelegramForbiddenError:
         logger.warning(
             f"[Captcha] TelegramForbiddenError when sending captcha: "
@@ -104,18 +150,86 @@ async def send_captcha(message: Message, bot) -> CaptchaModel | None:
         )
         raise
 
+    return await _save_captcha(
+        captcha_message=captcha_message,
+        challenge=challenge,
+        user_id=user_id,
+        chat_id=chat_id,
+        user_message_id=user_message_id,
+    )
+
+
+# ~~~~ SEND JOIN CAPTCHA ~~~~
+async def send_join_captcha(bot: Bot, chat: ChatModel, user: User) -> CaptchaModel | None:
+    """
+    Отправка капчи новому участнику в режиме ограничения при входе.
+
+    Капча отправляется в чат с упоминанием пользователя (без reply, пользователь
+    ещё ничего не написал) и помечается как captcha_restricted.
+
+    Returns:
+        CaptchaModel: созданная капча
+        None: если отправка не удалась
+
+    Raises:
+        RuntimeError: если не удалось сохранить капчу в БД (после успешной отправки в Telegram)
+    """
+    challenge = build_captcha(user_id=user.id, chat_id=chat.chat_id, timeout=chat.chat_captcha_timeout)
+    mention = f'<a href="tg://user?id={user.id}">{escape(user.full_name)}</a>'
+
+    try:
+        captcha_message = await bot.send_message(
+            chat_id=chat.chat_id,
+            text=f"{mention}\n{challenge.text}",
+            reply_markup=challenge.keyboard
+        )
+    except TelegramForbiddenError:
+        logger.warning(
+            f"[Captcha] TelegramForbiddenError when sending join captcha: "
+            f"chat_id={chat.chat_id}, user_id={user.id}"
+        )
+        return None
+    except Exception as e:
+        logger.error(
+            f"[Captcha] Error sending join captcha to Telegram: "
+            f"chat_id={chat.chat_id}, user_id={user.id}, error={e}"
+        )
+        return None
+
+    return await _save_captcha(
+        captcha_message=captcha_message,
+        challenge=challenge,
+        user_id=user.id,
+        chat_id=chat.chat_id,
+        user_message_id=None,
+        restricted=1,
+    )
+
+
+# ~~~~ SAVE CAPTCHA ~~~~
+async def _save_captcha(
+    captcha_message: Message,
+    challenge: CaptchaChallenge,
+    user_id: int,
+    chat_id: int,
+    user_message_id: int | None,
+    restricted: int = 0
+) -> CaptchaModel:
+    """Сохранить отправленную капчу в БД, при ошибке БД удалить сообщение капчи из чата"""
     # Сохраняем в БД
     try:
         captcha = await add_captcha(
             captcha_user_id=user_id,
             captcha_chat_id=chat_id,
-            captcha_expires_at=expires_at,
-            captcha_payload=correct_token,
+            captcha_expires_at=challenge.expires_at,
+            captcha_payload=challenge.correct_token,
             captcha_message_id=captcha_message.message_id,
-            captcha_correct_emoji=correct_emoji,
+            captcha_correct_emoji=challenge.correct_emoji,
             captcha_user_message_id=user_message_id,
-            captcha_attempts=0
+            captcha_attempts=0,
+            captcha_restricted=restricted
         )
+        event_log.record(EventType.ISSUED, chat_id=chat_id, user_id=user_id)
         return captcha
         
     except RuntimeError as e:
@@ -0,0 +1,109 @@
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest, TelegramMigrateToChat
+from database.chat_table import ChatState, update_chat, get_inactive_chat_states, move_chat
+from utils.metrics import metrics
+from logs.logger import logger
+
+
+# Фрагменты описаний ошибок Bot API, по которым определяется состояние чата
+_KICKED_ERRORS = ("chat not found", "bot was kicked", "group chat was deactivated", "bot is not a member")
+_NO_RIGHTS_ERRORS = ("not enough rights", "have no rights", "chat_admin_required", "need administrator rights")
+
+
+# ~~~~ CHAT STATE REGISTRY ~~~~
+class ChatStateRegistry:
+    """
+    Состояния чатов в памяти процесса.
+
+    Хранит только неактивные чаты, поэтому проверка is_active - поиск в словаре.
+    Изменения сразу сохраняются в chat_table.
+    """
+
+    def __init__(self) -> None:
+        self._inactive: dict[int, str] = {}
+
+        metrics.register_collector(self.collect_metrics)
+
+    async def load(self) -> None:
+        """Загрузить состояния неактивных чатов из БД"""
+        self._inactive = await get_inactive_chat_states()
+        logger.info(f"[ChatState] Loaded {len(self._inactive)} inactive chats")
+
+    def is_active(self, chat_id: int) -> bool:
+        """Можно ли обращаться к чату через Bot API"""
+        return chat_id not in self._inactive
+
+    def get(self, chat_id: int) -> ChatState:
+        """Текущее состояние чата"""
+        return ChatState(self._inactive.get(chat_id, ChatState.ACTIVE.value))
+
+    async def set_state(self, chat_id: int, state: ChatState) -> None:
+        """Изменить состояние чата (в памяти и в БД)"""
+        if self.get(chat_id) == state:
+            return
+
+        if state == ChatState.ACTIVE:
+            self._inactive.pop(chat_id, None)
+        else:
+            self._inactive[chat_id] = state.value
+
+        try:
+            await update_chat(field="chat_state", data=state.value, chat_id=chat_id)
+        except Exception as e:
+            logger.error(f"[ChatState] Failed to save chat state: chat_id={chat_id}, error={e}")
+        logger.info(f"[ChatState] Chat state changed: chat_id={chat_id}, state={state.value}")
+
+    async def migrate(self, old_chat_id: int, new_chat_id: int) -> None:
+        """Перенести чат на новый ID (группа стала супергруппой)"""
+        try:
+            await move_chat(old_chat_id=old_chat_id, new_chat_id=new_chat_id)
+        except Exception as e:
+            logger.error(
+                f"[ChatState] Failed to move chat: old_chat_id={old_chat_id}, new_chat_id={new_chat_id}, error={e}"
+            )
+            return
+        self._inactive[old_chat_id] = ChatState.MIGRATED.value
+        self._inactive.pop(new_chat_id, None)
+        logger.info(f"[ChatState] Chat migrated: old_chat_id={old_chat_id}, new_chat_id={new_chat_id}")
+
+    async def handle_api_error(self, chat_id: int, error: Exception) -> bool:
+        """
+        Обновить состояние чата по ошибке Bot API.
+
+        Параметры:
+            chat_id (int): Telegram ID чата, в котором произошла ошибка
+            error (Exception): исключение запроса
+
+        Возвращает:
+            bool: True если ошибка означает, что чат больше не активен
+        """
+        # Положительные ID - личные чаты, Forbidden там значит блокировку пользователем
+        if chat_id >= 0:
+            return False
+
+        if isinstance(error, TelegramMigrateToChat):
+            await self.migrate(old_chat_id=chat_id, new_chat_id=error.migrate_to_chat_id)
+            return True
+
+        description = str(error).lower()
+        if isinstance(error, TelegramForbiddenError) or (
+            isinstance(error, TelegramBadRequest) and any(text in description for text in _KICKED_ERRORS)
+        ):
+            await self.set_state(chat_id, ChatState.KICKED)
+            return True
+
+        if isinstance(error, TelegramBadRequest) and any(text in description for text in _NO_RIGHTS_ERRORS):
+            await self.set_state(chat_id, ChatState.NO_RIGHTS)
+            return True
+
+        return False
+
+    def collect_metrics(self) -> list[tuple[str, dict[str, str], float]]:
+        """Количество неактивных чатов по состояниям"""
+        counts = {state.value: 0 for state in ChatState if state != ChatState.ACTIVE}
+        for state in self._inactive.values():
+            counts[state] = counts.get(state, 0) + 1
+        return [("chats_inactive", {"state": state}, count) for state, count in counts.items()]
+
+
+# Глобальный инстанс реестра состояний чатов
+chat_states = ChatStateRegistry()
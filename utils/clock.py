@@ -0,0 +1,191 @@
+import asyncio
+import heapq
+from abc import ABC, abstractmethod
+import itertools
+import time
+from datetime import datetime, timedelta
+
+
+# ~~~~ CLOCK ~~~~
+class Clock(ABC):
+    """
+    Источник времени для логики, зависящей от времени: истечение капч, очистка,
+    периодические задачи, аренда лидера, лимиты.
+
+    Задержки-троттлинги (паузы между запросами к API и БД) и замеры производительности
+    (задержка loop, время обработки) сюда не относятся и идут по реальному времени.
+    """
+
+    @abstractmethod
+    def now(self) -> datetime:
+        """Текущее локальное время"""
+
+    @abstractmethod
+    def time(self) -> float:
+        """Текущее unix-время"""
+
+    @abstractmethod
+    def monotonic(self) -> float:
+        """Монотонное время для интервалов"""
+
+    @abstractmethod
+    async def sleep(self, delay: float) -> None:
+        """Подождать delay секунд"""
+
+    async def wait(self, event: asyncio.Event, timeout: float | None) -> bool:
+        """
+        Ждать event не дольше timeout секунд.
+
+        Возвращает:
+            bool: установлен ли event
+        """
+        if event.is_set() or timeout is not None and timeout <= 0:
+            return event.is_set()
+
+        waiter = asyncio.ensure_future(event.wait())
+        sleeper = asyncio.ensure_future(self.sleep(timeout)) if timeout is not None else None
+        try:
+            await asyncio.wait([f for f in (waiter, sleeper) if f is not None], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for future in (waiter, sleeper):
+                if future is not None:
+                    future.cancel()
+        return event.is_set()
+
+
+class RealClock(Clock):
+    """Реальное время (по умолчанию)"""
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    async def sleep(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+
+    async def wait(self, event: asyncio.Event, timeout: float | None) -> bool:
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return event.is_set()
+
+
+class SimulatedClock(Clock):
+    """
+    Управляемое время для бенчмарков и проверки сценариев с истечением.
+
+    Время стоит на месте, пока его не сдвинут через advance(). Корутины, ждущие
+    в sleep(), просыпаются в порядке своих дедлайнов, и каждая видит время своего
+    дедлайна, поэтому часы работы бота прогоняются за секунды.
+    """
+
+    def __init__(self, start: datetime | None = None) -> None:
+        self._start = start or datetime.now()
+        self._elapsed = 0.0
+        self._sleepers: list[tuple[float, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._sleeping = 0
+
+    def now(self) -> datetime:
+        return self._start + timedelta(seconds=self._elapsed)
+
+    def time(self) -> float:
+        return self._start.timestamp() + self._elapsed
+
+    def monotonic(self) -> float:
+        return self._elapsed
+
+    async def sleep(self, delay: float) -> None:
+        if delay <= 0:
+            await asyncio.sleep(0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self._elapsed + delay, next(self._counter), future))
+        self._sleeping += 1
+        try:
+            await future
+        finally:
+            self._sleeping -= 1
+
+    async def _settle(self, sleeping: int, settle: float) -> None:
+        """Дождаться, пока разбуженная корутина снова уснёт (не дольше settle секунд реального времени)"""
+        await asyncio.sleep(0)
+        deadline = time.monotonic() + settle
+        while self._sleeping < sleeping and time.monotonic() < deadline:
+            # Корутина ждёт ввода-вывода (запрос к БД в потоке) - отдаём время реально
+            await asyncio.sleep(0.0001)
+
+    async def advance(self, seconds: float, settle: float = 0.05) -> int:
+        """
+        Сдвинуть время на seconds секунд, по пути разбудив уснувшие корутины.
+
+        После каждого пробуждения время не сдвигается дальше, пока разбуженная
+        корутина не уснёт снова: так её запросы к БД выполняются в «своё» время.
+
+        Параметры:
+            seconds (float): на сколько секунд сдвинуть время
+            settle (float): сколько секунд реального времени ждать разбуженную корутину
+                (корутины, которые больше не засыпают, задерживают симуляцию на это время)
+
+        Возвращает:
+            int: сколько корутин разбужено
+        """
+        # Дать только что созданным задачам дойти до первого sleep()
+        await asyncio.sleep(0)
+        target = self._elapsed + seconds
+        woken = 0
+        while self._sleepers and self._sleepers[0][0] <= target:
+            deadline, _, future = heapq.heappop(self._sleepers)
+            if future.done():
+                continue
+            sleeping = self._sleeping
+            self._elapsed = max(self._elapsed, deadline)
+            future.set_result(None)
+            woken += 1
+            await self._settle(sleeping, settle)
+        self._elapsed = target
+        return woken
+
+    async def run(self, seconds: float, step: float = 1.0, settle: float = 0.05) -> None:
+        """Прогнать seconds секунд шагами по step секунд"""
+        remaining = seconds
+        while remaining > 0:
+            await self.advance(min(step, remaining), settle=settle)
+            remaining -= step
+
+
+class SwitchableClock(Clock):
+    """Часы бота: передают вызовы установленной реализации (по умолчанию RealClock)"""
+
+    def __init__(self, impl: Clock) -> None:
+        self.impl = impl
+
+    def use(self, impl: Clock) -> Clock:
+        """Установить реализацию часов. Возвращает предыдущую."""
+        previous, self.impl = self.impl, impl
+        return previous
+
+    def now(self) -> datetime:
+        return self.impl.now()
+
+    def time(self) -> float:
+        return self.impl.time()
+
+    def monotonic(self) -> float:
+        return self.impl.monotonic()
+
+    async def sleep(self, delay: float) -> None:
+        await self.impl.sleep(delay)
+
+    async def wait(self, event: asyncio.Event, timeout: float | None) -> bool:
+        return await self.impl.wait(event, timeout)
+
+
+# Глобальные часы бота (в бенчмарках подменяются через clock.use(SimulatedClock()))
+clock = SwitchableClock(RealClock())
@@ -0,0 +1,118 @@
+import asyncio
+from database.event_table import EventModel, EventType, add_events
+from utils.clock import clock
+from utils.loop_watchdog import loop_watchdog
+from utils.metrics import metrics
+from utils.time_helpers import get_timestamp, parse_timestamp
+from logs.logger import logger
+
+
+# ~~~~ EVENT LOG ~~~~
+class EventLog:
+    """
+    Буфер событий капчи.
+
+    record() только добавляет событие в память и не трогает БД, поэтому его можно
+    вызывать в обработчиках. Фоновая задача раз в flush_interval секунд (или при
+    наборе batch_size событий) пишет пачку в журнал вместе со свёртками.
+    """
+
+    def __init__(self, flush_interval: float = 5.0, batch_size: int = 500, buffer_limit: int = 50_000) -> None:
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.buffer_limit = buffer_limit
+        self._buffer: list[EventModel] = []
+        self._flush_requested = asyncio.Event()
+
+        metrics.register_collector(lambda: [("event_log_buffer_size", {}, len(self._buffer))])
+
+    # ~~~~ RECORD ~~~~
+    def record(
+        self,
+        event_type: EventType,
+        chat_id: int,
+        user_id: int | None = None,
+        started_at: str | None = None
+    ) -> None:
+        """
+        Записать событие в буфер.
+
+        Параметры:
+            event_type (EventType): тип события
+            chat_id (int): Telegram ID чата
+            user_id (int | None): Telegram ID пользователя
+            started_at (str | None): timestamp выдачи капчи, для расчёта длительности
+        """
+        created_at = get_timestamp()
+        duration = None
+        if started_at:
+            try:
+                duration = (parse_timestamp(created_at) - parse_timestamp(started_at)).total_seconds()
+            except (ValueError, TypeError):
+                pass
+
+        if len(self._buffer) >= self.buffer_limit:
+            # БД не успевает - теряем событие, но не растим память без предела
+            metrics.inc("events_dropped_total")
+            return
+
+        self._buffer.append(EventModel(
+            event_type=event_type.value,
+            event_user_id=user_id,
+            event_chat_id=chat_id,
+            event_created_at=created_at,
+            event_duration=duration,
+        ))
+        metrics.inc("events_recorded_total", labels={"type": event_type.value})
+
+        if len(self._buffer) >= self.batch_size:
+            self._flush_requested.set()
+
+    # ~~~~ FLUSH ~~~~
+    async def flush(self) -> int:
+        """Записать накопленные события в БД"""
+        if not self._buffer:
+            return 0
+
+        events, self._buffer = self._buffer, []
+        failed: list[EventModel] = []
+        # Пачками по batch_size: накопленный буфер не уходит в БД одной операцией записи
+        for start in range(0, len(events), self.batch_size):
+            chunk = events[start:start + self.batch_size]
+            try:
+                failed += await add_events(chunk)
+            except Exception as e:
+                logger.error(
+                    f"[EventLog] Failed to write {len(events) - start} events: "
+                    f"error_type={type(e).__name__}, error={e}"
+                )
+                # Остаток не пишем: следующая попытка - при следующей записи
+                failed += events[start:]
+                break
+
+        if failed:
+            # Возвращаем в начало буфера только незаписанные события, запишем в следующий раз
+            self._buffer[:0] = failed[:max(self.buffer_limit - len(self._buffer), 0)]
+        return len(events) - len(failed)
+
+    async def run(self, stop_event: asyncio.Event) -> None:
+        """Фоновая запись событий (сервис супервизора)"""
+        while not stop_event.is_set():
+            await clock.wait(self._flush_requested, self.flush_interval)
+            self._flush_requested.clear()
+            # В режиме деградации аналитика ждёт, пока буфер не заполнится наполовину
+            if loop_watchdog.degraded and len(self._buffer) < self.buffer_limit // 2:
+                continue
+            # shield: остановка не обрывает уже начатую запись пачки
+            await asyncio.shield(self.flush())
+
+    # ~~~~ LIFECYCLE ~~~~
+    async def stop(self) -> None:
+        """Записать остаток буфера (после остановки фоновой записи)"""
+        written = await self.flush()
+        if written:
+            logger.info(f"[EventLog] Flushed {written} events on shutdown")
+
+
+# Глобальный инстанс журнала событий
+event_log = EventLog()
@@ -1,6 +1,6 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from aiogram import Bot
-from aiogram.types import Chat, CallbackQuery
+from aiogram.types import Chat, CallbackQuery, ChatPermissions
 from aiogram.enums import ChatMemberStatus
 from aiogram.exceptions import TelegramBadRequest
 from logs.logger import logger
@@ -86,3 +86,55 @@ async def safe_callback_answer(callback: CallbackQuery, text: str = "", show_ale
             pass
         else:
             raise
+
+
+# ~~~~ BULK MESSAGE DELETE ~~~~
+# Лимит Bot API на количество сообщений в одном deleteMessages
+DELETE_MESSAGES_LIMIT = 100
+
+
+async def delete_messages_bulk(bot: Bot, chat_id: int, message_ids: list[int]) -> None:
+    """
+    Удаление сообщений чата пачками через deleteMessages.
+
+    Параметры:
+        bot (Bot): экземпляр бота
+        chat_id (int): Telegram ID чата
+        message_ids (list[int]): ID сообщений (пустые значения пропускаются)
+
+    Исключения API пробрасываются вызывающему.
+    """
+    unique_ids = sorted({message_id for message_id in message_ids if message_id})
+    for start in range(0, len(unique_ids), DELETE_MESSAGES_LIMIT):
+        await bot.delete_messages(chat_id=chat_id, message_ids=unique_ids[start:start + DELETE_MESSAGES_LIMIT])
+
+
+# ~~~~ MEMBER RESTRICTIONS ~~~~
+_PERMISSION_FIELDS = (
+    "can_send_messages", "can_send_audios", "can_send_documents", "can_send_photos",
+    "can_send_videos", "can_send_video_notes", "can_send_voice_notes", "can_send_polls",
+    "can_send_other_messages", "can_add_web_page_previews", "can_change_info",
+    "can_invite_users", "can_pin_messages", "can_manage_topics",
+)
+# Все права False - пользователь не может писать
+RESTRICTED_PERMISSIONS = ChatPermissions(**{name: False for name in _PERMISSION_FIELDS})
+# Все права True - ограничения сняты, действуют общие права чата
+UNRESTRICTED_PERMISSIONS = ChatPermissions(**{name: True for name in _PERMISSION_FIELDS})
+
+
+async def restrict_member(bot: Bot, chat_id: int, user_id: int, duration: timedelta | None = None) -> None:
+    """Запретить участнику отправку сообщений, duration - на время (исключения API пробрасываются)"""
+    await bot.restrict_chat_member(
+        chat_id=chat_id, user_id=user_id, permissions=RESTRICTED_PERMISSIONS, until_date=duration
+    )
+
+
+async def unrestrict_member(bot: Bot, chat_id: int, user_id: int) -> None:
+    """Снять ограничения с участника (исключения API пробрасываются)"""
+    await bot.restrict_chat_member(chat_id=chat_id, user_id=user_id, permissions=UNRESTRICTED_PERMISSIONS)
+
+
+async def kick_member(bot: Bot, chat_id: int, user_id: int) -> None:
+    """Исключить участника без бана, чтобы он мог вернуться (исключения API пробрасываются)"""
+    await bot.ban_chat_member(chat_id=chat_id, user_id=user_id)
+    await bot.unban_chat_member(chat_id=chat_id, user_id=user_id, only_if_banned=True)
@@ -0,0 +1,84 @@
+import asyncio
+from collections import OrderedDict
+from database.user_table import update_users_last_seen
+from config import settings
+from utils.clock import clock
+from utils.loop_watchdog import loop_watchdog
+from utils.metrics import metrics
+from utils.time_helpers import get_timestamp
+from logs.logger import logger
+
+
+# ~~~~ LAST SEEN TRACKER ~~~~
+class LastSeenTracker:
+    """
+    Отложенная запись user_last_seen_at.
+
+    touch() на каждое сообщение только обновляет словарь в памяти. Раз в
+    flush_interval секунд все накопленные отметки пишутся одним executemany.
+    Пользователь, чья отметка записана меньше resolution секунд назад, повторно
+    не пишется: для архивации достаточно точности в часы, а не в секунды.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = 60.0,
+        resolution: float = 3600.0,
+        recent_limit: int = 100_000
+    ) -> None:
+        self.flush_interval = flush_interval
+        self.resolution = resolution
+        self.recent_limit = recent_limit
+        self._pending: dict[int, str] = {}
+        self._recent: OrderedDict[int, float] = OrderedDict()
+
+        metrics.register_collector(lambda: [("last_seen_pending", {}, len(self._pending))])
+
+    def touch(self, user_id: int) -> None:
+        """Отметить активность пользователя"""
+        written_at = self._recent.get(user_id)
+        if written_at is not None and clock.monotonic() - written_at < self.resolution:
+            metrics.inc("last_seen_coalesced_total")
+            return
+        self._pending[user_id] = get_timestamp()
+
+    async def flush(self) -> int:
+        """Записать накопленные отметки в БД"""
+        if not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, {}
+        try:
+            written = await update_users_last_seen([(seen_at, user_id) for user_id, seen_at in pending.items()])
+        except Exception as e:
+            logger.error(f"[LastSeen] Failed to write {len(pending)} marks: error_type={type(e).__name__}, error={e}")
+            # Более свежие отметки, пришедшие во время записи, не перетираем
+            self._pending = {**pending, **self._pending}
+            return 0
+
+        now = clock.monotonic()
+        for user_id in pending:
+            self._recent[user_id] = now
+            self._recent.move_to_end(user_id)
+        while len(self._recent) > self.recent_limit:
+            self._recent.popitem(last=False)
+
+        metrics.inc("last_seen_written_total", written)
+        return written
+
+    async def run(self, stop_event: asyncio.Event) -> None:
+        """Фоновая запись отметок (сервис супервизора)"""
+        while not await clock.wait(stop_event, self.flush_interval):
+            # В режиме деградации отметки копятся в памяти до следующего периода
+            if loop_watchdog.degraded:
+                continue
+            await asyncio.shield(self.flush())
+
+    # ~~~~ LIFECYCLE ~~~~
+    async def stop(self) -> None:
+        """Записать остаток отметок (после остановки фоновой записи)"""
+        await self.flush()
+
+
+# Глобальный инстанс трекера активности
+last_seen_tracker = LastSeenTracker(flush_interval=settings.user_last_seen_flush_interval)
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import socket
+import uuid
+from config import settings
+from database.lease_table import acquire_lease, release_lease, get_lease, LeaseModel
+from utils.clock import clock
+from utils.metrics import metrics
+from logs.logger import logger
+
+
+# Имя аренды для одиночных фоновых задач (очистка капч, синхронизация админов, обслуживание БД)
+BACKGROUND_LEASE = "background"
+
+
+# ~~~~ LEADER ELECTION ~~~~
+class LeaderElection:
+    """
+    Выбор лидера среди процессов бота через аренду в lease_table.
+
+    Каждый процесс раз в heartbeat_interval секунд пытается получить или продлить
+    аренду на ttl секунд. Лидер продлевает её, остальные ждут, пока она истечёт
+    (лидер упал или завис). Процесс считает себя лидером, только пока с последнего
+    успешного продления прошло меньше ttl - heartbeat_interval: так бывший лидер
+    прекращает работу раньше, чем аренду заберёт другой процесс.
+    """
+
+    def __init__(self, lease_name: str, ttl: float, heartbeat_interval: float) -> None:
+        self.lease_name = lease_name
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.holder_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._renewed_at: float | None = None
+
+        metrics.register_collector(lambda: [("leader", {"lease": self.lease_name}, int(self.is_leader))])
+
+    @property
+    def is_leader(self) -> bool:
+        """Держит ли этот процесс аренду"""
+        if self._renewed_at is None:
+            return False
+        return clock.monotonic() - self._renewed_at < self.ttl - self.heartbeat_interval
+
+    async def heartbeat(self) -> bool:
+        """Получить или продлить аренду. Возвращает True если процесс - лидер."""
+        was_leader = self.is_leader
+        started_at = clock.monotonic()
+        try:
+            acquired = await acquire_lease(
+                lease_name=self.lease_name,
+                lease_holder=self.holder_id,
+                ttl=self.ttl,
+                now=clock.time(),
+            )
+        except Exception as e:
+            logger.error(f"[Leader] Heartbeat failed: error_type={type(e).__name__}, error={e}")
+            acquired = None
+
+        if acquired:
+            # Отсчёт от начала запроса: запись могла ждать в очереди писателя
+            self._renewed_at = started_at
+        elif acquired is False:
+            self._renewed_at = None
+
+        if self.is_leader != was_leader:
+            state = "acquired" if self.is_leader else "lost"
+            logger.info(f"[Leader] Leadership {state}: lease={self.lease_name}, holder={self.holder_id}")
+            metrics.inc("leader_changes_total", labels={"lease": self.lease_name})
+        return self.is_leader
+
+    async def get_current(self) -> LeaseModel | None:
+        """Текущий держатель аренды (None, если её нет или она истекла)"""
+        lease = await get_lease(self.lease_name)
+        if lease is None or lease.lease_expires_at < clock.time():
+            return None
+        return lease
+
+    async def wait_until_leader(self, stop_event: asyncio.Event) -> bool:
+        """
+        Ждать, пока процесс станет лидером.
+
+        Возвращает:
+            bool: True - процесс лидер, False - бот останавливается
+        """
+        while not stop_event.is_set():
+            if self.is_leader:
+                return True
+            await clock.wait(stop_event, self.heartbeat_interval)
+        return False
+
+    async def run(self, stop_event: asyncio.Event) -> None:
+        """
+        Продление аренды (сервис супервизора). leader_lease_ttl должен быть больше
+        task_shutdown_timeout: при остановке продление прекращается раньше задач лидера.
+        """
+        while not await clock.wait(stop_event, self.heartbeat_interval):
+            await asyncio.shield(self.heartbeat())
+
+    # ~~~~ LIFECYCLE ~~~~
+    async def start(self) -> None:
+        """Первый heartbeat сразу, чтобы задачи при старте знали роль (дальше продлевает run)"""
+        await self.heartbeat()
+
+    async def stop(self) -> None:
+        """Освободить аренду после остановки продления, чтобы другой процесс не ждал ttl"""
+        if self._renewed_at is not None:
+            self._renewed_at = None
+            try:
+                if await release_lease(lease_name=self.lease_name, lease_holder=self.holder_id):
+                    logger.info(f"[Leader] Lease released: lease={self.lease_name}")
+            except Exception as e:
+                logger.error(f"[Leader] Failed to release lease: {e}")
+
+
+# Глобальный инстанс выбора лидера для фоновых задач
+leader = LeaderElection(
+    lease_name=BACKGROUND_LEASE,
+    ttl=settings.leader_lease_ttl,
+    heartbeat_interval=settings.leader_heartbeat_interval,
+)
@@ -0,0 +1,162 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from config import settings
+from utils.metrics import metrics
+from logs.logger import logger
+
+
+# ~~~~ LOOP WATCHDOG ~~~~
+class LoopWatchdog:
+    """
+    Контроль задержки event loop.
+
+    - задача в loop раз в interval секунд засыпает и меряет, насколько позже
+      проснулась (lag): это время, пока loop был занят чужим синхронным кодом;
+    - поток-сторож проверяет, давно ли задача отмечалась. Если loop не отвечает
+      дольше stall_threshold, сторож снимает стек потока loop (sys._current_frames)
+      и пишет его в лог вместе с типом обновления, которое сейчас обрабатывается;
+    - если сглаженный lag держится выше degraded_lag дольше degraded_enter_after
+      секунд, включается режим деградации (degraded): необязательная работа
+      (уведомления владельцу, запись аналитики) откладывается. Режим выключается,
+      когда lag ниже degraded_lag дольше degraded_exit_after секунд.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        stall_threshold: float,
+        degraded_lag: float,
+        degraded_enter_after: float,
+        degraded_exit_after: float
+    ) -> None:
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.degraded_lag = degraded_lag
+        self.degraded_enter_after = degraded_enter_after
+        self.degraded_exit_after = degraded_exit_after
+
+        self.lag = 0.0
+        self.degraded = False
+        self._beat_at = time.monotonic()
+        self._over_since: float | None = None
+        self._under_since: float | None = None
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._thread_stop = threading.Event()
+        # Тип обновления, которое обрабатывает задача (заполняет SlowUpdateMiddleware)
+        self._task_updates: dict[asyncio.Task, str] = {}
+
+        metrics.register_collector(lambda: [
+            ("loop_lag_seconds", {}, self.lag),
+            ("loop_degraded", {}, int(self.degraded)),
+        ])
+
+    # ~~~~ UPDATE TRACKING ~~~~
+    def enter_update(self, update_type: str) -> None:
+        """Отметить, что текущая задача начала обработку обновления"""
+        task = asyncio.current_task()
+        if task is not None:
+            self._task_updates[task] = update_type
+
+    def exit_update(self) -> None:
+        """Отметить, что текущая задача закончила обработку обновления"""
+        task = asyncio.current_task()
+        if task is not None:
+            self._task_updates.pop(task, None)
+
+    # ~~~~ LAG ~~~~
+    def _update_degraded(self, now: float) -> None:
+        if self.lag > self.degraded_lag:
+            self._under_since = None
+            if self._over_since is None:
+                self._over_since = now
+            if not self.degraded and now - self._over_since >= self.degraded_enter_after:
+                self.degraded = True
+                metrics.inc("loop_degraded_total")
+                logger.warning(f"[Watchdog] Degraded mode on: loop lag {self.lag * 1000:.0f}ms")
+        else:
+            self._over_since = None
+            if self._under_since is None:
+                self._under_since = now
+            if self.degraded and now - self._under_since >= self.degraded_exit_after:
+                self.degraded = False
+                logger.info(f"[Watchdog] Degraded mode off: loop lag {self.lag * 1000:.0f}ms")
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat_at = now
+            # Экспоненциальное сглаживание: одиночный всплеск не включает деградацию
+            self.lag = 0.8 * self.lag + 0.2 * max(now - expected, 0.0)
+            self._update_degraded(now)
+
+    # ~~~~ STALL REPORTER ~~~~
+    def _report_stall(self, stalled_for: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "<no frame>"
+
+        # Чтение текущей задачи loop из другого потока - только для отчёта
+        task = asyncio.current_task(self._loop)
+        update_type = self._task_updates.get(task, "-") if task is not None else "-"
+        task_name = task.get_name() if task is not None else "-"
+
+        metrics.inc("loop_stalls_total")
+        logger.warning(
+            f"[Watchdog] Event loop blocked for {stalled_for * 1000:.0f}ms: "
+            f"task={task_name}, update_type={update_type}\n{stack}"
+        )
+
+    def _watch(self) -> None:
+        reported_beat: float | None = None
+        while not self._thread_stop.wait(self.interval):
+            beat_at = self._beat_at
+            stalled_for = time.monotonic() - beat_at
+            # Один отчёт на одну остановку loop
+            if stalled_for > self.stall_threshold and reported_beat != beat_at:
+                reported_beat = beat_at
+                try:
+                    self._report_stall(stalled_for)
+                except Exception as e:
+                    logger.error(f"[Watchdog] Failed to report stall: {e}")
+
+    # ~~~~ LIFECYCLE ~~~~
+    def start(self) -> None:
+        """Запустить замер lag в текущем loop и поток-сторож"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat_at = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat(), name="loop-watchdog")
+        self._thread_stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        """Остановить замер и поток-сторож"""
+        if self._task is None:
+            return
+        self._thread_stop.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await asyncio.to_thread(self._thread.join)
+        self._thread = None
+
+
+# Глобальный инстанс сторожа event loop
+loop_watchdog = LoopWatchdog(
+    interval=settings.loop_watchdog_interval,
+    stall_threshold=settings.loop_stall_threshold,
+    degraded_lag=settings.loop_degraded_lag,
+    degraded_enter_after=settings.loop_degraded_enter_after,
+    degraded_exit_after=settings.loop_degraded_exit_after,
+)
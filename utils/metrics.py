@@ -0,0 +1,70 @@
+from collections.abc import Callable, Iterable
+
+
+# ~~~~ TYPES ~~~~
+Labels = tuple[tuple[str, str], ...]
+Sample = tuple[str, dict[str, str], float]
+
+
+def _labels_key(labels: dict[str, str] | None) -> Labels:
+    if not labels:
+        return ()
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+# ~~~~ METRICS REGISTRY ~~~~
+class MetricsRegistry:
+    """
+    Простой реестр метрик в памяти процесса.
+
+    Счётчики увеличиваются через inc(), значения-снимки (длины очередей и т.п.)
+    отдают коллекторы, которые вызываются только при чтении метрик.
+    """
+
+    def __init__(self, prefix: str = "poh") -> None:
+        self.prefix = prefix
+        self._counters: dict[tuple[str, Labels], float] = {}
+        self._gauges: dict[tuple[str, Labels], float] = {}
+        self._collectors: list[Callable[[], Iterable[Sample]]] = []
+
+    def inc(self, name: str, value: float = 1.0, labels: dict[str, str] | None = None) -> None:
+        """Увеличить счётчик"""
+        key = (name, _labels_key(labels))
+        self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, labels: dict[str, str] | None = None) -> None:
+        """Установить значение gauge"""
+        self._gauges[(name, _labels_key(labels))] = value
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        """Зарегистрировать функцию, отдающую (name, labels, value) при чтении метрик"""
+        self._collectors.append(collector)
+
+    def get(self, name: str, labels: dict[str, str] | None = None) -> float:
+        """Получить текущее значение счётчика или gauge (0, если его нет)"""
+        key = (name, _labels_key(labels))
+        if key in self._counters:
+            return self._counters[key]
+        return self._gauges.get(key, 0.0)
+
+    def samples(self) -> list[tuple[str, Labels, float]]:
+        """Все метрики на текущий момент"""
+        result = [(name, labels, value) for (name, labels), value in self._counters.items()]
+        result += [(name, labels, value) for (name, labels), value in self._gauges.items()]
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                result.append((name, _labels_key(labels), value))
+        return sorted(result)
+
+    def render(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        for name, labels, value in self.samples():
+            label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+            suffix = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{self.prefix}_{name}{suffix} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+# Глобальный инстанс реестра метрик
+metrics = MetricsRegistry()
@@ -1,9 +1,19 @@
+import asyncio
+from collections import deque
 from aiogram import Bot
 from aiogram.exceptions import TelegramForbiddenError
 
 from config import settings
 from logs.logger import logger
 from utils.time_helpers import get_timestamp
+from utils.chat_state import chat_states
+from utils.loop_watchdog import loop_watchdog
+from utils.metrics import metrics
+
+
+# Уведомления, отложенные в режиме деградации (старые вытесняются новыми)
+DEFERRED_LIMIT = 50
+_deferred: deque[tuple[str, int, int | None, str, str]] = deque(maxlen=DEFERRED_LIMIT)
 
 
 async def notify_owner_about_error(
@@ -23,6 +33,29 @@ async def notify_owner_about_error(
         message_id: ID сообщения (если применимо)
         error_description: Описание ошибки
     """
+    # Ошибки в чатах, где бота нет или у него нет прав, ожидаемы - не дёргаем get_chat
+    if not chat_states.is_active(chat_id):
+        logger.debug(f"[Notify] Skipping notification for inactive chat: chat_id={chat_id}, error_type={error_type}")
+        return
+
+    # Бот перегружен: уведомление подождёт, пока задержка loop не вернётся в норму
+    if loop_watchdog.degraded:
+        if len(_deferred) == DEFERRED_LIMIT:
+            metrics.inc("owner_notifications_dropped_total")
+        _deferred.append((error_type, chat_id, message_id, error_description, get_timestamp()))
+        return
+
+    await _send_notification(bot, error_type, chat_id, message_id, error_description, get_timestamp())
+
+
+async def _send_notification(
+    bot: Bot,
+    error_type: str,
+    chat_id: int,
+    message_id: int | None,
+    error_description: str,
+    created_at: str,
+) -> None:
     try:
         # Получаем информацию о чате
         chat_info = await bot.get_chat(chat_id)
@@ -43,7 +76,7 @@ async def notify_owner_about_error(
 
         text += (
             f"\n<b>Error Description:</b>\n<pre>{error_description}</pre>\n\n"
-            f"<code>{get_timestamp()}</code>"
+            f"<code>{created_at}</code>"
         )
 
         # Отправляем владельцу
@@ -53,3 +86,16 @@ async def notify_owner_about_error(
         logger.error("[Notify] Cannot send notification - owner blocked bot")
     except Exception as e:
         logger.error(f"[Notify] Failed to send notification: {e}")
+
+
+async def send_deferred_notifications(bot: Bot, stop_event: asyncio.Event) -> None:
+    """
+    Отправить уведомления, отложенные в режиме деградации
+    (запускается супервизором; пока бот перегружен, ничего не делает).
+    """
+    sent = 0
+    while _deferred and not loop_watchdog.degraded and not stop_event.is_set():
+        await _send_notification(bot, *_deferred.popleft())
+        sent += 1
+    if sent:
+        logger.info(f"[Notify] Sent {sent} deferred notifications")
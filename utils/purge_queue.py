@@ -0,0 +1,200 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+from database.captcha_table import delete_captcha
+from utils.metrics import metrics
+from utils.helpers import kick_member
+from utils.notifications import notify_owner_about_error
+from utils.chat_state import chat_states
+from utils.event_log import event_log
+from database.event_table import EventType
+from logs.logger import logger
+
+
+# ~~~~ PURGE JOB ~~~~
+@dataclass
+class PurgeJob:
+    """
+    Параметры:
+        captcha_id (int): ID капчи в БД
+        chat_id (int): Telegram ID чата
+        message_id (int): ID сообщения капчи
+        user_message_id (int | None): ID сообщения пользователя, вызвавшего капчу
+        notify_on_error (bool): уведомлять владельца об ошибках удаления сообщений
+        kick_user_id (int | None): исключить пользователя из чата (капча в режиме ограничения при входе)
+        user_id (int | None): Telegram ID пользователя капчи (для журнала событий)
+    """
+    captcha_id: int
+    chat_id: int
+    message_id: int
+    user_message_id: int | None
+    notify_on_error: bool = False
+    kick_user_id: int | None = None
+    user_id: int | None = None
+
+
+# ~~~~ CAPTCHA PURGE QUEUE ~~~~
+class CaptchaPurgeQueue:
+    """
+    Фоновая очередь удаления истёкших капч.
+
+    Удаляет сообщение капчи, сообщение пользователя и запись из БД вне обработки
+    сообщений. В неактивных чатах (бот удалён, нет прав) удаляется только запись
+    из БД. Одна и та же капча ставится в очередь только один раз: повторные
+    заявки (из middleware и из периодической очистки) схлопываются, в том числе
+    для недавно удалённых капч.
+    """
+
+    def __init__(self, recent_limit: int = 4096) -> None:
+        self.recent_limit = recent_limit
+        self._queue: asyncio.Queue[PurgeJob] = asyncio.Queue()
+        self._pending: set[int] = set()
+        self._recent: OrderedDict[int, None] = OrderedDict()
+        self._bot: Bot | None = None
+
+        metrics.register_collector(lambda: [("purge_queue_size", {}, self._queue.qsize())])
+
+    # ~~~~ SCHEDULE ~~~~
+    def schedule(self, job: PurgeJob) -> bool:
+        """
+        Поставить капчу в очередь удаления.
+
+        Возвращает:
+            bool: False если капча уже в очереди или недавно удалена
+        """
+        if job.captcha_id in self._pending or job.captcha_id in self._recent:
+            metrics.inc("purge_coalesced_total")
+            return False
+
+        self._pending.add(job.captcha_id)
+        self._queue.put_nowait(job)
+        metrics.inc("purge_scheduled_total")
+        return True
+
+    def mark_resolved(self, captcha_ids: list[int]) -> None:
+        """Отметить капчи, уже удалённые другим путём, чтобы очередь их не трогала"""
+        for captcha_id in captcha_ids:
+            if captcha_id not in self._pending:
+                self._remember(captcha_id)
+
+    def _remember(self, captcha_id: int) -> None:
+        self._pending.discard(captcha_id)
+        self._recent[captcha_id] = None
+        while len(self._recent) > self.recent_limit:
+            self._recent.popitem(last=False)
+
+    # ~~~~ WORKER ~~~~
+    async def run(self, bot: Bot | None, stop_event: asyncio.Event) -> None:
+        """Воркер очереди (сервис супервизора)"""
+        self._bot = bot
+        while not stop_event.is_set():
+            job = await self._queue.get()
+            # shield: остановка сервиса не обрывает начатое удаление, его дожидается stop()
+            await asyncio.shield(self._process(job))
+
+    async def _process(self, job: PurgeJob) -> None:
+        purged = False
+        try:
+            purged = await self._purge(job)
+        except Exception as e:
+            logger.error(
+                f"[Purge] Error purging captcha: captcha_id={job.captcha_id}, "
+                f"error_type={type(e).__name__}, error={e}"
+            )
+        finally:
+            # Запись не удалена из БД - следующая очистка поставит капчу снова
+            if purged:
+                self._remember(job.captcha_id)
+            else:
+                self._pending.discard(job.captcha_id)
+            self._queue.task_done()
+
+    async def _delete_message(self, job: PurgeJob, message_id: int, error_type: str) -> bool:
+        try:
+            await self._bot.delete_message(chat_id=job.chat_id, message_id=message_id)
+            return True
+        except (TelegramForbiddenError, TelegramBadRequest, Exception) as e:
+            # Бота удалили из чата или сняли права - дальше только чистим БД
+            if await chat_states.handle_api_error(job.chat_id, e) or not job.notify_on_error:
+                return False
+            error_msg = str(e)
+            logger.error(
+                f"[Purge] Error deleting message: captcha_id={job.captcha_id}, chat_id={job.chat_id}, "
+                f"message_id={message_id}, error={error_msg}"
+            )
+            await notify_owner_about_error(
+                bot=self._bot,
+                error_type=error_type,
+                chat_id=job.chat_id,
+                message_id=message_id,
+                error_description=f"Failed to delete message: {error_msg}"
+            )
+            return False
+
+    async def _purge(self, job: PurgeJob) -> bool:
+        """Удалить сообщения и запись капчи. Возвращает True если записи капчи в БД больше нет."""
+        captcha_deleted = False
+        if chat_states.is_active(job.chat_id):
+            captcha_deleted = await self._delete_message(
+                job, job.message_id, "cleanup_delete_captcha_failed"
+            )
+
+        user_message_deleted = False
+        if job.user_message_id and chat_states.is_active(job.chat_id):
+            user_message_deleted = await self._delete_message(
+                job, job.user_message_id, "cleanup_delete_user_message_failed"
+            )
+
+        # Не прошёл капчу при входе - исключаем, чтобы он мог зайти и попробовать снова
+        if job.kick_user_id and chat_states.is_active(job.chat_id):
+            try:
+                await kick_member(bot=self._bot, chat_id=job.chat_id, user_id=job.kick_user_id)
+            except Exception as e:
+                logger.error(
+                    f"[Purge] Error kicking restricted user: chat_id={job.chat_id}, "
+                    f"user_id={job.kick_user_id}, error={e}"
+                )
+
+        # Удаляем запись из БД в любом случае, чтобы не оставлять "зомби"-записи
+        try:
+            deleted = await delete_captcha(captcha_id=job.captcha_id)
+            if deleted:
+                # Событие пишет только тот, кто действительно удалил капчу
+                event_log.record(EventType.EXPIRED, chat_id=job.chat_id, user_id=job.user_id)
+                logger.info(
+                    f"[Purge] Deleted captcha record from DB: captcha_id={job.captcha_id}, "
+                    f"captcha_message_deleted={captcha_deleted}, user_message_deleted={user_message_deleted}"
+                )
+            else:
+                logger.warning(
+                    f"[Purge] Captcha record not found in DB (already deleted?): captcha_id={job.captcha_id}"
+                )
+        except Exception as e:
+            logger.error(
+                f"[Purge] Error deleting captcha from DB: "
+                f"captcha_id={job.captcha_id}, error_type={type(e).__name__}, error={e}"
+            )
+            return False
+        metrics.inc("purge_done_total")
+        return True
+
+    # ~~~~ LIFECYCLE ~~~~
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Обработать остаток очереди после остановки воркера (не дольше timeout)"""
+        try:
+            async with asyncio.timeout(timeout):
+                while not self._queue.empty():
+                    await self._process(self._queue.get_nowait())
+                # Удаление, начатое воркером до остановки
+                await self._queue.join()
+        except TimeoutError:
+            logger.warning(f"[Purge] Stopping with {self._queue.qsize()} captchas left in queue")
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+
+# Глобальный инстанс очереди удаления капч
+captcha_purge_queue = CaptchaPurgeQueue()
@@ -1,5 +1,6 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 from collections import defaultdict
+from utils.clock import clock
 
 
 class RateLimiter:
@@ -13,7 +14,7 @@ class RateLimiter:
     def is_allowed(self, user_id: int, chat_id: int) -> bool:
         """Проверить разрешено ли действие"""
         key = (user_id, chat_id)
-        now = datetime.now()
+        now = clock.now()
         
         # Удалить старые попытки
         self.attempts[key] = [
@@ -0,0 +1,84 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable
+
+
+# ~~~~ KEYED LOCK ~~~~
+class KeyedLock:
+    """
+    Набор asyncio.Lock по ключу.
+
+    Лок создаётся при первом обращении и удаляется, когда его больше никто
+    не держит и не ждёт, поэтому словарь не растёт бесконечно.
+    """
+
+    def __init__(self) -> None:
+        self._locks: dict[Hashable, list[Any]] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        """Захватить лок для ключа на время блока async with"""
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = [asyncio.Lock(), 0]
+            self._locks[key] = entry
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(key, None)
+
+    def is_locked(self, key: Hashable) -> bool:
+        """Проверить, держит ли кто-то лок для ключа"""
+        entry = self._locks.get(key)
+        return entry is not None and entry[0].locked()
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+# ~~~~ SINGLE FLIGHT ~~~~
+class SingleFlight:
+    """
+    Дедупликация одновременных вызовов по ключу.
+
+    Пока вызов для ключа выполняется, остальные вызовы с тем же ключом
+    не запускают свой запрос, а ждут результат первого.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполнить func один раз для всех одновременных вызовов с ключом key.
+
+        Параметры:
+            key (Hashable): ключ дедупликации
+            func (Callable): фабрика корутины, вызывается только у первого вызывающего
+
+        Возвращает:
+            Any: результат func (или пробрасывает её исключение всем ожидающим)
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        # shield: отмена одного ожидающего не отменяет запрос для остальных
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+# Глобальные инстансы: лок на выдачу капчи (user_id, chat_id) и дедупликация запросов
+captcha_issue_locks = KeyedLock()
+lookup_flight = SingleFlight()
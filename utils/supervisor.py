@@ -0,0 +1,210 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+from config import settings
+from utils.clock import clock
+from utils.leader import leader
+from utils.metrics import metrics
+from logs.logger import logger
+
+
+# ~~~~ TYPES ~~~~
+JobFunc = Callable[[asyncio.Event], Awaitable[None]]
+
+
+# ~~~~ JOB MODEL ~~~~
+@dataclass
+class Job:
+    """
+    Параметры:
+        name (str): имя задачи (в логах и метриках)
+        func (JobFunc): корутина, получающая stop_event супервизора
+        interval (float | None): период запуска в секундах; None - долгоживущая задача (сервис)
+        timeout (float | None): лимит одного запуска в секундах
+        initial_delay (float): задержка первого запуска в секундах
+        leader_only (bool): запускать только в процессе-лидере
+        failures (int): ошибок подряд (для backoff)
+    """
+    name: str
+    func: JobFunc
+    interval: float | None
+    timeout: float | None = None
+    initial_delay: float = 0.0
+    leader_only: bool = False
+    failures: int = 0
+
+
+# ~~~~ TASK SUPERVISOR ~~~~
+class TaskSupervisor:
+    """
+    Фоновые задачи бота под одним asyncio.TaskGroup.
+
+    - периодическая задача - один проход за запуск, запуски по расписанию с фиксированным
+      шагом (отставание от расписания пишется в метрику job_lag_seconds);
+    - сервис - долгоживущая корутина; если она упала или завершилась, перезапускается,
+      при остановке отменяется (итоговую запись делает stop() компонента);
+    - после ошибки или таймаута следующий запуск откладывается с экспоненциальным backoff;
+    - stop() даёт текущим запускам завершиться до дедлайна, затем отменяет их.
+    """
+
+    def __init__(self, backoff_base: float, backoff_max: float) -> None:
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jobs: list[Job] = []
+        self._running: set[str] = set()
+        self._stop_event = asyncio.Event()
+        self._runner: asyncio.Task | None = None
+
+        metrics.register_collector(lambda: [("jobs_running", {}, len(self._running))])
+
+    # ~~~~ REGISTRATION ~~~~
+    def register_periodic(
+        self,
+        name: str,
+        func: JobFunc,
+        interval: float,
+        timeout: float | None = None,
+        initial_delay: float = 0.0,
+        leader_only: bool = False
+    ) -> None:
+        """Зарегистрировать задачу, запускаемую раз в interval секунд"""
+        self.jobs.append(Job(
+            name=name, func=func, interval=interval, timeout=timeout,
+            initial_delay=initial_delay, leader_only=leader_only,
+        ))
+
+    def register_service(self, name: str, func: JobFunc, leader_only: bool = False) -> None:
+        """Зарегистрировать долгоживущую задачу (отменяется при остановке супервизора)"""
+        self.jobs.append(Job(name=name, func=func, interval=None, leader_only=leader_only))
+
+    # ~~~~ RUN ~~~~
+    async def _sleep(self, delay: float) -> bool:
+        """Подождать delay секунд. Возвращает False, если супервизор останавливается."""
+        if delay > 0:
+            await clock.wait(self._stop_event, delay)
+        return not self._stop_event.is_set()
+
+    def _backoff(self, job: Job) -> float:
+        limit = min(self.backoff_max, job.interval) if job.interval else self.backoff_max
+        return min(self.backoff_base * 2 ** (job.failures - 1), limit)
+
+    async def _run_once(self, job: Job) -> bool:
+        """Один запуск задачи с таймаутом и метриками. Возвращает True при успехе."""
+        labels = {"job": job.name}
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        self._running.add(job.name)
+        try:
+            async with asyncio.timeout(job.timeout):
+                if job.interval is None:
+                    await self._until_stopped(job)
+                else:
+                    await job.func(self._stop_event)
+            status = "ok"
+        except TimeoutError:
+            logger.error(f"[Supervisor] Job timed out: job={job.name}, timeout={job.timeout}s")
+            status = "timeout"
+        except Exception as e:
+            logger.error(f"[Supervisor] Job failed: job={job.name}, error_type={type(e).__name__}, error={e}")
+            status = "error"
+        finally:
+            self._running.discard(job.name)
+
+        metrics.set_gauge("job_duration_seconds", loop.time() - started_at, labels=labels)
+        metrics.inc("job_runs_total", labels={**labels, "status": status})
+        return status == "ok"
+
+    async def _until_stopped(self, job: Job) -> None:
+        """Запуск сервиса до его завершения или stop_event (тогда запуск отменяется)"""
+        task = asyncio.create_task(job.func(self._stop_event), name=f"service:{job.name}")
+        stopped = asyncio.create_task(self._stop_event.wait())
+        try:
+            await asyncio.wait({task, stopped}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stopped.cancel()
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if not task.cancelled():
+            task.result()
+
+    async def _wait_turn(self, job: Job) -> bool:
+        if job.leader_only:
+            return await leader.wait_until_leader(self._stop_event)
+        return not self._stop_event.is_set()
+
+    async def _run_periodic(self, job: Job) -> None:
+        scheduled_at = clock.monotonic() + job.initial_delay
+
+        while await self._sleep(scheduled_at - clock.monotonic()):
+            if job.leader_only and not leader.is_leader:
+                if not await self._wait_turn(job):
+                    return
+                # Стали лидером - запускаем сразу, отставание не считаем
+                scheduled_at = clock.monotonic()
+
+            metrics.set_gauge("job_lag_seconds", max(clock.monotonic() - scheduled_at, 0.0), labels={"job": job.name})
+
+            if await self._run_once(job):
+                job.failures = 0
+                scheduled_at += job.interval
+                # Пропущенные из-за долгого запуска слоты не наверстываем
+                scheduled_at = max(scheduled_at, clock.monotonic())
+            else:
+                job.failures += 1
+                scheduled_at = clock.monotonic() + self._backoff(job)
+
+    async def _run_service(self, job: Job) -> None:
+        while await self._wait_turn(job):
+            started_at = clock.monotonic()
+            await self._run_once(job)
+            if self._stop_event.is_set():
+                return
+
+            # Сервис не должен завершаться сам: считаем это сбоем и перезапускаем.
+            # Проработавший дольше backoff_max сервис начинает backoff заново
+            if clock.monotonic() - started_at > self.backoff_max:
+                job.failures = 0
+            job.failures += 1
+            delay = self._backoff(job)
+            metrics.inc("job_restarts_total", labels={"job": job.name})
+            logger.warning(f"[Supervisor] Restarting service: job={job.name}, delay={delay:.1f}s")
+            if not await self._sleep(delay):
+                return
+
+    async def _supervise(self, job: Job) -> None:
+        if job.interval is None:
+            await self._run_service(job)
+        else:
+            await self._run_periodic(job)
+
+    async def _run(self) -> None:
+        async with asyncio.TaskGroup() as group:
+            for job in self.jobs:
+                group.create_task(self._supervise(job), name=f"job:{job.name}")
+
+    # ~~~~ LIFECYCLE ~~~~
+    def start(self) -> None:
+        """Запустить все зарегистрированные задачи"""
+        if self._runner is None:
+            self._runner = asyncio.create_task(self._run(), name="task-supervisor")
+            logger.info(f"[Supervisor] Started {len(self.jobs)} jobs: {', '.join(job.name for job in self.jobs)}")
+
+    async def stop(self, timeout: float) -> None:
+        """Остановить задачи: новые запуски не начинаются, текущие завершаются до дедлайна"""
+        if self._runner is None:
+            return
+
+        self._stop_event.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._runner), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"[Supervisor] Jobs not finished in {timeout}s, cancelling: {', '.join(sorted(self._running))}")
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+        self._runner = None
+        logger.info("[Supervisor] Stopped")
+
+
+# Глобальный инстанс супервизора фоновых задач
+supervisor = TaskSupervisor(backoff_base=1.0, backoff_max=settings.task_backoff_max)
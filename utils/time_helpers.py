@@ -1,10 +1,11 @@
 from datetime import datetime
+from utils.clock import clock
 
 
 def get_timestamp(dt: datetime | None = None) -> str:
     """Получить timestamp в формате YYYY-MM-DD HH:MM:SS"""
     if dt is None:
-        dt = datetime.now()
+        dt = clock.now()
     return dt.strftime("%Y-%m-%d %H:%M:%S")
 
 
@@ -17,6 +18,6 @@ def is_expired(timestamp_str: str) -> bool:
     """Проверить истек ли timestamp"""
     try:
         dt = parse_timestamp(timestamp_str)
-        return datetime.now() > dt
+        return clock.now() > dt
     except (ValueError, TypeError):
         return True
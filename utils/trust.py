@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from enum import Enum
+from database.chat_table import ChatModel, get_chat
+from database.event_table import EventType, UserEventHistory
+from database.user_table import UserModel
+from utils.event_log import event_log
+from utils.metrics import metrics
+from logs.logger import logger
+
+
+# ~~~~ SCORE WEIGHTS ~~~~
+PREMIUM_SCORE = 40
+LANGUAGE_SCORE = 5
+# (дней с первого появления, баллы): берётся первая ступень, которую пользователь прошёл
+AGE_SCORES = ((90, 35), (30, 25), (7, 15), (1, 5))
+# За каждый чат, где у пользователя были капчи
+CHAT_SCORE = 5
+MAX_CHAT_SCORE = 15
+WRONG_PENALTY = 10
+FAILED_PENALTY = 30
+MAX_SCORE = 100
+
+
+# ~~~~ TRUST TIER ~~~~
+class TrustTier(str, Enum):
+    """Путь верификации пользователя в чате по оценке доверия"""
+    NONE = "none"  # обычная капча
+    LIGHT = "light"  # упрощённая капча, без ограничения при входе
+    SKIP = "skip"  # без капчи в этом чате (user_status не меняется)
+
+
+# ~~~~ SCORE ~~~~
+def compute_trust_score(
+    is_premium: int | None,
+    language: str,
+    first_seen_at: str,
+    history: UserEventHistory | None,
+    age_cutoffs: list[tuple[str, int]]
+) -> int:
+    """
+    Оценка доверия пользователя 0-100 по данным user_table и истории капч.
+
+    Параметры:
+        is_premium (int | None): user_is_premium
+        language (str): user_language
+        first_seen_at (str): user_first_seen_at
+        history (UserEventHistory | None): история капч из журнала событий
+        age_cutoffs (list[tuple]): (timestamp ступени AGE_SCORES, баллы) - считаются один раз на пересчёт
+
+    Возвращает:
+        int: оценка доверия
+    """
+    score = 0
+    if is_premium:
+        score += PREMIUM_SCORE
+    if language:
+        score += LANGUAGE_SCORE
+    # Формат timestamp сравнивается как строка
+    for cutoff, points in age_cutoffs:
+        if first_seen_at and first_seen_at <= cutoff:
+            score += points
+            break
+    if history is not None:
+        score += min(history.chat_count * CHAT_SCORE, MAX_CHAT_SCORE)
+        score -= history.wrong_count * WRONG_PENALTY + history.failed_count * FAILED_PENALTY
+    return max(0, min(score, MAX_SCORE))
+
+
+def get_trust_tier(score: int, chat: ChatModel) -> TrustTier:
+    """Путь верификации по оценке доверия и порогам чата (0 - порог выключен)"""
+    if chat.chat_trust_skip_score and score >= chat.chat_trust_skip_score:
+        return TrustTier.SKIP
+    if chat.chat_trust_light_score and score >= chat.chat_trust_light_score:
+        return TrustTier.LIGHT
+    return TrustTier.NONE
+
+
+async def resolve_trust_tier(user: UserModel, chat_id: int) -> TrustTier:
+    """Путь верификации пользователя в чате. Для нулевой оценки чат из БД не читается."""
+    if user.user_trust_score <= 0:
+        return TrustTier.NONE
+    chat = await get_chat(chat_id=chat_id)
+    if chat is None or not chat.chat_captcha_enabled:
+        return TrustTier.NONE
+    return get_trust_tier(user.user_trust_score, chat)
+
+
+# ~~~~ TRUSTED PASS ~~~~
+class TrustedPasses:
+    """
+    Пропуск доверенных пользователей без капчи.
+
+    Пропуск действует только в чате, чей порог пройден, и только пока оценка
+    не ниже порога: user_status не меняется, поэтому мягкий порог одного чата
+    не снимает капчу в остальных. Порог проверяется на каждом сообщении, а
+    сэкономленная капча пишется в журнал событий один раз на пару
+    (пользователь, чат) за время работы процесса.
+    """
+
+    def __init__(self, recent_limit: int = 10_000) -> None:
+        self.recent_limit = recent_limit
+        self._recent: OrderedDict[tuple[int, int], None] = OrderedDict()
+
+    def allow(self, user_id: int, chat_id: int, trust_score: int) -> None:
+        """Отметить пропуск пользователя в чат без капчи"""
+        key = (user_id, chat_id)
+        if key in self._recent:
+            self._recent.move_to_end(key)
+            return
+
+        self._recent[key] = None
+        while len(self._recent) > self.recent_limit:
+            self._recent.popitem(last=False)
+
+        event_log.record(EventType.TRUSTED, chat_id=chat_id, user_id=user_id)
+        metrics.inc("trust_captchas_skipped_total")
+        logger.info(f"[Trust] User passed by trust score: user_id={user_id}, chat_id={chat_id}, score={trust_score}")
+
+
+# Глобальный инстанс пропусков по доверию
+trusted_passes = TrustedPasses()
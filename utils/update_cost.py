@@ -0,0 +1,123 @@
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from contextvars import ContextVar
+from database.storage import statement_sink
+
+
+# ~~~~ SQL TABLE ~~~~
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def statement_table(sql: str) -> str:
+    """Таблица SQL-выражения (для служебных выражений - первое слово: BEGIN, SAVEPOINT, PRAGMA)"""
+    match = _TABLE_RE.search(sql)
+    if match:
+        return match.group(1)
+    words = sql.split(maxsplit=1)
+    return words[0].upper() if words else "?"
+
+
+# ~~~~ UPDATE COST ~~~~
+@dataclass(slots=True)
+class UpdateCost:
+    """
+    Стоимость обработки одного обновления.
+
+    Параметры:
+        update_type (str): тип обновления (message, callback_query, ...)
+        route (list[str]): ветки middleware и обработчик, через которые прошло обновление
+        api_calls (Counter): вызовы Bot API по методам
+        db_statements (Counter): SQL-выражения по таблицам
+        api_time (float): время ожидания ответов Bot API в секундах
+        db_time (float): время ожидания БД в секундах (соединения читателя и записи)
+    """
+    update_type: str
+    route: list[str] = field(default_factory=list)
+    api_calls: Counter = field(default_factory=Counter)
+    db_statements: Counter = field(default_factory=Counter)
+    api_time: float = 0.0
+    db_time: float = 0.0
+
+    def add_statement(self, sql: str) -> None:
+        # Вызывается в потоке соединения SQLite
+        self.db_statements[statement_table(sql)] += 1
+
+    @property
+    def route_name(self) -> str:
+        return "/".join(self.route) or "unhandled"
+
+
+# Стоимость обновления, которое обрабатывает текущая задача (через неё же Storage учитывает SQL-выражения)
+current_cost: ContextVar[UpdateCost | None] = statement_sink
+
+
+def mark_branch(branch: str) -> None:
+    """Отметить ветку middleware или обработчик в стоимости текущего обновления"""
+    cost = current_cost.get()
+    if cost is not None:
+        cost.route.append(branch)
+
+
+# ~~~~ AGGREGATION ~~~~
+@dataclass(slots=True)
+class RouteCost:
+    """
+    Суммарная стоимость обновлений одного типа, прошедших одним маршрутом.
+
+    Параметры:
+        updates (int): количество обновлений
+        api_calls (Counter): вызовы Bot API по методам
+        db_statements (Counter): SQL-выражения по таблицам
+        stages (Counter): время по этапам в секундах (queue, api, db, total)
+    """
+    updates: int = 0
+    api_calls: Counter = field(default_factory=Counter)
+    db_statements: Counter = field(default_factory=Counter)
+    stages: Counter = field(default_factory=Counter)
+
+
+class UpdateCostStats:
+    """Стоимость обновлений, сгруппированная по (тип обновления, маршрут)"""
+
+    def __init__(self) -> None:
+        self.routes: dict[tuple[str, str], RouteCost] = {}
+
+    def record(self, cost: UpdateCost, queue_time: float, total_time: float) -> None:
+        """Добавить стоимость обработанного обновления"""
+        key = (cost.update_type, cost.route_name)
+        route = self.routes.get(key)
+        if route is None:
+            route = self.routes[key] = RouteCost()
+        route.updates += 1
+        route.api_calls.update(cost.api_calls)
+        route.db_statements.update(cost.db_statements)
+        route.stages["queue"] += queue_time
+        route.stages["api"] += cost.api_time
+        route.stages["db"] += cost.db_time
+        route.stages["total"] += total_time
+
+    def top(self, limit: int) -> list[tuple[str, str, RouteCost]]:
+        """Самые затратные маршруты по суммарному времени обработки"""
+        ranked = sorted(self.routes.items(), key=lambda item: item[1].stages["total"], reverse=True)
+        return [(update_type, route_name, route) for (update_type, route_name), route in ranked[:limit]]
+
+    def collect_metrics(self) -> list[tuple[str, dict[str, str], float]]:
+        """Метрики стоимости для реестра метрик"""
+        samples = []
+        for (update_type, route_name), route in self.routes.items():
+            labels = {"type": update_type, "route": route_name}
+            samples.append(("update_cost_updates_total", labels, route.updates))
+            for method, calls in route.api_calls.items():
+                samples.append(("update_cost_api_calls_total", {**labels, "method": method}, calls))
+            for table, statements in route.db_statements.items():
+                samples.append(("update_cost_db_statements_total", {**labels, "table": table}, statements))
+            for stage, seconds in route.stages.items():
+                samples.append(("update_cost_seconds_total", {**labels, "stage": stage}, seconds))
+        return samples
+
+
+# Глобальная статистика стоимости обновлений
+update_costs = UpdateCostStats()
@@ -0,0 +1,230 @@
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from aiogram.enums import ContentType, UpdateType
+from aiogram.types import Update
+from config import settings
+from utils.metrics import metrics
+from logs.logger import logger
+
+
+# Разрешённые поля записи (остальные удаляются). Значение - как поле обезличивается:
+#   keep - без изменений (типы, статусы, флаги, даты, ID сообщений)
+#   id - ID пользователя или чата через map_id
+#   object - объект или список объектов, поля которого проверяются так же
+#   text, data, first_name, title - см. методы Anonymizer
+#   blank - поле остаётся, значения обнуляются (определяет тип, а не содержимое)
+RECORDED_FIELDS = {
+    # Остальные виды обновлений и содержимого сообщений (по ним aiogram определяет
+    # тип обновления и content_type) записываются с обнулёнными значениями
+    **{kind.value: "blank" for kind in (*UpdateType, *ContentType)},
+    **dict.fromkeys((
+        "update_id", "message_id", "message_thread_id", "date", "edit_date", "type", "status",
+        "is_bot", "is_premium", "language_code", "is_forum", "is_topic_message", "is_automatic_forward",
+        "is_anonymous", "is_member", "until_date", "via_join_request",
+    ), "keep"),
+    **dict.fromkeys(("id", "user_id", "chat_id", "user_chat_id", "migrate_to_chat_id", "migrate_from_chat_id"), "id"),
+    **dict.fromkeys((
+        "message", "edited_message", "channel_post", "edited_channel_post", "callback_query",
+        "my_chat_member", "chat_member", "chat_join_request",
+        "from", "chat", "sender_chat", "user", "old_chat_member", "new_chat_member",
+        "new_chat_members", "left_chat_member",
+    ), "object"),
+    "text": "text",
+    "caption": "text",
+    "data": "data",
+    "first_name": "first_name",
+    "title": "title",
+    "chat_instance": "blank",
+}
+# Права участника (can_send_messages, can_restrict_members, ...) - флаги
+RECORDED_PREFIX = "can_"
+# Числа в callback_data от этого значения считаются ID пользователей и чатов
+MIN_CALLBACK_ID = 100_000
+
+
+# ~~~~ ANONYMIZATION ~~~~
+class Anonymizer:
+    """
+    Обезличивание обновления для записи.
+
+    ID пользователей и чатов заменяются ключевым хэшем (HMAC со случайным ключом
+    процесса): один и тот же ID в записи остаётся одним и тем же, но исходный по
+    записи не восстановить. Знак и вид ID сохраняются (супергруппы остаются -100...).
+    Записываются только поля из RECORDED_FIELDS: текст сообщений удаляется (у команд
+    остаётся только сама команда), у вложений, опросов и прочего содержимого остаются
+    лишь поля с обнулёнными значениями. ID бота не меняется, иначе бот не узнает себя
+    в списках админов.
+    """
+
+    def __init__(self, keep_ids: set[int]) -> None:
+        self.keep_ids = keep_ids
+        self._key = secrets.token_bytes(16)
+
+    def map_id(self, value: int) -> int:
+        if value in self.keep_ids:
+            return value
+        digest = int.from_bytes(hmac.new(self._key, str(value).encode(), hashlib.sha256).digest()[:8], "big")
+        if value <= -1000000000000:
+            return -1000000000000 - digest % 10 ** 12
+        if value < 0:
+            return -1 - digest % 10 ** 9
+        return 1 + digest % 10 ** 10
+
+    def text(self, value: str) -> str:
+        # Команда влияет на обработку (/start, /settings), остальной текст - нет
+        if value.startswith("/"):
+            return value.split(maxsplit=1)[0]
+        return ""
+
+    def callback_data(self, value: str) -> str:
+        # Небольшие числа в callback_data - значения настроек (таймаут капчи), не ID
+        parts = value.split(":")
+        return ":".join(
+            str(self.map_id(int(part))) if part.lstrip("-").isdigit() and abs(int(part)) >= MIN_CALLBACK_ID else part
+            for part in parts
+        )
+
+    def blank(self, key: str, value: object) -> object:
+        # Структура остаётся (модель aiogram собирается), содержимое - нет
+        if isinstance(value, dict):
+            return {item_key: self.blank(item_key, item) for item_key, item in value.items()}
+        if isinstance(value, list):
+            return [self.blank(key, item) for item in value[:1]]
+        if isinstance(value, bool) or key == "type":
+            return value
+        if isinstance(value, str):
+            return ""
+        if isinstance(value, (int, float)):
+            return 0
+        return None
+
+    def anonymize(self, data: object) -> object:
+        if isinstance(data, list):
+            return [self.anonymize(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+
+        result = {}
+        for key, value in data.items():
+            kind = RECORDED_FIELDS.get(key, "keep" if key.startswith(RECORDED_PREFIX) else None)
+            if kind is None:
+                continue
+            if kind == "keep":
+                result[key] = value
+            elif kind == "id":
+                # ID callback-запроса - строка, он не связан с пользователем
+                result[key] = self.map_id(value) if isinstance(value, int) else value
+            elif kind == "object":
+                result[key] = self.anonymize(value)
+            elif kind == "text" and isinstance(value, str):
+                result[key] = self.text(value)
+            elif kind == "data" and isinstance(value, str):
+                result[key] = self.callback_data(value)
+            elif kind == "first_name":
+                result[key] = "User"
+            elif kind == "title":
+                result[key] = "Chat"
+            elif kind == "blank":
+                result[key] = self.blank(key, value)
+        return result
+
+
+# ~~~~ UPDATE RECORDER ~~~~
+class UpdateRecorder:
+    """
+    Запись входящих обновлений для воспроизведения (tools/replay_updates.py).
+
+    Включается настройкой update_record_path. record() только добавляет обновление
+    в буфер; фоновая задача раз в flush_interval секунд в отдельном потоке
+    обезличивает пачку и дописывает её в gzip JSONL. Строка записи:
+        {"t": секунды от начала записи, "update": обновление}
+    Первая строка каждого запуска - {"bot_id": ID бота}.
+    """
+
+    def __init__(self, path: str | None, flush_interval: float = 5.0, buffer_limit: int = 10_000) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.buffer_limit = buffer_limit
+        self._buffer: list[tuple[float, Update]] = []
+        self._started_at = time.monotonic()
+        self._anonymizer: Anonymizer | None = None
+        self._recording = False
+
+    @property
+    def enabled(self) -> bool:
+        """Включена ли запись"""
+        return self.path is not None
+
+    # ~~~~ RECORD ~~~~
+    def record(self, update: Update, received_at: float) -> None:
+        """Добавить обновление в буфер (received_at - time.monotonic() прихода обновления)"""
+        if not self._recording:
+            return
+        if len(self._buffer) >= self.buffer_limit:
+            metrics.inc("updates_record_dropped_total")
+            return
+        self._buffer.append((received_at - self._started_at, update))
+
+    # ~~~~ FLUSH ~~~~
+    def _write(self, lines: list[str]) -> None:
+        # Каждая дозапись - отдельный gzip-member, gzip.open читает файл целиком
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    def _serialize(self, batch: list[tuple[float, Update]]) -> list[str]:
+        return [
+            json.dumps({
+                "t": round(offset, 3),
+                "update": self._anonymizer.anonymize(update.model_dump(mode="json", exclude_none=True, by_alias=True)),
+            }, ensure_ascii=False) + "\n"
+            for offset, update in batch
+        ]
+
+    async def flush(self) -> int:
+        """Дописать накопленные обновления в файл записи"""
+        if not self._buffer:
+            return 0
+
+        batch, self._buffer = self._buffer, []
+        try:
+            # Обезличивание и сжатие - в потоке, чтобы не блокировать event loop
+            await asyncio.to_thread(lambda: self._write(self._serialize(batch)))
+        except Exception as e:
+            logger.error(f"[Recorder] Failed to write {len(batch)} updates: error_type={type(e).__name__}, error={e}")
+            return 0
+        metrics.inc("updates_recorded_total", len(batch))
+        return len(batch)
+
+    async def run(self, stop_event: asyncio.Event) -> None:
+        """Фоновая дозапись (сервис супервизора)"""
+        while not stop_event.is_set():
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.shield(self.flush())
+
+    # ~~~~ LIFECYCLE ~~~~
+    async def start(self, bot_id: int) -> None:
+        """Начать запись (если она включена)"""
+        if not self.enabled or self._recording:
+            return
+        self._anonymizer = Anonymizer(keep_ids={bot_id})
+        self._started_at = time.monotonic()
+        await asyncio.to_thread(self._write, [json.dumps({"bot_id": bot_id}) + "\n"])
+        self._recording = True
+        logger.info(f"[Recorder] Recording updates to {self.path}")
+
+    async def stop(self) -> None:
+        """Остановить запись и дописать остаток буфера"""
+        if not self._recording:
+            return
+        self._recording = False
+        written = await self.flush()
+        logger.info(f"[Recorder] Stopped, flushed {written} updates")
+
+
+# Глобальный инстанс записи обновлений
+update_recorder = UpdateRecorder(path=settings.update_record_path)
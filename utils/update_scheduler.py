@@ -0,0 +1,175 @@
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable
+from config import settings
+from utils.metrics import metrics
+from logs.logger import logger
+
+
+# ~~~~ TYPES ~~~~
+Job = Callable[[], Awaitable[Any]]
+
+# Ключ очереди для обновлений без чата (inline, опросы и т.п.)
+NO_CHAT_ID = 0
+
+
+# ~~~~ UPDATE SCHEDULER ~~~~
+class UpdateScheduler:
+    """
+    Обработка обновлений с ограничением параллельности.
+
+    - не больше max_concurrency обработчиков одновременно;
+    - у каждого чата своя очередь, чаты обслуживаются по кругу (round-robin),
+      поэтому рейд в одном чате не задерживает остальные;
+    - приоритетная очередь (ответы на капчу) обслуживается первой;
+    - если очередь чата переполнена, новые обновления этого чата отбрасываются.
+    """
+
+    def __init__(self, max_concurrency: int, chat_queue_limit: int, priority_queue_limit: int) -> None:
+        self.max_concurrency = max_concurrency
+        self.chat_queue_limit = chat_queue_limit
+        self.priority_queue_limit = priority_queue_limit
+
+        self._priority: deque[Job] = deque()
+        self._chat_queues: dict[int, deque[Job]] = {}
+        self._round_robin: deque[int] = deque()
+        self._ready = asyncio.Semaphore(0)
+        self._workers: list[asyncio.Task] = []
+
+        self._active = 0
+        self._processed = 0
+        self._shed = 0
+        self._failed = 0
+
+        metrics.register_collector(self.collect_metrics)
+
+    # ~~~~ SUBMIT ~~~~
+    def submit(self, chat_id: int, job: Job, priority: bool = False) -> bool:
+        """
+        Поставить обработку обновления в очередь.
+
+        Параметры:
+            chat_id (int): ID чата обновления (NO_CHAT_ID - без чата)
+            job (Job): фабрика корутины обработки
+            priority (bool): поставить в приоритетную очередь
+
+        Возвращает:
+            bool: False если обновление отброшено из-за переполнения очереди
+        """
+        if priority:
+            if len(self._priority) >= self.priority_queue_limit:
+                self._on_shed(chat_id)
+                return False
+            self._priority.append(job)
+        else:
+            queue = self._chat_queues.get(chat_id)
+            if queue is None:
+                queue = deque()
+                self._chat_queues[chat_id] = queue
+                self._round_robin.append(chat_id)
+            elif len(queue) >= self.chat_queue_limit:
+                self._on_shed(chat_id)
+                return False
+            queue.append(job)
+
+        self._ready.release()
+        return True
+
+    def _on_shed(self, chat_id: int) -> None:
+        self._shed += 1
+        # Логируем не каждое отброшенное обновление, чтобы не заспамить лог во время рейда
+        if self._shed % 100 == 1:
+            logger.warning(f"[Scheduler] Shedding updates: chat_id={chat_id}, shed_total={self._shed}")
+
+    def _pop_job(self) -> Job:
+        if self._priority:
+            return self._priority.popleft()
+
+        chat_id = self._round_robin.popleft()
+        queue = self._chat_queues[chat_id]
+        job = queue.popleft()
+        if queue:
+            self._round_robin.append(chat_id)
+        else:
+            del self._chat_queues[chat_id]
+        return job
+
+    # ~~~~ WORKERS ~~~~
+    async def _worker(self) -> None:
+        while True:
+            await self._ready.acquire()
+            job = self._pop_job()
+            self._active += 1
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failed += 1
+                logger.error(f"[Scheduler] Error processing update: error_type={type(e).__name__}, error={e}")
+            finally:
+                self._active -= 1
+                self._processed += 1
+
+    def start(self) -> None:
+        """Запустить воркеры"""
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"update-worker-{index}")
+            for index in range(self.max_concurrency)
+        ]
+        logger.info(f"[Scheduler] Started {self.max_concurrency} update workers")
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Дождаться обработки очереди (не дольше timeout) и остановить воркеры"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self.queued or self._active) and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+
+        if self.queued or self._active:
+            logger.warning(f"[Scheduler] Stopping with {self.queued} queued and {self._active} active updates")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # ~~~~ METRICS ~~~~
+    @property
+    def queued(self) -> int:
+        """Количество обновлений в очередях"""
+        return len(self._priority) + sum(len(queue) for queue in self._chat_queues.values())
+
+    @property
+    def active(self) -> int:
+        """Количество обновлений в обработке"""
+        return self._active
+
+    @property
+    def shed(self) -> int:
+        """Количество отброшенных обновлений"""
+        return self._shed
+
+    def collect_metrics(self) -> list[tuple[str, dict[str, str], float]]:
+        """Метрики планировщика для реестра метрик"""
+        return [
+            ("scheduler_max_concurrency", {}, self.max_concurrency),
+            ("scheduler_chat_queue_limit", {}, self.chat_queue_limit),
+            ("scheduler_active", {}, self._active),
+            ("scheduler_queued", {"queue": "priority"}, len(self._priority)),
+            ("scheduler_queued", {"queue": "chats"}, self.queued - len(self._priority)),
+            ("scheduler_pending_chats", {}, len(self._chat_queues)),
+            ("scheduler_processed_total", {}, self._processed),
+            ("scheduler_failed_total", {}, self._failed),
+            ("scheduler_shed_total", {}, self._shed),
+        ]
+
+
+# Глобальный инстанс планировщика обновлений
+update_scheduler = UpdateScheduler(
+    max_concurrency=settings.update_max_concurrency,
+    chat_queue_limit=settings.update_chat_queue_limit,
+    priority_queue_limit=settings.update_priority_queue_limit,
+)